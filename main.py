@@ -69,11 +69,19 @@ async def m():
                                                files=["hero-accident-exceeds-limits.png"],
                                                max_steps=10))
         print(f"---------------Session id: {sid}")
+        streamed = False
         async for msg in m.stream(sid):
             mm:UserResponse = msg
+            if mm.type == "FinalOutputDelta":
+                streamed = True
+                print(mm.message, end="", flush=True)
+                continue
+            if streamed:
+                print()
             print(Fore.GREEN + f"===================================" + Style.RESET_ALL)
             print(Fore.GREEN + f"Type: {mm.type}" + Style.RESET_ALL)
-            print(Fore.GREEN + f"Message: {mm.message}" + Style.RESET_ALL)
+            if not (mm.type == "FinalOutput" and streamed):
+                print(Fore.GREEN + f"Message: {mm.message}" + Style.RESET_ALL)
             print(Fore.BLUE + f"Tool_used: {mm.tool_used}" + Style.RESET_ALL)
             print(Fore.RED + f"Tool command: {mm.command}" + Style.RESET_ALL)
             print(Fore.RED + f"Current Step#: {mm.step_no}" + Style.RESET_ALL)
@@ -1,28 +1,33 @@
+from contextlib import aclosing
+from contextvars import ContextVar
 from dataclasses import dataclass
 from datetime import datetime
 import logging
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, create_model
 import asyncio
-from PIL import Image
-import os
 from dotenv import load_dotenv
 import asyncio
-from openai import AsyncOpenAI
-from typing import Any, TYPE_CHECKING, Dict
+from typing import Annotated, Any, Literal, TYPE_CHECKING, Dict, Optional, Union
 from autogen_core import (
     AgentId,
+    CancellationToken,
     MessageContext,
     BaseAgent)
 
 import json
 
-from .tools import ToolCard, Tool
+from .tools import ToolCard, Tool, ToolRegistry
+from .llm import LLMClientPool
+from .history import ActionHistory, ActionStep, estimate_tokens
+from .budget import BudgetExhausted, RequestBudget
+from .prompts import build_messages, toolbox_prefix
 
 
 
 
 
-from .utils import only_direct, image_to_base64_inline
+from .utils import only_direct, run_cancellable, image_to_base64_inline, get_image_info
+from .tracing import traced_handler
 
 llm_logger = logging.getLogger("otools_autogen_llm")
 logger = logging.getLogger("otools_autogen")
@@ -39,7 +44,7 @@ class QueryAnalyzerRequest():
     images: list[str]
     image_infos: list[Dict[str, Any]]
     all_tools_names: list[str]
-    all_tools_medatada: list[str]
+    all_tools_medatada: str
 
 
 @dataclass
@@ -50,8 +55,9 @@ class ActionPredictorRequest():
     step_count: int
     max_step_count: int
     aviailable_tools: list[str]
-    aviailable_tools_metadata: list[str]
-    actions_history: list[str]
+    aviailable_tools_metadata: str
+    actions_history: str
+    max_actions: int = 1
     
 
 
@@ -68,14 +74,45 @@ class CommandGeneratorRequest():
     context: str
 
 
+@dataclass
+class FusedPlannerRequest():
+    initial_query: str
+    image_paths: list[str]
+    query_analysis: str
+    step_count: int
+    max_step_count: int
+    available_tools: list[str]
+    available_tools_metadata: str
+    actions_history: str
+    max_actions: int = 1
+
+
+class StepPlan(BaseModel):
+    """
+    The plan of a single tool invocation: the selected tool, its sub-goal and context, and the JSON
+    argument it is invoked with, produced either by the ActionPredictor and CommandGenerator or by
+    the FusedPlanner.
+    """
+    tool_name: str
+    sub_goal: str
+    context: str
+    argument: str
+
+
+class StepPlanBatch(BaseModel):
+    """
+    The plans of the tool invocations of a step, as returned by the FusedPlanner.
+    """
+    plans: list[StepPlan]
+
     
 
 @dataclass
 class ContextVerifierRequest():
     question: str
-    image_info: str
+    image_info: list[Dict[str, Any]]
     available_tools: list[str]
-    toolbox_metadata: list[str]
+    toolbox_metadata: str
     query_analysis: str
     memory: str
     image_paths: list[str]
@@ -83,10 +120,11 @@ class ContextVerifierRequest():
 @dataclass
 class FinalOutputRequest():
     question: str
-    image_info: list[str]
+    image_info: list[Dict[str, Any]]
     memory: str
     image_paths: list[str]
     query_analysis: str
+    step_no: int = 0
 
     
     
@@ -117,35 +155,59 @@ class ToolCommandLLMResponse(BaseModel):
     explanation: str
     argument: str
 
+
+_tool_argument = TypeAdapter(dict[str, Any])
+
+
+def validate_tool_command(completion):
+    """
+    Checks that the argument of a CommandGenerator completion is a JSON object, as the tool call
+    expects, so a route of the CommandGenerator can escalate invalid arguments to a stronger model.
+
+    Raises:
+        ValidationError: If the argument is not valid JSON or not a JSON object.
+    """
+    _tool_argument.validate_json(completion.choices[0].message.parsed.argument)
+
 class ActionPredictonLLMResponse(BaseModel):
     justification: str
     context: str
     sub_goal: str
     tool_name: str    
+
+class PredictedAction(BaseModel):
+    context: str
+    sub_goal: str
+    tool_name: str
+
+class ActionBatchLLMResponse(BaseModel):
+    justification: str
+    actions: list[PredictedAction]
     
 class ContextVerifierLLMResponse(BaseModel):
     analysis: str
     stop_signal: bool
 
-def get_image_info(image_path: str) -> Dict[str, Any]:
-        image_info = {}
-        if image_path and os.path.isfile(image_path):
-            image_info["image_path"] = image_path
-            try:
-                with Image.open(image_path) as img:
-                    width, height = img.size
-                image_info.update({
-                    "width": width,
-                    "height": height
-                })
-            except Exception as e:
-                print(f"Error processing image file: {str(e)}")
-        return image_info
-
-
 
     
     
+_request_cancellation: ContextVar[Optional[CancellationToken]] = ContextVar(
+    "otools_autogen_request_cancellation", default=None)
+_request_budget: ContextVar[Optional[RequestBudget]] = ContextVar(
+    "otools_autogen_request_budget", default=None)
+
+
+def batch_instructions(max_actions: int) -> str:
+    """
+    Renders the prompt block allowing a planner to return several independent tool invocations.
+    """
+    return f"""
+Batch Mode:
+You may select up to {max_actions} tool invocations for this step if they are independent of each other, i.e. none of them needs the result of another one. They are executed in parallel and their results are reported together in the next step.
+Return every invocation as a separate action with its own context, sub-goal and tool name. If the next action depends on a result that is not available yet, return a single action.
+"""
+
+
 class Orchestrator(BaseAgent):
     """
     Orchestrator class that extends the BaseAgent to handle complex workflows involving multiple tools and agents.
@@ -173,7 +235,7 @@ class Orchestrator(BaseAgent):
                 Exception: If any error occurs during tool execution or message handling.
     """
     def __init__(self, manager:"Manager"):
-        super(self.__class__, self).__init__("OrchestratorAgent")
+        super().__init__("OrchestratorAgent")
         logger.debug(f"Orchestrator initialized. {str(self)} {self.id}")
         
         self._manager = manager
@@ -194,146 +256,479 @@ class Orchestrator(BaseAgent):
             1. Initializes session and retrieves the client queue.
             2. Analyzes the user query and associated images using the QueryAnalyzer agent.
             3. Iteratively predicts actions using the ActionPredictor agent and generates 
-               commands for tools using the CommandGenerator agent.
+               commands for tools using the CommandGenerator agent, or plans both in one
+               call with the FusedPlanner agent when the runtime uses fused planning.
             4. Executes the selected tool and updates the action history.
-            5. Verifies the context after each step using the ContextVerifier agent.
+            5. Verifies the context after each step using the ContextVerifier agent. With speculative
+               planning, the next step is planned at the same time and discarded if the verifier stops.
             6. Stops the process if a stop signal is received or the maximum steps are reached.
             7. Generates the final output using the FinalOutputAgent and sends it to the client.
         Notes:
+            - Processing is bounded by the runtime's `session_timeout`; when it expires the
+              client receives a final `SessionTimeout` response and the calls of the request
+              to agents and tools still in flight are cancelled.
+            - Every stage, agent call and tool run is recorded as a span of the session in the
+              runtime's tracer.
+            - The token usage and cost of the request, by step and agent, are attached to the
+              final response.
+            - When a budget of the request is used up, or would be by the next step, the client
+              receives a `BudgetExceeded` response and the final output is generated from the
+              steps taken so far, without verifying the context. Within a step, no agent or tool
+              call is started once a budget is used up, and calls still running when the seconds
+              budget runs out are cancelled. The final output is always generated.
+            - A request of a session closed before the request was picked up is dropped.
             - Handles errors during tool execution and logs them in the action history.
+            - The action history is rendered within the runtime's token budget; older step
+              results are compacted once the budget is exceeded.
             - Sends intermediate and final responses to the client queue.
         """
         if message=="bootstrap": return
-        from .runtime import UserResponse
+        from .runtime import Runtime, UserResponse
         session_id = None
         if not ctx.topic_id is None:
             session_id = ctx.topic_id.source
-        to_client_queue = self._manager.get_session(ctx.topic_id.source).to_client_queue
+        try:
+            session = self._manager.get_session(session_id)
+        except KeyError:
+            logger.warning(f"Orchestrator {self.id} dropped a request of closed session {session_id}")
+            self._manager.metrics.inc("requests_dropped", reason="session_closed")
+            return
+        session.pending_requests = max(0, session.pending_requests - 1)
+        session.state = Runtime.SessionState.PROCESSING
+        session.touch()
+        self._manager.usage.start_request(session_id)
+        request_cancellation = CancellationToken()
+        token = _request_cancellation.set(request_cancellation)
+        budget_token = _request_budget.set(RequestBudget.from_request(message))
+        try:
+            with self._manager.tracer.session(session_id, max_steps=message.max_steps, orchestrator=self._manager.orchestrator):
+                await asyncio.wait_for(self._process(message, session, session_id), timeout=self._manager.session_timeout)
+        except asyncio.CancelledError:
+            request_cancellation.cancel()
+            raise
+        except asyncio.TimeoutError:
+            request_cancellation.cancel()
+            logger.warning(f"Orchestrator {self.id} session {session_id} exceeded {self._manager.session_timeout} seconds")
+            self._manager.metrics.inc("sessions_timed_out")
+            await session.to_client_queue.put(UserResponse(
+                type="SessionTimeout",
+                session_id=session_id,
+                message=f"Session did not finish within {self._manager.session_timeout} seconds.",
+                tool_used=None,
+                final=True,
+                conclusion=False,
+                step_no=0,
+                usage=self._manager.usage.request_usage(session_id)))
+        finally:
+            _request_budget.reset(budget_token)
+            _request_cancellation.reset(token)
+            session.state = Runtime.SessionState.WAITING
+            session.touch()
+
+    @staticmethod
+    def _current_budget() -> RequestBudget:
+        """
+        Returns the budget of the user request being processed.
+        """
+        return _request_budget.get() or RequestBudget()
+
+    async def send_message(self, message: Any, recipient: AgentId, *, budgeted: bool = True, **kwargs: Any) -> Any:
+        """
+        Sends a message to an agent or tool within a `send.<agent type>` span of the session.
+
+        Calls are cancelled with the user request they are made for: they use the request's
+        cancellation token, or, when given their own token, e.g. for a tool timeout or a
+        speculative plan, that token is cancelled with the request's.
+
+        Budgeted calls are not started once a budget of the request is used up, and are
+        cancelled when its seconds budget runs out while they are in flight.
+
+        Raises:
+            BudgetExhausted: If a budget of the request is used up before or during the call.
+        """
+        budget = _request_budget.get() if budgeted else None
+        remaining_seconds = None
+        if budget is not None and budget.enabled:
+            budget.check(self._manager.usage.request_total(recipient.key))
+            remaining_seconds = budget.remaining_seconds
+            if remaining_seconds is not None and kwargs.get("cancellation_token") is None:
+                kwargs["cancellation_token"] = CancellationToken()
+        request_cancellation = _request_cancellation.get()
+        if request_cancellation is not None:
+            cancellation_token = kwargs.get("cancellation_token")
+            if cancellation_token is None:
+                kwargs["cancellation_token"] = request_cancellation
+            else:
+                request_cancellation.add_callback(cancellation_token.cancel)
+        with self._manager.tracer.span(f"send.{recipient.type}", session_id=recipient.key):
+            if remaining_seconds is None:
+                return await super().send_message(message, recipient, **kwargs)
+            try:
+                async with asyncio.timeout(remaining_seconds) as deadline:
+                    return await super().send_message(message, recipient, **kwargs)
+            except TimeoutError:
+                if not deadline.expired():
+                    raise
+                kwargs["cancellation_token"].cancel()
+                raise BudgetExhausted(
+                    "seconds", f"The seconds budget of {budget.max_seconds} ran out during a call to {recipient.type}.")
+
+    async def _process(self, message:"UserRequest", session, session_id: str)->None:
+        """
+        Runs the workflow for a single user request while the session is marked as processing.
+        """
+        to_client_queue = session.to_client_queue
 
         logger.debug(f"Orchestrator {self.id} received message: {message} with topic id: {session_id}")
         image_infos = [get_image_info(image_path) for image_path in message.files]
-        all_tools = self._manager.get_tool_cards()
-        all_tools_names = list(all_tools.keys())
-        all_tools_metadata = [tool.get_metadata() for tool in all_tools.values()]
-        qar = QueryAnalyzerRequest(
-            user_query=message.message, 
-            images=message.files, 
-            image_infos=image_infos,
-            all_tools_names=all_tools_names, 
-            all_tools_medatada=all_tools_metadata
-            )
-        query_analysis:QueryAnalysisLLMResponse = await self.send_message(qar, AgentId(type="QueryAnalyzer", key=session_id))
-
+        tool_registry = self._manager.get_tool_registry()
+        budget = self._current_budget()
+        query_analysis = None
         step_no = 0
-        actions_history = {}
+        actions_history = self._new_history()
         conclusion = False
-        while step_no < message.max_steps:
-            step_no += 1
-            action_predictor_request = ActionPredictorRequest(
-                initial_query=message.message,
+        speculation: Optional[tuple[asyncio.Task, CancellationToken, int]] = None
+        try:
+            query_analysis = await self._analyze_query(message, session_id, image_infos, tool_registry)
+            while step_no < message.max_steps:
+                if await self._budget_reached(budget, session_id, to_client_queue, step_no):
+                    break
+                step_no += 1
+                self._manager.usage.begin_step(session_id, step_no)
+                if speculation is not None:
+                    plans = await speculation[0]
+                    speculation = None
+                else:
+                    plans = await self._plan_step(
+                        message, session_id, tool_registry, query_analysis, step_no, actions_history.render())
+                if len(plans) == 1:
+                    call, succeeded = await self._execute_plan(plans[0], session_id, to_client_queue, tool_registry, step_no)
+                    actions_history.add_step(
+                        step_no=step_no,
+                        tool_name=call.tool_name,
+                        sub_goal=call.sub_goal,
+                        argument=call.argument,
+                        result=call.result
+                    )
+                else:
+                    semaphore = asyncio.Semaphore(self._manager.parallel_tool_concurrency)
+
+                    async def execute(plan: StepPlan):
+                        async with semaphore:
+                            return await self._execute_plan(plan, session_id, to_client_queue, tool_registry, step_no)
+
+                    outcomes = await asyncio.gather(*(execute(plan) for plan in plans), return_exceptions=True)
+                    calls = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+                    if calls:
+                        actions_history.add_batch(step_no, [call for call, _ in calls])
+                    for outcome in outcomes:
+                        if isinstance(outcome, BaseException):
+                            raise outcome
+                    succeeded = any(ok for _, ok in calls)
+                if not succeeded:
+                    continue
+                if await self._budget_reached(budget, session_id, to_client_queue, step_no):
+                    break
+
+                if self._manager.speculative_planning and step_no < message.max_steps:
+                    speculation = self._speculate_plan(
+                        message, session_id, tool_registry, query_analysis, step_no + 1, actions_history.render())
+                if await self._verify_context(message, session_id, image_infos, tool_registry, query_analysis, actions_history):
+                    conclusion = True
+                    break
+                if speculation is not None:
+                    self._manager.metrics.inc("speculation_hits")
+        except BudgetExhausted as exhausted:
+            await self._report_budget_exceeded(session_id, to_client_queue, step_no, exhausted.limit, str(exhausted))
+        finally:
+            if speculation is not None:
+                self._discard_speculation(speculation)
+        await self._send_final_output(
+            message, session_id, to_client_queue, image_infos, query_analysis, actions_history, step_no, conclusion)
+
+    async def _budget_reached(self, budget: RequestBudget, session_id: str, to_client_queue, step_no: int)->bool:
+        """
+        Checks the budget of the request against its usage so far. When a limit is reached, a
+        `BudgetExceeded` response is sent to the client.
+
+        Returns:
+            bool: True if the request should stop taking steps and generate its final output.
+        """
+        if not budget.enabled:
+            return False
+        reached = budget.limit_reached(self._manager.usage.request_total(session_id), step_no)
+        if reached is None:
+            return False
+        await self._report_budget_exceeded(session_id, to_client_queue, step_no, *reached)
+        return True
+
+    async def _report_budget_exceeded(self, session_id: str, to_client_queue, step_no: int, limit: str, description: str):
+        """
+        Sends a `BudgetExceeded` response to the client.
+        """
+        from .runtime import UserResponse
+        logger.debug(f"Orchestrator {self.id} session {session_id}: {description}")
+        self._manager.metrics.inc("budget_exceeded", limit=limit)
+        await to_client_queue.put(UserResponse(
+            type="BudgetExceeded",
+            session_id=session_id,
+            message=description,
+            tool_used=None,
+            final=False,
+            conclusion=False,
+            step_no=step_no,
+            usage=self._manager.usage.request_usage(session_id)))
+
+    def _new_history(self)->ActionHistory:
+        return ActionHistory(
+            token_budget=self._manager.history_token_budget,
+            keep_recent=self._manager.history_keep_recent)
+
+    async def _analyze_query(self, message:"UserRequest", session_id: str, image_infos: list[Dict[str, Any]],
+                             tool_registry: ToolRegistry)->QueryAnalysisLLMResponse:
+        """
+        Analyzes the user query and its images with the QueryAnalyzer agent.
+        """
+        with self._manager.tracer.span("stage.query_analysis", session_id=session_id):
+            qar = QueryAnalyzerRequest(
+                user_query=message.message, 
+                images=message.files, 
+                image_infos=image_infos,
+                all_tools_names=list(tool_registry.names), 
+                all_tools_medatada=tool_registry.prompt
+                )
+            return await self.send_message(qar, AgentId(type="QueryAnalyzer", key=session_id))
+
+    async def _verify_context(self, message:"UserRequest", session_id: str, image_infos: list[Dict[str, Any]],
+                              tool_registry: ToolRegistry, query_analysis: QueryAnalysisLLMResponse,
+                              actions_history: ActionHistory)->bool:
+        """
+        Asks the ContextVerifier agent whether the actions taken so far are enough to answer the query.
+
+        Returns:
+            bool: True if the workflow should stop.
+        """
+        with self._manager.tracer.span("stage.context_verification", session_id=session_id, step_no=len(actions_history)):
+            cvr = ContextVerifierRequest(
                 image_paths=message.files,
-                query_analysis=query_analysis,
-                step_count=step_no,
-                max_step_count=message.max_steps,
-                aviailable_tools=list(self._manager.get_tool_cards().keys()),
-                aviailable_tools_metadata=[tool.get_metadata() for tool in self._manager.get_tool_cards().values()],
-                actions_history=actions_history
+                question=message.message,
+                image_info=image_infos,
+                available_tools=list(tool_registry.names),
+                toolbox_metadata=tool_registry.prompt,
+                query_analysis=str(query_analysis),
+                memory=actions_history.render()
             )
-            action_predictor_response:ActionPredictonLLMResponse = await self.send_message(action_predictor_request, AgentId(type="ActionPredictor", key=session_id))
-            selected_tool_card:ToolCard = self._manager.get_tool_cards()[action_predictor_response.tool_name]
-            selected_tool_id = selected_tool_card.tool_id
-            selected_tool_metadata = selected_tool_card.get_metadata()
-            cgr = CommandGeneratorRequest(
-                initial_query=message.message,
-                query_analysis=query_analysis,
-                context=action_predictor_response.context,
-                sub_goal=action_predictor_response.sub_goal,
-                tool_name=action_predictor_response.tool_name,
-                tool_metadata=selected_tool_metadata,
-                image_paths=message.files
+            context_verifier_result = await self.send_message(cvr, AgentId(type="ContextVerifier", key=session_id))
+            return context_verifier_result.stop_signal
+
+    async def _send_final_output(self, message:"UserRequest", session_id: str, to_client_queue,
+                                 image_infos: list[Dict[str, Any]], query_analysis: QueryAnalysisLLMResponse,
+                                 actions_history: ActionHistory, step_no: int, conclusion: bool):
+        """
+        Generates the final answer with the FinalOutputAgent and sends it to the client. The
+        answer is generated even when a budget of the request is used up.
+        """
+        from .runtime import UserResponse
+        with self._manager.tracer.span("stage.final_output", session_id=session_id, step_no=step_no):
+            final_output_request = FinalOutputRequest(
+                question=message.message,
+                image_info=image_infos,
+                memory=actions_history.render(),
+                image_paths=message.files,
+                query_analysis=str(query_analysis or ""),
+                step_no=step_no
             )
-            command_response:ToolCommandLLMResponse = await self.send_message(cgr, AgentId(type="CommandGenerator", key=session_id))
+            logger.debug(f"Orchestrator {self.id} action history compaction saved ~{actions_history.tokens_saved} prompt tokens")
+            final_output = await self.send_message(final_output_request, AgentId(type="FinalOutputAgent", key=session_id), budgeted=False)
+            await to_client_queue.put(UserResponse(
+                type="FinalOutput",
+                session_id=session_id, 
+                message=final_output, 
+                tool_used=None, 
+                final=True,
+                conclusion=conclusion,
+                step_no=step_no,
+                usage=self._manager.usage.request_usage(session_id)))
+
+    async def _execute_plan(self, plan: StepPlan, session_id: str, to_client_queue, tool_registry: ToolRegistry,
+                            step_no: int)->tuple[ActionStep, bool]:
+        """
+        Invokes the tool selected by a plan and reports the call to the client.
+
+        The call is bounded by the runtime's tool call timeout, if any, and cancelled when it
+        expires. Errors, including invalid arguments and timeouts, are reported to the client
+        and recorded as the result of the call.
+
+        Returns:
+            tuple[ActionStep, bool]: The call with its result, and whether it succeeded.
+        """
+        from .runtime import UserResponse
+        with self._manager.tracer.span("stage.tool_call", session_id=session_id, step_no=step_no, tool_id=plan.tool_name) as span:
+            selected_compiled_card = tool_registry.cards[plan.tool_name]
+            selected_tool_card:ToolCard = selected_compiled_card.card
+            selected_tool_id = selected_tool_card.tool_id
             try:
-                parsed_arg = json.loads(command_response.argument)
-                to_client_queue.put_nowait(UserResponse(
+                parsed_arg = json.loads(plan.argument)
+                await to_client_queue.put(UserResponse(
                     type="ToolRequest",
                     session_id=session_id, 
-                    message=action_predictor_response.sub_goal, 
-                    command=command_response.argument,
+                    message=plan.sub_goal, 
+                    command=plan.argument,
                     tool_used=selected_tool_id, 
                     final=False,
                     conclusion=False,
                     step_no=step_no
                     ))
                 invocation_arg = selected_tool_card.inputs.model_validate(parsed_arg)
-                tool_result = await self.send_message(invocation_arg, AgentId(type=selected_tool_id, key=session_id))
-                to_client_queue.put_nowait(UserResponse(
+                cancellation_token = CancellationToken()
+                try:
+                    tool_result = await asyncio.wait_for(
+                        self.send_message(invocation_arg, AgentId(type=selected_tool_id, key=session_id),
+                                          cancellation_token=cancellation_token),
+                        timeout=self._manager.tool_call_timeout)
+                except asyncio.TimeoutError:
+                    cancellation_token.cancel()
+                    self._manager.metrics.inc("tool_call_timeouts", tool=selected_tool_id)
+                    raise TimeoutError(f"Tool {selected_tool_id} did not respond within {self._manager.tool_call_timeout} seconds.")
+                await to_client_queue.put(UserResponse(
                     type="ToolResponse",
                     session_id=session_id, 
-                    message=action_predictor_response.sub_goal, 
-                    command=command_response.argument,
+                    message=plan.sub_goal, 
+                    command=plan.argument,
                     tool_used=selected_tool_id, 
                     final=False,
                     conclusion=False,
                     step_no=step_no
                     ))
-                actions_history[f"Step {step_no}"] = {
-                    "tool_name": action_predictor_response.tool_name,
-                    "sub_goal": action_predictor_response.sub_goal,
-                    "argument": command_response.argument,
-                    "result": tool_result
-                }
+                return ActionStep(step_no, plan.tool_name, plan.sub_goal, plan.argument, tool_result), True
+            except BudgetExhausted:
+                raise
             except Exception as e:
-                actions_history[f"Step {step_no}"] = {
-                    "tool_name": action_predictor_response.tool_name,
-                    "sub_goal": action_predictor_response.sub_goal,
-                    "argument": command_response.argument,
-                    "result": f"Error executing tool: {str(e)}"
-                }
-                to_client_queue.put_nowait(UserResponse(
+                span.error = f"{type(e).__name__}: {e}"
+                await to_client_queue.put(UserResponse(
                     type="Error",
                     session_id=session_id, 
                     message=f"Error executing tool: {str(e)}", 
                     tool_used=selected_tool_id, 
-                    command=command_response.argument,
+                    command=plan.argument,
                     final=False,
                     conclusion=False,
                     step_no=step_no))
-                continue
-                
-            
-            cvr = ContextVerifierRequest(
+                return ActionStep(step_no, plan.tool_name, plan.sub_goal, plan.argument, f"Error executing tool: {str(e)}"), False
+
+    def _speculate_plan(self, message:"UserRequest", session_id: str, tool_registry: ToolRegistry,
+                        query_analysis: QueryAnalysisLLMResponse, step_no: int,
+                        actions_history: str)->tuple[asyncio.Task, CancellationToken, int]:
+        """
+        Starts planning the next step while the ContextVerifier is still deciding whether to stop.
+
+        The next step is planned from the same action history it would see after a "continue"
+        verdict, so a committed speculative plan is identical to a sequentially computed one.
+
+        Returns:
+            tuple[asyncio.Task, CancellationToken, int]: The planning task, the token cancelling
+                its agent calls, and the estimated prompt tokens of the speculative planning call.
+        """
+        cancellation_token = CancellationToken()
+        task = asyncio.create_task(self._plan_step(
+            message, session_id, tool_registry, query_analysis, step_no, actions_history,
+            cancellation_token=cancellation_token))
+        estimated_tokens = estimate_tokens(
+            tool_registry.prompt + actions_history + message.message + str(query_analysis))
+        return task, cancellation_token, estimated_tokens
+
+    def _discard_speculation(self, speculation: tuple[asyncio.Task, CancellationToken, int]):
+        """
+        Cancels a speculative plan that is not needed and records the estimated wasted tokens.
+        """
+        task, cancellation_token, estimated_tokens = speculation
+        cancellation_token.cancel()
+        task.cancel()
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._manager.metrics.inc("speculation_misses")
+        self._manager.metrics.inc("speculation_wasted_tokens", estimated_tokens)
+
+    async def _plan_step(self, message:"UserRequest", session_id: str, tool_registry: ToolRegistry,
+                         query_analysis: QueryAnalysisLLMResponse, step_no: int, actions_history: str,
+                         cancellation_token: Optional[CancellationToken] = None)->list[StepPlan]:
+        """
+        Plans a step with the runtime's planning mode.
+
+        In the "fused" mode the FusedPlanner selects the tool and generates its argument in one
+        completion. If it fails, for example because the provider rejects the generated response
+        schema, the step falls back to the two-stage mode, in which the ActionPredictor selects the
+        tool and the CommandGenerator generates its argument. When the runtime allows parallel
+        tool calls, the planners may return up to `max_parallel_tools` independent invocations,
+        whose arguments the CommandGenerator generates concurrently.
+
+        Args:
+            cancellation_token (CancellationToken, optional): Cancels the planning agents' calls.
+
+        Returns:
+            list[StepPlan]: The plans of the tool invocations of the step.
+        """
+        with self._manager.tracer.span("stage.planning", session_id=session_id, step_no=step_no, mode=self._manager.planning):
+            max_actions = self._manager.max_parallel_tools
+            if self._manager.planning == "fused":
+                fused_planner_request = FusedPlannerRequest(
+                    initial_query=message.message,
+                    image_paths=message.files,
+                    query_analysis=str(query_analysis),
+                    step_count=step_no,
+                    max_step_count=message.max_steps,
+                    available_tools=list(tool_registry.names),
+                    available_tools_metadata=tool_registry.prompt,
+                    actions_history=actions_history,
+                    max_actions=max_actions
+                )
+                try:
+                    batch:StepPlanBatch = await self.send_message(fused_planner_request, AgentId(type="FusedPlanner", key=session_id), cancellation_token=cancellation_token)
+                    if batch.plans:
+                        return batch.plans
+                    raise ValueError("FusedPlanner returned no actions.")
+                except BudgetExhausted:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Orchestrator {self.id} fused planning failed, falling back to two-stage planning: {e}")
+                    self._manager.metrics.inc("planner_fallbacks")
+            action_predictor_request = ActionPredictorRequest(
+                initial_query=message.message,
                 image_paths=message.files,
-                question=message.message,
-                image_info=image_infos,
-                available_tools=all_tools_names,
-                toolbox_metadata=all_tools_metadata,
-                query_analysis=query_analysis,
-                memory=actions_history
+                query_analysis=str(query_analysis),
+                step_count=step_no,
+                max_step_count=message.max_steps,
+                aviailable_tools=list(tool_registry.names),
+                aviailable_tools_metadata=tool_registry.prompt,
+                actions_history=actions_history,
+                max_actions=max_actions
             )
-            context_verifier_result = await self.send_message(cvr, AgentId(type="ContextVerifier", key=session_id))
-            if context_verifier_result.stop_signal:
-                conclusion = True
-                break
-        final_output_request = FinalOutputRequest(
-            question=message.message,
-            image_info=image_infos,
-            memory=actions_history,
-            image_paths=message.files,
-            query_analysis=query_analysis
-        )
-        final_output = await self.send_message(final_output_request, AgentId(type="FinalOutputAgent", key=session_id)) 
-        to_client_queue.put_nowait(UserResponse(
-            type="FinalOutput",
-            session_id=session_id, 
-            message=final_output, 
-            tool_used=None, 
-            final=True,
-            conclusion=conclusion,
-            step_no=step_no))         
-
-            
-            
+            action_predictor_response = await self.send_message(action_predictor_request, AgentId(type="ActionPredictor", key=session_id), cancellation_token=cancellation_token)
+            if isinstance(action_predictor_response, ActionBatchLLMResponse):
+                actions = action_predictor_response.actions[:max_actions]
+            else:
+                actions = [action_predictor_response]
+
+            async def generate_command(action)->StepPlan:
+                cgr = CommandGeneratorRequest(
+                    initial_query=message.message,
+                    query_analysis=str(query_analysis),
+                    context=action.context,
+                    sub_goal=action.sub_goal,
+                    tool_name=action.tool_name,
+                    tool_metadata=tool_registry.cards[action.tool_name].prompt,
+                    image_paths=message.files
+                )
+                command_response:ToolCommandLLMResponse = await self.send_message(cgr, AgentId(type="CommandGenerator", key=session_id), cancellation_token=cancellation_token)
+                return StepPlan(
+                    tool_name=action.tool_name,
+                    sub_goal=action.sub_goal,
+                    context=action.context,
+                    argument=command_response.argument)
+
+            return list(await asyncio.gather(*(generate_command(action) for action in actions)))
+
+
+
 class QueryAnalyzer(BaseAgent):
     """QueryAnalyzer is a specialized agent designed to analyze user queries and accompanying inputs, 
     determine the necessary skills and tools required to address the query, and provide a structured 
@@ -358,32 +753,32 @@ class QueryAnalyzer(BaseAgent):
             Returns:
                 QueryAnalysisLLMResponse: A structured response generated by the LLM containing the analysis 
                                           of the query, required skills, relevant tools, and additional considerations."""
-    def __init__(self):
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool):
         super().__init__("QueryAnalyzer")
+        self._llm = llm
         logger.debug(f"QueryAnalyzer initialized. {str(self)} {self.id}")
         
     @only_direct
+    @traced_handler
     async def on_message_impl(self, message:QueryAnalyzerRequest, ctx: MessageContext)->None:
         logger.debug(f"QueryAnalyzer {self.id} received message: {message}")
-        return await self.analyze(message)
+        return await run_cancellable(self.analyze(message), ctx)
     
     async def analyze(self, message:QueryAnalyzerRequest)->QueryAnalysisLLMResponse:
         question = message.user_query
         image_infos_str = "\n".join([f"Image: {info['image_path']}, Width: {info['width']}, Height: {info['height']}" for info in message.image_infos])
-        query_prompt = f"""
+        system_prompt = """
 Task: Analyze the given query with accompanying inputs and determine the skills and tools needed to address it effectively.
-Current Date is {datetime.today().strftime('%Y-%m-%d')}
-Available tools: {message.all_tools_names}
-Metadata for the tools: {message.all_tools_medatada}
-Image: {image_infos_str}
-Query: {question}
+
 Instructions:
 1. Carefully read and understand the query and any accompanying inputs.
 2. Identify the main objectives or tasks within the query.
 3. List the specific skills that would be necessary to address the query comprehensively.
 4. Examine the available tools in the toolbox and determine which ones might relevant and useful for addressing the query. Make sure to consider the user metadata for each tool, including limitations and potential applications (if available).
 5. Provide a brief explanation for each skill and tool you've identified, describing how it would contribute to answering the query.
-6. Important: remember that Current Date is {datetime.today().strftime('%Y-%m-%d')}
+6. Important: remember the Current Date given with the query.
 
 Your response should include:
 1. A concise summary of the query's main points and objectives, as well as content in any accompanying inputs.
@@ -392,22 +787,25 @@ Your response should include:
 4. Any additional considerations that might be important for addressing the query effectively.
 
 Please present your analysis in a clear, structured format.
+"""
+        query_prompt = f"""
+Current Date is {datetime.today().strftime('%Y-%m-%d')}
+Image: {image_infos_str}
+Query: {question}
 """ 
-        llm_logger.debug(f"[QueryAnalyzer] LLM prompt: {query_prompt}")
-
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
-        images_part = [{"type": "image_url", "image_url": {"url": image_to_base64_inline(filename)}} for filename in message.images]
-        
-        input=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": query_prompt},
-                ]+images_part,
-            }]
-        completion = await client.beta.chat.completions.parse(
-            model=os.getenv("OTOOLS_MODEL"),
+        llm_logger.debug(f"[QueryAnalyzer] LLM prompt: {system_prompt}{query_prompt}")
+
+        images = [image_to_base64_inline(filename, image_info=info) for filename, info in zip(message.images, message.image_infos)]
+        input = build_messages(
+            [toolbox_prefix(message.all_tools_names, message.all_tools_medatada), system_prompt],
+            query_prompt,
+            images=images,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
             messages=input,
-            response_format=QueryAnalysisLLMResponse)
+            response_format=QueryAnalysisLLMResponse,
+            agent="QueryAnalyzer",
+            cache=self.deterministic)
         llm_response = completion.choices[0].message.parsed
         
         llm_logger.debug(f"[QueryAnalyzer] LLM response: {llm_response}")
@@ -431,7 +829,8 @@ class ActionPredictor(BaseAgent):
             - Context required for the tool to function.
             - A specific sub-goal for the tool.
             - The name of the selected tool.
-            Returns the LLM's response as a string.
+            Returns the LLM's response as a string. When the request allows more than one action,
+            the response is an `ActionBatchLLMResponse` listing independent tool invocations.
     Attributes:
         id (str):
             Unique identifier for the ActionPredictor instance.
@@ -439,35 +838,58 @@ class ActionPredictor(BaseAgent):
         This class is designed to be used in scenarios where a multi-step process requires 
         intelligent decision-making to determine the next optimal action. It integrates with 
         external tools and metadata to achieve its objectives."""
-    def __init__(self):
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool):
         super().__init__("ActionPredictor")
+        self._llm = llm
         logger.debug(f"ActionPredictor initialized. {str(self)} {self.id}")
     @only_direct
+    @traced_handler
     async def on_message_impl(self, message:ActionPredictorRequest, ctx: MessageContext)->None:
         logger.debug(f"ActionPredictor {self.id} received UserRequest message: {message}")
-        return await self.predict(message)
+        return await run_cancellable(self.predict(message), ctx)
     
     async def predict(self, message:ActionPredictorRequest)->str:
-        query_prompt = f"""
+        batch = message.max_actions > 1
+        if batch:
+            selection = "Select the tools best suited for the next step: one tool, or several independent tool invocations that can run in parallel, keeping in mind the limited number of remaining steps."
+            selection_rule = f"Select at most {message.max_actions} independent tool invocations for this step."
+            output_format = """<justification>: detailed explanation of why the selected tools are the best choice for the next step, considering the context and previous outcomes.
+<actions>: one entry per tool invocation, each with:
+    <context>: MUST include ALL necessary information for the tool to function, structured as follows:
+        * Relevant data from previous steps
+        * File names or paths created or used in previous steps (list EACH ONE individually)
+        * Variable names and their values from previous steps' results
+        * Any other context-specific information required by the tool
+    <sub_goal>: a specific, achievable objective for the tool, based on its metadata and previous outcomes. It MUST contain any involved data, file names, and variables from Previous Steps and Their Results that the tool can act upon.
+    <tool_name>: MUST be the exact name of a tool from the available tools list."""
+            example = """<justification>: [Your detailed explanation here]
+<actions>:
+    - <context>: Image path: "example/image.jpg"
+      <sub_goal>: Detect and count the number of specific objects in the image "example/image.jpg"
+      <tool_name>: Object_Detector_Tool
+    - <context>: Image path: "example/image.jpg"
+      <sub_goal>: Extract the text shown in the image "example/image.jpg"
+      <tool_name>: Text_Extractor_Tool"""
+        else:
+            selection = "Select ONE tool best suited for the next step, keeping in mind the limited number of remaining steps."
+            selection_rule = "Select only ONE tool for this step."
+            output_format = """<justification>: detailed explanation of why the selected tool is the best choice for the next step, considering the context and previous outcomes.
+<context>: MUST include ALL necessary information for the tool to function, structured as follows:
+    * Relevant data from previous steps
+    * File names or paths created or used in previous steps (list EACH ONE individually)
+    * Variable names and their values from previous steps' results
+    * Any other context-specific information required by the tool
+<sub_goal>: a specific, achievable objective for the tool, based on its metadata and previous outcomes. It MUST contain any involved data, file names, and variables from Previous Steps and Their Results that the tool can act upon.
+<tool_name>: MUST be the exact name of a tool from the available tools list."""
+            example = """<justification>: [Your detailed explanation here]
+<context>: Image path: "example/image.jpg", Previous detection results: [list of objects]
+<sub_goal>: Detect and count the number of specific objects in the image "example/image.jpg"
+<tool_name>: Object_Detector_Tool"""
+        system_prompt = f"""
 Task: Determine the optimal next step to address the given query based on the provided analysis, available tools, and previous steps taken.
 
-Context:
-Query: {message.initial_query}
-Image: {",".join(message.image_paths)}
-Query Analysis: {message.query_analysis}
-
-Available Tools:
-{message.aviailable_tools}
-
-Tool Metadata:
-{message.aviailable_tools_metadata}
-
-Previous Steps and Their Results:
-{message.actions_history}
-
-Current Step: {message.step_count} in {message.max_step_count} steps
-Remaining Steps: {message.max_step_count - message.step_count}
-
 Instructions:
 1. Analyze the context thoroughly, including the query, its analysis, any image, available tools and their metadata, and previous steps taken.
 
@@ -478,46 +900,49 @@ Instructions:
    - Outcomes from previous steps
    - Current step count and remaining steps
 
-3. Select ONE tool best suited for the next step, keeping in mind the limited number of remaining steps.
+3. {selection}
 
-4. Formulate a specific, achievable sub-goal for the selected tool that maximizes progress towards answering the query.
+4. Formulate a specific, achievable sub-goal for each selected tool that maximizes progress towards answering the query.
 
 Output Format:
-<justification>: detailed explanation of why the selected tool is the best choice for the next step, considering the context and previous outcomes.
-<context>: MUST include ALL necessary information for the tool to function, structured as follows:
-    * Relevant data from previous steps
-    * File names or paths created or used in previous steps (list EACH ONE individually)
-    * Variable names and their values from previous steps' results
-    * Any other context-specific information required by the tool
-<sub_goal>: a specific, achievable objective for the tool, based on its metadata and previous outcomes. It MUST contain any involved data, file names, and variables from Previous Steps and Their Results that the tool can act upon.
-<tool_name>: MUST be the exact name of a tool from the available tools list.
+{output_format}
 
 Rules:
-- Select only ONE tool for this step.
+- {selection_rule}
 - The sub-goal MUST directly address the query and be achievable by the selected tool.
 - The Context section MUST include ALL necessary information for the tool to function, including ALL relevant file paths, data, and variables from previous steps.
-- The tool name MUST exactly match one from the available tools list: {message.aviailable_tools}.
+- The tool name MUST exactly match one from the available tools list.
 - Avoid redundancy by considering previous steps and building on prior results.
 
 Example (do not copy, use only as reference):
-<justification>: [Your detailed explanation here]
-<context>: Image path: "example/image.jpg", Previous detection results: [list of objects]
-<sub_goal>: Detect and count the number of specific objects in the image "example/image.jpg"
-<tool_name>: Object_Detector_Tool
+{example}
 """
-        llm_logger.debug(f"[ActionPredictor] LLM prompt: {query_prompt}")
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
-       
-        input=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": query_prompt},
-                ]
-            }]
-        completion = await client.beta.chat.completions.parse(
-            model=os.getenv("OTOOLS_MODEL"),
+        query_prompt = f"""
+Context:
+Query: {message.initial_query}
+Image: {",".join(message.image_paths)}
+Query Analysis: {message.query_analysis}
+
+Previous Steps and Their Results:
+{message.actions_history}
+
+Current Step: {message.step_count} in {message.max_step_count} steps
+Remaining Steps: {message.max_step_count - message.step_count}
+"""
+        response_format = ActionPredictonLLMResponse
+        if batch:
+            system_prompt += batch_instructions(message.max_actions)
+            response_format = ActionBatchLLMResponse
+        llm_logger.debug(f"[ActionPredictor] LLM prompt: {system_prompt}{query_prompt}")
+        input = build_messages(
+            [toolbox_prefix(message.aviailable_tools, message.aviailable_tools_metadata), system_prompt],
+            query_prompt,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
             messages=input,
-            response_format=ActionPredictonLLMResponse)
+            response_format=response_format,
+            agent="ActionPredictor",
+            cache=self.deterministic)
         llm_response = completion.choices[0].message.parsed
         
         llm_logger.debug(f"[ActionPredictor] LLM response: {llm_response}")
@@ -546,35 +971,30 @@ class CommandGenerator(BaseAgent):
             provided sub-goal and context.
     Attributes:
         - Inherits attributes from BaseAgent.
-        - Utilizes an LLM client for generating responses.
+        - Utilizes the shared LLM client pool for generating responses.
     Usage:
         This class is designed to be used in scenarios where precise tool execution 
         arguments need to be dynamically generated based on user input and contextual 
         metadata. It ensures compliance with the tool's input schema and provides 
         detailed analysis and explanations for the generated arguments.
     """
-    
-    
-    def __init__(self):
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool):
         super().__init__("CommandGenerator")
+        self._llm = llm
         logger.debug(f"CommandGenerator initialized. {str(self)} {self.id}")
     
-    @only_direct        
+    @only_direct
+    @traced_handler
     async def on_message_impl(self, message:CommandGeneratorRequest, ctx: MessageContext)->None:
         logger.debug(f"CommandGenerator {self.id} received UserRequest message: {message} ")
-        return await self.generate_command(message)
+        return await run_cancellable(self.generate_command(message), ctx)
     
     async def generate_command(self, message:CommandGeneratorRequest)->str:
-        query_prompt =  f"""
+        system_prompt = """
 Task: Generate a precise argument to execute the selected tool based on the given information.
 
-Query: {message.initial_query}
-Image: {",".join(message.image_paths)}
-Context: {message.context}
-Sub-Goal: {message.sub_goal}
-Selected Tool: {message.tool_name}
-Tool Metadata: {message.tool_metadata}
-
 Instructions:
 1. Carefully review all provided information: the query, image path, context, sub-goal, selected tool, and tool metadata.
 2. Analyze the tool's input_type_json_schema from the metadata to understand required and optional parameters.
@@ -605,7 +1025,7 @@ Example 1:
 <explanation>: We pass the image path and a list containing "baseball" as the label to detect.
 <argument>:
 ```json
-{{"image":"path/to/image", labels:["baseball"])}}
+{"image":"path/to/image", labels:["baseball"])}
 ```
 
 Example 2:
@@ -613,7 +1033,7 @@ Example 2:
 <explanation>: We pass name and surname of user together with his age in argument .
 <argument>:
 ```json
-{{"image":"path/to/image", labels:["baseball"])}}
+{"image":"path/to/image", labels:["baseball"])}
 ```
 
 
@@ -628,25 +1048,30 @@ Reason: not a valid json object.
 
 <argument>:
 ```json
-{{"image":"path/to/image"}}
-{{"labels":["baseball"]}}
+{"image":"path/to/image"}
+{"labels":["baseball"]}
 ```
 Reason: Multiple json objects are not allowed.
 
 Remember: Your <argument> field MUST be valid json object"""
-        llm_logger.debug(f"[CommandGenerator] LLM prompt: {query_prompt}")
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
-       
-        input=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": query_prompt},
-                ]
-            }]
-        completion = await client.beta.chat.completions.parse(
-            model=os.getenv("OTOOLS_MODEL"),
+        query_prompt =  f"""
+Query: {message.initial_query}
+Image: {",".join(message.image_paths)}
+Context: {message.context}
+Sub-Goal: {message.sub_goal}
+Selected Tool: {message.tool_name}
+"""
+        llm_logger.debug(f"[CommandGenerator] LLM prompt: {system_prompt}{query_prompt}")
+        input = build_messages(
+            [system_prompt, f"Tool Metadata: {message.tool_metadata}"],
+            query_prompt,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
             messages=input,
-            response_format=ToolCommandLLMResponse)
+            response_format=ToolCommandLLMResponse,
+            agent="CommandGenerator",
+            validate=validate_tool_command,
+            cache=self.deterministic)
         llm_response = completion.choices[0].message.parsed
         llm_logger.debug(f"[CommandGenerator] LLM response: {llm_response}")
         
@@ -654,29 +1079,189 @@ Remember: Your <argument> field MUST be valid json object"""
         return llm_response
     
     
+class FusedPlanner(BaseAgent):
+    """
+    FusedPlanner selects the next tool and generates its argument in a single structured completion,
+    replacing the ActionPredictor and CommandGenerator round trips of a step.
+
+    The response format is built from the registered tool cards: the `action` field is a union of
+    one model per tool, discriminated by the tool name, whose `argument` is the tool's input model.
+    The provider therefore returns an argument that already conforms to the selected tool's schema.
+    When the request allows more than one action, the response holds a list of such actions, each
+    with its own context and sub-goal. The formats are rebuilt whenever the tool registry changes.
+    """
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool, manager: "Manager"):
+        super().__init__("FusedPlanner")
+        self._llm = llm
+        self._manager = manager
+        self._plan_formats: dict[bool, type[BaseModel]] = {}
+        self._plan_formats_registry: Optional[ToolRegistry] = None
+        logger.debug(f"FusedPlanner initialized. {str(self)} {self.id}")
+
+    @staticmethod
+    def build_plan_format(tool_registry: ToolRegistry, batch: bool = False) -> type[BaseModel]:
+        """
+        Builds the structured response format of the fused planner for a tool registry.
+
+        Args:
+            tool_registry (ToolRegistry): The registered tools.
+            batch (bool, optional): Whether the format holds a list of independent actions.
+
+        Returns:
+            type[BaseModel]: The response model with `justification`, `context`, `sub_goal` and
+                an `action` holding the tool name and its typed argument, or with `justification`
+                and a list of `actions` that each carry their own context and sub-goal.
+        """
+        step_fields = {"context": (str, ...), "sub_goal": (str, ...)} if batch else {}
+        actions = [
+            create_model(
+                f"{compiled.card.tool_id}{'Batch' if batch else ''}Action",
+                **step_fields,
+                tool_name=(Literal[name], ...),
+                argument=(compiled.card.inputs, ...))
+            for name, compiled in tool_registry.cards.items()
+        ]
+        if len(actions) == 1:
+            action_type = actions[0]
+        else:
+            action_type = Annotated[Union[tuple(actions)], Field(discriminator="tool_name")]
+        if batch:
+            return create_model(
+                "FusedBatchPlanLLMResponse",
+                justification=(str, ...),
+                actions=(list[action_type], ...))
+        return create_model(
+            "FusedPlanLLMResponse",
+            justification=(str, ...),
+            context=(str, ...),
+            sub_goal=(str, ...),
+            action=(action_type, ...))
+
+    def get_plan_format(self, batch: bool = False) -> type[BaseModel]:
+        tool_registry = self._manager.get_tool_registry()
+        if self._plan_formats_registry is not tool_registry:
+            self._plan_formats = {}
+            self._plan_formats_registry = tool_registry
+        if batch not in self._plan_formats:
+            self._plan_formats[batch] = self.build_plan_format(tool_registry, batch)
+        return self._plan_formats[batch]
+
+    @only_direct
+    @traced_handler
+    async def on_message_impl(self, message:FusedPlannerRequest, ctx: MessageContext)->None:
+        logger.debug(f"FusedPlanner {self.id} received UserRequest message: {message}")
+        return await run_cancellable(self.plan(message), ctx)
+
+    async def plan(self, message:FusedPlannerRequest)->StepPlanBatch:
+        batch = message.max_actions > 1
+        if batch:
+            selection = "Select the tools best suited for the next step: one tool, or several independent tool invocations that can run in parallel, keeping in mind the limited number of remaining steps."
+            selection_rule = f"Select at most {message.max_actions} independent tool invocations for this step."
+            output_format = """<justification>: detailed explanation of why the selected tools are the best choice for the next step, considering the context and previous outcomes.
+<actions>: one entry per tool invocation, each with:
+    <context>: MUST include ALL necessary information for the tool to function, such as relevant data, file names or paths, and variable values from previous steps.
+    <sub_goal>: a specific, achievable objective for the tool, based on its metadata and previous outcomes.
+    <tool_name> and <argument>: the exact name of the selected tool from the available tools list, and the argument to execute it with."""
+        else:
+            selection = "Select ONE tool best suited for the next step, keeping in mind the limited number of remaining steps."
+            selection_rule = "Select only ONE tool for this step."
+            output_format = """<justification>: detailed explanation of why the selected tool is the best choice for the next step, considering the context and previous outcomes.
+<context>: MUST include ALL necessary information for the tool to function, such as relevant data, file names or paths, and variable values from previous steps.
+<sub_goal>: a specific, achievable objective for the tool, based on its metadata and previous outcomes.
+<action>: the exact name of the selected tool from the available tools list, and the argument to execute it with."""
+        system_prompt = f"""
+Task: Determine the optimal next step to address the given query and generate the argument to execute the selected tool, based on the provided analysis, available tools, and previous steps taken.
+
+Instructions:
+1. Analyze the context thoroughly, including the query, its analysis, any image, available tools and their metadata, and previous steps taken.
+
+2. Determine the most appropriate next step by considering:
+   - Key objectives from the query analysis
+   - Capabilities of available tools
+   - Logical progression of problem-solving
+   - Outcomes from previous steps
+   - Current step count and remaining steps
+
+3. {selection}
+
+4. Formulate a specific, achievable sub-goal for each selected tool that maximizes progress towards answering the query.
+
+5. Construct the argument for each selected tool from its input_type_json_schema, including all required parameters with values taken from the query, the context and previous steps.
+
+Output Format:
+{output_format}
+
+Rules:
+- {selection_rule}
+- The sub-goal MUST directly address the query and be achievable by the selected tool.
+- The argument MUST follow the selected tool's input schema and include ALL required parameters, data, and paths.
+- Avoid redundancy by considering previous steps and building on prior results.
+"""
+        query_prompt = f"""
+Context:
+Query: {message.initial_query}
+Image: {",".join(message.image_paths)}
+Query Analysis: {message.query_analysis}
+
+Previous Steps and Their Results:
+{message.actions_history}
+
+Current Step: {message.step_count} in {message.max_step_count} steps
+Remaining Steps: {message.max_step_count - message.step_count}
+"""
+        if batch:
+            system_prompt += batch_instructions(message.max_actions)
+        llm_logger.debug(f"[FusedPlanner] LLM prompt: {system_prompt}{query_prompt}")
+        input = build_messages(
+            [toolbox_prefix(message.available_tools, message.available_tools_metadata), system_prompt],
+            query_prompt,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
+            messages=input,
+            response_format=self.get_plan_format(batch),
+            agent="FusedPlanner",
+            cache=self.deterministic)
+        llm_response = completion.choices[0].message.parsed
+        llm_logger.debug(f"[FusedPlanner] LLM response: {llm_response}")
+        if llm_response is None:
+            raise ValueError("FusedPlanner received no parsed plan.")
+        if batch:
+            return StepPlanBatch(plans=[
+                StepPlan(
+                    tool_name=action.tool_name,
+                    sub_goal=action.sub_goal,
+                    context=action.context,
+                    argument=action.argument.model_dump_json())
+                for action in llm_response.actions[:message.max_actions]
+            ])
+        return StepPlanBatch(plans=[StepPlan(
+            tool_name=llm_response.action.tool_name,
+            sub_goal=llm_response.sub_goal,
+            context=llm_response.context,
+            argument=llm_response.action.argument.model_dump_json())])
+
+
 class ContextVerifier(BaseAgent):
-    def __init__(self):
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool):
         super().__init__("ContextVerifier")
+        self._llm = llm
         logger.debug(f"ContextVerifier initialized. {str(self)} {self.id}")
     
     
-    @only_direct        
+    @only_direct
+    @traced_handler
     async def on_message_impl(self, message:ContextVerifierRequest, ctx: MessageContext)->None:
         logger.debug(f"ContextVerifier {self.id} received message: {message} ")
-        return await self.verify(message)
+        return await run_cancellable(self.verify(message), ctx)
     
     async def verify(self, message:ContextVerifierRequest)->str:
-        query_prompt =  f"""
+        system_prompt = """
 Task: Thoroughly evaluate the completeness and accuracy of the memory for fulfilling the given query, considering the potential need for additional tool usage.
 
-Context:
-Query: {message.question}
-Image: {message.image_info}
-Available Tools: {message.available_tools}
-Toolbox Metadata: {message.toolbox_metadata}
-Initial Analysis: {message.query_analysis}
-Memory (tools used and results): {message.memory}
-
 Detailed Instructions:
 1. Carefully analyze the query, initial analysis, and image (if provided):
    - Identify the main objectives of the query.
@@ -717,36 +1302,53 @@ Response Format:
     * "True": if the memory is sufficient for addressing the query to proceed and no additional available tools need to be used. If ONLY manual verification without tools is needed, choose "True".
     * "False": if the memory is insufficient and needs more information from additional tool usage.
 """
-        llm_logger.debug(f"[ContextVerifier] LLM prompt: {query_prompt}")
-
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
-        images_part = [{"type": "image_url", "image_url": {"url": image_to_base64_inline(fnmae)}} for fnmae in message.images]
-
-        input=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": query_prompt},
-                ]+images_part,
-            }]
-        completion = await client.beta.chat.completions.parse(
-            model=os.getenv("OTOOLS_MODEL"),
+        query_prompt =  f"""
+Context:
+Query: {message.question}
+Image: {message.image_info}
+Initial Analysis: {message.query_analysis}
+Memory (tools used and results): {message.memory}
+"""
+        llm_logger.debug(f"[ContextVerifier] LLM prompt: {system_prompt}{query_prompt}")
+
+        images = [image_to_base64_inline(fnmae, image_info=info) for fnmae, info in zip(message.image_paths, message.image_info)]
+        input = build_messages(
+            [toolbox_prefix(message.available_tools, message.toolbox_metadata), system_prompt],
+            query_prompt,
+            images=images,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
             messages=input,
-            response_format=ContextVerifierLLMResponse)
+            response_format=ContextVerifierLLMResponse,
+            agent="ContextVerifier",
+            cache=self.deterministic)
         llm_response = completion.choices[0].message.parsed
         
         llm_logger.debug(f"[ContextVerifier] LLM response: {llm_response}")
         return llm_response
 
 class FinalOutputAgent(BaseAgent):
-    def __init__(self):
+    """
+    FinalOutputAgent generates the final answer from the query, the image information and the actions taken.
+    The completion is streamed; every delta is sent to the session's client queue as a
+    `FinalOutputDelta` response as soon as it arrives, and the full answer is returned to the
+    Orchestrator, which sends it in the final `FinalOutput` response.
+    The agent is not `deterministic`, so its completions are never served from the completion cache.
+    """
+    deterministic = False
+
+    def __init__(self, llm: LLMClientPool, manager: "Manager" = None):
         super().__init__("FinalOutputAgent")
+        self._llm = llm
+        self._manager = manager
         logger.debug(f"FinalOutputAgent initialized. {str(self)} {self.id}")
     
     
-    @only_direct        
+    @only_direct
+    @traced_handler
     async def on_message_impl(self, message:FinalOutputRequest, ctx: MessageContext)->None:
         logger.debug(f"FinalOutputAgent {self.id} received message: {message} ")
-        return await self.generate(message)
+        return await run_cancellable(self.generate(message), ctx)
     
     
     async def generate(self, message:FinalOutputRequest)->str:
@@ -805,8 +1407,7 @@ Answer:
 """
    
         llm_logger.debug(f"[FinalOutputAgent] LLM prompt: {query_prompt}")
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
-        images_part = [{"type": "image_url", "image_url": {"url": image_to_base64_inline(fnmae)}} for fnmae in message.images]
+        images_part = [{"type": "image_url", "image_url": {"url": image_to_base64_inline(fnmae, image_info=info)}} for fnmae, info in zip(message.image_paths, message.image_info)]
         
         input=[{
                 "role": "user",
@@ -814,10 +1415,29 @@ Answer:
                     {"type": "text", "text": query_prompt},
                 ]+images_part,
             }]
-        completion = await client.chat.completions.create(
-            model=os.getenv("OTOOLS_MODEL"),
-            messages=input)
-        llm_response = completion.choices[0].message.content
+        from .runtime import UserResponse
+        to_client_queue = None
+        if self._manager is not None:
+            try:
+                to_client_queue = self._manager.get_session(self.id.key).to_client_queue
+            except KeyError:
+                pass
+        chunks = []
+        async with aclosing(self._llm.stream(
+                messages=input,
+                agent="FinalOutputAgent")) as deltas:
+            async for delta in deltas:
+                chunks.append(delta)
+                if to_client_queue is not None:
+                    await to_client_queue.put(UserResponse(
+                        type="FinalOutputDelta",
+                        session_id=self.id.key,
+                        message=delta,
+                        tool_used=None,
+                        final=False,
+                        conclusion=False,
+                        step_no=message.step_no))
+        llm_response = "".join(chunks)
         
         llm_logger.debug(f"[FinalOutputAgent] LLM response: {llm_response}")
         return llm_response
\ No newline at end of file
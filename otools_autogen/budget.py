@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import time
+
+from .usage import TokenUsage
+
+
+class BudgetExhausted(RuntimeError):
+    """
+    Raised when a call of a request is refused or cut short because a budget limit is reached.
+
+    Attributes:
+        limit (str): The name of the reached limit, "seconds", "tokens" or "cost".
+    """
+
+    def __init__(self, limit: str, description: str):
+        super().__init__(description)
+        self.limit = limit
+
+
+@dataclass
+class RequestBudget:
+    """
+    Wall-clock, token and cost budget of a user request.
+
+    Between steps, a limit is reached when it is used up, or when one more step would use it up,
+    projecting the usage of the next step from the average usage of the steps taken so far.
+    Within a step, `check` refuses calls once a limit is used up, and `remaining_seconds` bounds
+    the calls that are made. Limits of 0 are disabled.
+
+    Attributes:
+        max_seconds (float): Wall-clock seconds the request may take.
+        max_tokens (int): Prompt and completion tokens the request may use.
+        max_cost (float): Cost the request may incur, in the currency of the model pricing.
+        started_at (float): Monotonic time the request started at.
+    """
+    max_seconds: float = 0
+    max_tokens: int = 0
+    max_cost: float = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_request(cls, message) -> "RequestBudget":
+        """
+        Creates the budget of a `UserRequest`.
+        """
+        return cls(max_seconds=message.max_seconds, max_tokens=message.max_tokens, max_cost=message.max_cost)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_seconds or self.max_tokens or self.max_cost)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def remaining_seconds(self) -> Optional[float]:
+        """
+        The wall-clock seconds left, or None if the request has no seconds budget.
+        """
+        if not self.max_seconds:
+            return None
+        return max(self.max_seconds - self.elapsed, 0.0)
+
+    def _limits(self, usage: TokenUsage):
+        return (
+            ("seconds", self.max_seconds, self.elapsed),
+            ("tokens", self.max_tokens, usage.total_tokens),
+            ("cost", self.max_cost, usage.cost))
+
+    def check(self, usage: TokenUsage):
+        """
+        Checks, before a call, that no limit is used up.
+
+        Args:
+            usage (TokenUsage): The usage of the request so far.
+
+        Raises:
+            BudgetExhausted: If a limit is used up.
+        """
+        for name, limit, used in self._limits(usage):
+            if limit and used >= limit:
+                raise BudgetExhausted(name, f"The {name} budget of {limit} is used up ({used:.4g} used).")
+
+    def limit_reached(self, usage: TokenUsage, steps: int) -> Optional[tuple[str, str]]:
+        """
+        Checks the limits against the usage of the request.
+
+        Args:
+            usage (TokenUsage): The usage of the request so far.
+            steps (int): The number of steps taken so far.
+
+        Returns:
+            Optional[tuple[str, str]]: The name of the reached limit, "seconds", "tokens" or
+                "cost", and a description of it, or None if no limit is reached.
+        """
+        for name, limit, used in self._limits(usage):
+            if not limit:
+                continue
+            if used >= limit:
+                return name, f"The {name} budget of {limit} is used up ({used:.4g} used)."
+            if steps > 0 and used + used / steps > limit:
+                return name, f"The {name} budget of {limit} would be exceeded by the next step ({used:.4g} used)."
+        return None
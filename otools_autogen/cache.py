@@ -0,0 +1,316 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .executor import ToolExecutor, default_tool_executor
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+class CacheBackend(ABC):
+    """
+    Abstract storage for cached string values with per-entry expiry.
+
+    Attributes:
+        blocking (bool): Whether the backend does blocking I/O, so its methods are run on a
+            thread pool instead of the event loop.
+    """
+    blocking: bool = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the value stored under the key, or None if it is missing or expired.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float]):
+        """
+        Stores a value under the key. A ttl of None keeps it until it is evicted.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources held by the backend.
+        """
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-memory LRU cache backend.
+
+    Attributes:
+        max_entries (int): Maximum number of entries; least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float]):
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk cache backend stored in a SQLite database, so entries survive restarts.
+    Its calls block on disk I/O, so `ResponseCache` runs them on its executor.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+        namespace (str): Namespace separating entries of different users of the same file.
+        max_entries (int): Maximum number of entries in the namespace; least recently used
+            ones are evicted first.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, namespace: str = "default", max_entries: int = 1024):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL, PRIMARY KEY (namespace, key))")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                               (now, self.namespace, key))
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float]):
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, value, expires_at, now))
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Caching policy of a tool, set on its `ToolCard`.
+
+    Attributes:
+        ttl (Optional[float]): Seconds a cached response stays valid. None never expires.
+        max_entries (int): Maximum number of cached responses.
+        path (Optional[str]): Path of a SQLite database to persist the cache in. Defaults to
+            `OTOOLS_TOOL_CACHE_PATH`; if neither is set the cache is kept in memory.
+    """
+    ttl: Optional[float] = 3600.0
+    max_entries: int = 1024
+    path: Optional[str] = None
+
+    def create_backend(self, namespace: str) -> CacheBackend:
+        """
+        Creates the backend described by the policy.
+
+        Args:
+            namespace (str): The namespace of the cache, e.g. the tool id.
+
+        Returns:
+            CacheBackend: A SQLite backend if a path is configured, an in-memory backend otherwise.
+        """
+        path = self.path or os.getenv("OTOOLS_TOOL_CACHE_PATH")
+        if path:
+            return SQLiteCacheBackend(path, namespace=namespace, max_entries=self.max_entries)
+        return MemoryCacheBackend(max_entries=self.max_entries)
+
+
+def cache_key(*parts: str) -> str:
+    """
+    Builds a fixed-length cache key from its parts.
+
+    Args:
+        *parts (str): The parts, e.g. a tool id and the canonical JSON of the input.
+
+    Returns:
+        str: The SHA-256 hex digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Memoizes the results of async calls and collapses concurrent identical calls into one.
+
+    While a call for a key is in flight, further callers with the same key wait for its result
+    instead of starting their own call. A caller that is cancelled stops waiting without
+    affecting the others; the call itself is cancelled once all its callers are. Exceptions are
+    not cached. Blocking backends are read and written on the executor.
+
+    Attributes:
+        name (str): Name of the cache, used as the metrics label.
+        backend (CacheBackend): The storage of the cached values.
+        ttl (Optional[float]): Seconds a cached value stays valid.
+        metrics (MetricsRegistry): Registry receiving hit, miss and collapsed call counters.
+        executor (ToolExecutor): Thread pool running the calls of a blocking backend. Defaults
+            to the process-wide default executor.
+    """
+
+    def __init__(self, name: str, backend: CacheBackend, ttl: Optional[float] = None,
+                 metrics: Optional[MetricsRegistry] = None, executor: Optional[ToolExecutor] = None):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.metrics = metrics or MetricsRegistry()
+        self._executor = executor
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+
+    @classmethod
+    def from_policy(cls, name: str, policy: CachePolicy, metrics: Optional[MetricsRegistry] = None,
+                    executor: Optional[ToolExecutor] = None) -> "ResponseCache":
+        """
+        Creates a cache following a `CachePolicy`.
+        """
+        return cls(name, policy.create_backend(name), ttl=policy.ttl, metrics=metrics, executor=executor)
+
+    @property
+    def executor(self) -> ToolExecutor:
+        return self._executor or default_tool_executor()
+
+    @executor.setter
+    def executor(self, executor: ToolExecutor):
+        self._executor = executor
+
+    async def _backend_call(self, method: Callable, *args):
+        if self.backend.blocking:
+            return await self.executor.run(method, *args)
+        return method(*args)
+
+    def close(self):
+        """
+        Closes the backend, e.g. the connection of a SQLite backend.
+        """
+        self.backend.close()
+
+    async def get_or_call(self, key: str, call: Callable[[], Awaitable[str]],
+                          should_store: Callable[[str], bool] = lambda value: True) -> str:
+        """
+        Returns the cached value for the key, or runs the call and caches its result.
+
+        Args:
+            key (str): The cache key.
+            call (Callable[[], Awaitable[str]]): Produces the value on a miss.
+            should_store (Callable[[str], bool], optional): Decides whether a produced value is cached.
+
+        Returns:
+            str: The cached or produced value.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            value = await self._backend_call(self.backend.get, key)
+            if value is not None:
+                self.metrics.inc("cache_hits", cache=self.name)
+                return value
+            # a call for the key may have started while the backend was read
+            task = self._in_flight.get(key)
+        if task is not None:
+            self.metrics.inc("cache_collapsed_calls", cache=self.name)
+            return await self._wait(key, task)
+        self.metrics.inc("cache_misses", cache=self.name)
+
+        async def run() -> str:
+            try:
+                value = await call()
+                if should_store(value):
+                    await self._backend_call(self.backend.set, key, value, self.ttl)
+                return value
+            finally:
+                if self._in_flight.get(key) is asyncio.current_task():
+                    del self._in_flight[key]
+
+        task = asyncio.ensure_future(run())
+        self._in_flight[key] = task
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> str:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # the last caller was cancelled, nobody needs the result
+                    task.cancel()
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
@@ -0,0 +1,334 @@
+from dataclasses import dataclass
+from typing import Dict, Sequence
+import asyncio
+import json
+import logging
+
+from pydantic import BaseModel
+from autogen_core import AgentId, BaseAgent, MessageContext
+
+from .agents import (
+    CommandGeneratorRequest,
+    Orchestrator,
+    QueryAnalysisLLMResponse,
+    StepPlan,
+    ToolCommandLLMResponse,
+)
+from .history import ActionHistory, ActionStep
+from .llm import LLMClientPool
+from .prompts import build_messages, toolbox_prefix
+from .tools import ToolRegistry
+from .utils import only_direct, run_cancellable, get_image_info
+from .budget import BudgetExhausted
+from .tracing import traced_handler
+
+llm_logger = logging.getLogger("otools_autogen_llm")
+logger = logging.getLogger("otools_autogen")
+
+
+class PlanNode(BaseModel):
+    id: str
+    tool_name: str
+    sub_goal: str
+    depends_on: list[str]
+    argument: str
+
+
+class DagPlanLLMResponse(BaseModel):
+    justification: str
+    nodes: list[PlanNode]
+
+
+@dataclass
+class DagPlannerRequest():
+    initial_query: str
+    image_paths: list[str]
+    query_analysis: str
+    available_tools: list[str]
+    available_tools_metadata: str
+    actions_history: str
+    max_nodes: int
+
+
+def order_plan(nodes: Sequence[PlanNode], tool_names: Sequence[str]) -> list[PlanNode]:
+    """
+    Validates a plan graph and returns its nodes in topological order.
+
+    Args:
+        nodes (Sequence[PlanNode]): The nodes of the plan.
+        tool_names (Sequence[str]): The registered tool names.
+
+    Returns:
+        list[PlanNode]: The nodes, each placed after all nodes it depends on.
+
+    Raises:
+        ValueError: If node ids are not unique, a node uses an unknown tool or depends on an
+            unknown node, or the dependencies contain a cycle.
+    """
+    by_id = {}
+    for node in nodes:
+        if node.id in by_id:
+            raise ValueError(f"Duplicate plan node id: {node.id}")
+        if node.tool_name not in tool_names:
+            raise ValueError(f"Plan node {node.id} uses an unknown tool: {node.tool_name}")
+        by_id[node.id] = node
+    for node in nodes:
+        for dependency in node.depends_on:
+            if dependency not in by_id:
+                raise ValueError(f"Plan node {node.id} depends on an unknown node: {dependency}")
+    ordered = []
+    placed = set()
+    remaining = list(nodes)
+    while remaining:
+        ready = [node for node in remaining if all(dependency in placed for dependency in node.depends_on)]
+        if not ready:
+            raise ValueError(f"Plan has a dependency cycle between nodes: {[node.id for node in remaining]}")
+        for node in ready:
+            ordered.append(node)
+            placed.add(node.id)
+        remaining = [node for node in remaining if node.id not in placed]
+    return ordered
+
+
+class DagPlanner(BaseAgent):
+    """
+    DagPlanner plans the tool invocations needed to answer a query as a dependency graph in a single
+    structured completion. Each node names a tool, its sub-goal and the nodes whose results it needs.
+    Nodes without dependencies carry their JSON argument; arguments of dependent nodes are generated
+    once their inputs are available.
+    """
+    deterministic = True
+
+    def __init__(self, llm: LLMClientPool):
+        super().__init__("DagPlanner")
+        self._llm = llm
+        logger.debug(f"DagPlanner initialized. {str(self)} {self.id}")
+
+    @only_direct
+    @traced_handler
+    async def on_message_impl(self, message:DagPlannerRequest, ctx: MessageContext)->None:
+        logger.debug(f"DagPlanner {self.id} received message: {message}")
+        return await run_cancellable(self.plan(message), ctx)
+
+    async def plan(self, message:DagPlannerRequest)->DagPlanLLMResponse:
+        system_prompt = """
+Task: Plan the tool invocations needed to address the given query as a dependency graph, based on the provided analysis, available tools, and previous steps taken.
+
+Instructions:
+1. Analyze the context thoroughly, including the query, its analysis, any image, available tools and their metadata, and previous steps taken.
+2. Break the work down into tool invocations (nodes). Invocations that do not need each other's results are independent and run in parallel.
+3. For every node, list in <depends_on> the ids of the nodes whose results it needs. Leave it empty if the node only needs the query and previous steps.
+4. For nodes without dependencies, provide the JSON argument to execute the tool, following its input_type_json_schema. For nodes with dependencies, leave the argument empty; it is generated once their results are available.
+
+Output Format:
+<justification>: explanation of the plan and how its nodes address the query.
+<nodes>: the list of nodes, each with:
+    <id>: a short unique identifier, such as "n1".
+    <tool_name>: MUST be the exact name of a tool from the available tools list.
+    <sub_goal>: a specific, achievable objective for the tool, containing all data, file names and variables it needs.
+    <depends_on>: ids of the nodes whose results are needed.
+    <argument>: the single valid JSON object to execute the tool with, or an empty string for nodes with dependencies.
+
+Rules:
+- Do not exceed the maximum number of nodes.
+- Dependencies MUST NOT form cycles.
+- Avoid redundancy by considering previous steps and building on prior results.
+- Prefer independent nodes over chains whenever the results are not needed by each other.
+"""
+        query_prompt = f"""
+Context:
+Query: {message.initial_query}
+Image: {",".join(message.image_paths)}
+Query Analysis: {message.query_analysis}
+
+Previous Steps and Their Results:
+{message.actions_history}
+
+Maximum Number of Nodes: {message.max_nodes}
+"""
+        llm_logger.debug(f"[DagPlanner] LLM prompt: {system_prompt}{query_prompt}")
+        input = build_messages(
+            [toolbox_prefix(message.available_tools, message.available_tools_metadata), system_prompt],
+            query_prompt,
+            cache_hints=self._llm.use_cache_hints)
+        completion = await self._llm.complete(
+            messages=input,
+            response_format=DagPlanLLMResponse,
+            agent="DagPlanner",
+            cache=self.deterministic)
+        llm_response = completion.choices[0].message.parsed
+        llm_logger.debug(f"[DagPlanner] LLM response: {llm_response}")
+        return llm_response
+
+
+class DagOrchestrator(Orchestrator):
+    """
+    Orchestrator that plans the tool invocations of a request as a dependency graph and runs each node
+    as soon as the nodes it depends on have finished, instead of gating every tool call on its own
+    planning round trips.
+
+    Workflow:
+        1. Analyzes the user query and images using the QueryAnalyzer agent.
+        2. Plans a graph of tool invocations using the DagPlanner agent.
+        3. Runs the graph. Independent nodes run concurrently, bounded by the runtime's
+           `parallel_tool_concurrency`; the arguments of dependent nodes are generated by the
+           CommandGenerator agent from the results of their dependencies.
+        4. Re-plans from the action history if a node failed, or if the ContextVerifier agent asks
+           for more information after a successful graph.
+        5. Generates the final output using the FinalOutputAgent and sends it to the client.
+
+    The `max_steps` of the request bounds the total number of tool invocations, and its budgets
+    are checked before each planning round and verification, and before every agent and tool
+    call within a round. The same UserResponse events as
+    the linear Orchestrator are sent, with one step number per node.
+    """
+
+    async def _process(self, message:"UserRequest", session, session_id: str)->None:
+        from .runtime import UserResponse
+        to_client_queue = session.to_client_queue
+
+        logger.debug(f"DagOrchestrator {self.id} received message: {message} with topic id: {session_id}")
+        image_infos = [get_image_info(image_path) for image_path in message.files]
+        tool_registry = self._manager.get_tool_registry()
+        budget = self._current_budget()
+        query_analysis = None
+        step_no = 0
+        actions_history = self._new_history()
+        conclusion = False
+        try:
+            query_analysis = await self._analyze_query(message, session_id, image_infos, tool_registry)
+            while step_no < message.max_steps:
+                if await self._budget_reached(budget, session_id, to_client_queue, step_no):
+                    break
+                try:
+                    nodes = await self._plan_graph(
+                        message, session_id, tool_registry, query_analysis, actions_history, message.max_steps - step_no)
+                except BudgetExhausted:
+                    raise
+                except Exception as e:
+                    logger.warning(f"DagOrchestrator {self.id} planning failed: {e}")
+                    self._manager.metrics.inc("dag_plan_failures")
+                    await to_client_queue.put(UserResponse(
+                        type="Error",
+                        session_id=session_id,
+                        message=f"Error planning tools: {str(e)}",
+                        tool_used=None,
+                        final=False,
+                        conclusion=False,
+                        step_no=step_no))
+                    break
+                if not nodes:
+                    break
+                step_no, failed = await self._run_graph(
+                    nodes, message, session_id, to_client_queue, tool_registry, query_analysis, actions_history, step_no)
+                if failed:
+                    self._manager.metrics.inc("dag_replans", reason="failure")
+                    continue
+                if await self._budget_reached(budget, session_id, to_client_queue, step_no):
+                    break
+                if await self._verify_context(message, session_id, image_infos, tool_registry, query_analysis, actions_history):
+                    conclusion = True
+                    break
+                self._manager.metrics.inc("dag_replans", reason="verifier")
+        except BudgetExhausted as exhausted:
+            await self._report_budget_exceeded(session_id, to_client_queue, step_no, exhausted.limit, str(exhausted))
+        await self._send_final_output(
+            message, session_id, to_client_queue, image_infos, query_analysis, actions_history, step_no, conclusion)
+
+    async def _plan_graph(self, message:"UserRequest", session_id: str, tool_registry: ToolRegistry,
+                          query_analysis: QueryAnalysisLLMResponse, actions_history: ActionHistory,
+                          max_nodes: int)->list[PlanNode]:
+        """
+        Plans a graph with the DagPlanner agent.
+
+        Returns:
+            list[PlanNode]: The nodes in topological order, limited to `max_nodes`. A topological
+                prefix keeps the dependencies of every kept node.
+        """
+        dag_planner_request = DagPlannerRequest(
+            initial_query=message.message,
+            image_paths=message.files,
+            query_analysis=str(query_analysis),
+            available_tools=list(tool_registry.names),
+            available_tools_metadata=tool_registry.prompt,
+            actions_history=actions_history.render(),
+            max_nodes=max_nodes
+        )
+        plan:DagPlanLLMResponse = await self.send_message(dag_planner_request, AgentId(type="DagPlanner", key=session_id))
+        return order_plan(plan.nodes, tool_registry.names)[:max_nodes]
+
+    async def _run_graph(self, nodes: list[PlanNode], message:"UserRequest", session_id: str, to_client_queue,
+                         tool_registry: ToolRegistry, query_analysis: QueryAnalysisLLMResponse,
+                         actions_history: ActionHistory, step_no: int)->tuple[int, bool]:
+        """
+        Runs the nodes of a graph, each as soon as all nodes it depends on have succeeded. Nodes
+        depending on a failed node are skipped.
+
+        Returns:
+            tuple[int, bool]: The last step number used, and whether any node failed or was skipped.
+        """
+        semaphore = asyncio.Semaphore(self._manager.parallel_tool_concurrency)
+        tasks: Dict[str, asyncio.Task] = {}
+        step_counter = [step_no]
+
+        async def run_node(node: PlanNode)->tuple[ActionStep, bool]:
+            upstream = [await tasks[dependency] for dependency in node.depends_on]
+            if not all(ok for _, ok in upstream):
+                logger.debug(f"DagOrchestrator {self.id} skipped node {node.id}: a dependency failed")
+                self._manager.metrics.inc("dag_skipped_nodes")
+                return ActionStep(0, node.tool_name, node.sub_goal, node.argument, "Skipped"), False
+            async with semaphore:
+                step_counter[0] += 1
+                node_step_no = step_counter[0]
+                self._manager.usage.begin_step(session_id, node_step_no)
+                plan = await self._plan_node(node, dict(zip(node.depends_on, (call for call, _ in upstream))),
+                                             message, session_id, tool_registry, query_analysis)
+                call, ok = await self._execute_plan(plan, session_id, to_client_queue, tool_registry, node_step_no)
+                actions_history.add_step(
+                    step_no=node_step_no,
+                    tool_name=call.tool_name,
+                    sub_goal=call.sub_goal,
+                    argument=call.argument,
+                    result=call.result
+                )
+                self._manager.metrics.inc("dag_nodes", status="succeeded" if ok else "failed")
+                return call, ok
+
+        for node in nodes:
+            tasks[node.id] = asyncio.create_task(run_node(node))
+        try:
+            outcomes = await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return step_counter[0], not all(ok for _, ok in outcomes)
+
+    async def _plan_node(self, node: PlanNode, upstream: Dict[str, ActionStep], message:"UserRequest",
+                         session_id: str, tool_registry: ToolRegistry,
+                         query_analysis: QueryAnalysisLLMResponse)->StepPlan:
+        """
+        Completes the plan of a node. The planned argument is used for nodes without dependencies;
+        otherwise, or if it is not valid JSON, the CommandGenerator generates it from the results of
+        the node's dependencies.
+        """
+        if not upstream:
+            try:
+                json.loads(node.argument)
+                return StepPlan(tool_name=node.tool_name, sub_goal=node.sub_goal, context="", argument=node.argument)
+            except (TypeError, ValueError):
+                pass
+        context = json.dumps({
+            dependency: {"tool_name": call.tool_name, "sub_goal": call.sub_goal, "result": call.result_text()}
+            for dependency, call in upstream.items()
+        }, ensure_ascii=False)
+        cgr = CommandGeneratorRequest(
+            initial_query=message.message,
+            query_analysis=str(query_analysis),
+            context=f"Results of the steps this step depends on: {context}",
+            sub_goal=node.sub_goal,
+            tool_name=node.tool_name,
+            tool_metadata=tool_registry.cards[node.tool_name].prompt,
+            image_paths=message.files
+        )
+        command_response:ToolCommandLLMResponse = await self.send_message(cgr, AgentId(type="CommandGenerator", key=session_id))
+        return StepPlan(tool_name=node.tool_name, sub_goal=node.sub_goal, context=context, argument=command_response.argument)
@@ -0,0 +1,220 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import asyncio
+import json
+import logging
+import signal
+
+from autogen_core import JSON_DATA_CONTENT_TYPE, try_get_known_serializers_for_type
+
+from .agents import (QueryAnalyzerRequest, ActionPredictorRequest, CommandGeneratorRequest, FusedPlannerRequest,
+                     ContextVerifierRequest, FinalOutputRequest, StepPlanBatch, QueryAnalysisLLMResponse,
+                     ToolCommandLLMResponse, ActionPredictonLLMResponse, ActionBatchLLMResponse,
+                     ContextVerifierLLMResponse)
+from .dag import DagPlannerRequest, DagPlanLLMResponse
+from .tools import ToolRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+FRONT_GROUP = "front"
+FRONT_AGENTS = ("OrchestratorAgent", "FinalOutputAgent")
+
+
+@dataclass
+class DistributedConfig:
+    """
+    Placement of the agents and tools of a `Runtime` running on the autogen gRPC worker runtime.
+
+    Every node of a deployment connects to the same gRPC host and registers only the agent
+    types placed in its group; the host routes each message to a node hosting the receiving
+    agent type. The node running the front group owns the sessions: it hosts the Orchestrator
+    and the FinalOutputAgent, which write to the session queues, and is the only node accepting
+    user requests.
+
+    Attributes:
+        host_address (str): Address of the gRPC host, e.g. "localhost:50051".
+        placement (dict[str, str]): Maps agent types, such as "ContextVerifier", "CommandGenerator"
+            or a tool id, to the group of nodes hosting them. Agent types not listed are hosted
+            by the front group.
+        group (str): The group of this node. Defaults to "front".
+
+    Raises:
+        ValueError: If the Orchestrator or the FinalOutputAgent is placed outside the front group.
+    """
+    host_address: str = "localhost:50051"
+    placement: dict[str, str] = field(default_factory=dict)
+    group: str = FRONT_GROUP
+
+    def __post_init__(self):
+        for agent_type in FRONT_AGENTS:
+            if self.group_of(agent_type) != FRONT_GROUP:
+                raise ValueError(f"{agent_type} must be placed in the {FRONT_GROUP} group.")
+
+    def group_of(self, agent_type: str) -> str:
+        """
+        Returns the group of nodes hosting the agent type.
+        """
+        return self.placement.get(agent_type, FRONT_GROUP)
+
+    def hosts(self, agent_type: str) -> bool:
+        """
+        Returns whether this node hosts the agent type.
+        """
+        return self.group_of(agent_type) == self.group
+
+    @property
+    def is_front(self) -> bool:
+        """
+        Returns whether this node is the front node owning the sessions.
+        """
+        return self.group == FRONT_GROUP
+
+
+class StrMessageSerializer:
+    """
+    Serializes plain strings, such as the session bootstrap message and the answer of the
+    FinalOutputAgent, as JSON strings.
+    """
+
+    @property
+    def data_content_type(self) -> str:
+        return JSON_DATA_CONTENT_TYPE
+
+    @property
+    def type_name(self) -> str:
+        return "str"
+
+    def deserialize(self, payload: bytes) -> str:
+        return json.loads(payload.decode("utf-8"))
+
+    def serialize(self, message: str) -> bytes:
+        return json.dumps(message).encode("utf-8")
+
+
+def message_types(tool_registry: ToolRegistry) -> list[type]:
+    """
+    Lists the types of all messages exchanged between agents and tools.
+
+    Args:
+        tool_registry (ToolRegistry): The registry of the registered tools, whose input and
+            output models are exchanged with the tool agents.
+
+    Returns:
+        list[type]: The request and response types of the internal agents and the tools.
+    """
+    from .runtime import UserRequest
+    types = [
+        UserRequest,
+        QueryAnalyzerRequest, QueryAnalysisLLMResponse,
+        ActionPredictorRequest, ActionPredictonLLMResponse, ActionBatchLLMResponse,
+        CommandGeneratorRequest, ToolCommandLLMResponse,
+        FusedPlannerRequest, StepPlanBatch,
+        ContextVerifierRequest, ContextVerifierLLMResponse,
+        FinalOutputRequest,
+        DagPlannerRequest, DagPlanLLMResponse,
+    ]
+    for compiled_card in tool_registry.cards.values():
+        types.extend((compiled_card.card.inputs, compiled_card.card.outputs))
+    return types
+
+
+def register_serializers(runtime: Any, types: list[type]):
+    """
+    Registers the serializers of the given message types, and of plain strings, with a gRPC worker runtime.
+
+    Args:
+        runtime (GrpcWorkerAgentRuntime): The worker runtime.
+        types (list[type]): Dataclass or pydantic message types.
+    """
+    runtime.add_message_serializer(StrMessageSerializer())
+    for message_type in types:
+        runtime.add_message_serializer(try_get_known_serializers_for_type(message_type))
+
+
+def _grpc():
+    try:
+        from autogen_ext.runtimes import grpc
+    except ImportError as e:
+        raise ImportError(
+            "Distributed mode requires the autogen gRPC runtime. "
+            "Install it with `pip install \"autogen-ext[grpc]\"`.") from e
+    return grpc
+
+
+def create_worker_runtime(host_address: str) -> Any:
+    """
+    Creates a gRPC worker runtime connecting to the given host. It is started by `Runtime.start`.
+
+    Args:
+        host_address (str): Address of the gRPC host.
+
+    Returns:
+        GrpcWorkerAgentRuntime: The worker runtime.
+
+    Raises:
+        ImportError: If `autogen-ext[grpc]` is not installed.
+    """
+    return _grpc().GrpcWorkerAgentRuntime(host_address=host_address)
+
+
+async def start_host(address: str = "localhost:50051") -> Any:
+    """
+    Starts the gRPC host routing messages between the nodes of a deployment.
+
+    Args:
+        address (str, optional): Address the host listens on. Defaults to "localhost:50051".
+
+    Returns:
+        GrpcWorkerAgentRuntimeHost: The started host. Stop it with `await host.stop()`.
+
+    Raises:
+        ImportError: If `autogen-ext[grpc]` is not installed.
+    """
+    host = _grpc().GrpcWorkerAgentRuntimeHost(address=address)
+    host.start()
+    logger.debug(f"gRPC host listening on {address}")
+    return host
+
+
+async def serve_agents(config: DistributedConfig, tools: Optional[dict] = None, **runtime_options: Any):
+    """
+    Runs a worker node hosting the agents and tools placed in its group until it receives
+    SIGINT or SIGTERM.
+
+    All tools of the deployment must be registered on every node, even the ones the node does
+    not host, because planners build their prompts from the full tool registry.
+
+    Example:
+        Run the host, a node hosting the ContextVerifier and the tools, and the front node:
+
+            placement = {"ContextVerifier": "workers", "SearchEngineTool": "workers"}
+            host = await start_host("localhost:50051")
+            # on the worker node
+            await serve_agents(DistributedConfig("localhost:50051", placement, group="workers"),
+                               tools={"SearchEngineTool": SearchEngineTool})
+            # on the front node
+            runtime = Runtime(distributed=DistributedConfig("localhost:50051", placement))
+            runtime.register_tool("SearchEngineTool", SearchEngineTool)
+            await runtime.start()
+
+    Args:
+        config (DistributedConfig): The placement and the group of this node.
+        tools (dict[str, type[Tool]], optional): The tools of the deployment by name.
+        **runtime_options: Keyword arguments of the `Runtime` of this node.
+    """
+    from .runtime import Runtime
+    runtime = Runtime(distributed=config, **runtime_options)
+    for tool_name, tool in (tools or {}).items():
+        runtime.register_tool(tool_name, tool)
+    await runtime.start()
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    logger.debug(f"Serving group {config.group} on {config.host_address}")
+    try:
+        await stopped.wait()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        await runtime.stop()
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+import asyncio
+import logging
+import threading
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+class ToolExecutor:
+    """
+    Thread pool running blocking tool code off the event loop.
+
+    Tools declared as blocking, and tools offloading individual blocking calls, run their code
+    on this pool so a slow lookup does not stall every other session sharing the event loop.
+
+    Attributes:
+        max_workers (int): The number of worker threads.
+        metrics (MetricsRegistry): Registry receiving the pool metrics.
+    """
+
+    def __init__(self, max_workers: int = 8, metrics: Optional[MetricsRegistry] = None):
+        self.max_workers = max_workers
+        self.metrics = metrics or MetricsRegistry()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="otools-tool")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._peak_running = 0
+
+        self.metrics.register_gauge("tool_executor_workers", lambda: self.max_workers)
+        self.metrics.register_gauge("tool_executor_running", lambda: self._running)
+        self.metrics.register_gauge("tool_executor_queued", lambda: self._in_flight - self._running)
+        self.metrics.register_gauge("tool_executor_saturation", lambda: self._running / self.max_workers)
+        self.metrics.register_gauge("tool_executor_peak_running", lambda: self._peak_running)
+
+    def _call(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self._running += 1
+            self._peak_running = max(self._peak_running, self._running)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs a blocking callable on the pool and waits for its result without blocking the event loop.
+
+        Args:
+            fn (Callable): The blocking callable.
+            *args: Positional arguments for the callable.
+            **kwargs: Keyword arguments for the callable.
+
+        Returns:
+            Any: The value returned by the callable.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                self.metrics.inc("tool_executor_saturated_submissions")
+            self._in_flight += 1
+        self.metrics.inc("tool_executor_submitted")
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, partial(self._call, fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        """
+        Returns the pool statistics.
+
+        Returns:
+            dict: Number of workers, running and queued calls, saturation and peak running calls.
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": self._in_flight - self._running,
+                "saturation": self._running / self.max_workers,
+                "peak_running": self._peak_running,
+            }
+
+    def shutdown(self, wait: bool = False):
+        """
+        Shuts the pool down. Calls already submitted are completed.
+
+        Args:
+            wait (bool, optional): Whether to block until the running calls finish. Defaults to False.
+        """
+        self._pool.shutdown(wait=wait)
+
+
+_default_executor: Optional[ToolExecutor] = None
+
+
+def default_tool_executor() -> ToolExecutor:
+    """
+    Returns a process-wide executor used by tools that are run outside of a `Runtime`.
+
+    Returns:
+        ToolExecutor: The lazily created default executor.
+    """
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ToolExecutor()
+    return _default_executor
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+import json
+import logging
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("otools_autogen")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a text, using the common four characters per token heuristic.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class ActionStep:
+    """
+    A single step recorded in the action history.
+
+    Attributes:
+        step_no (int): The step number.
+        tool_name (str): The name of the tool used in the step.
+        sub_goal (str): The sub-goal the tool was asked to achieve.
+        argument (str): The argument the tool was invoked with.
+        result (Any): The tool result, or an error message.
+        calls (Optional[list[ActionStep]]): The tool calls of a step that ran several independent
+            tools in parallel. The other fields then summarize the calls.
+    """
+    step_no: int
+    tool_name: str
+    sub_goal: str
+    argument: str
+    result: Any
+    calls: Optional[list["ActionStep"]] = None
+
+    def result_text(self) -> str:
+        if self.calls is not None:
+            return "\n".join(call.result_text() for call in self.calls)
+        if isinstance(self.result, BaseModel):
+            return self.result.model_dump_json()
+        return str(self.result)
+
+
+class ActionHistory:
+    """
+    Action history of a session, rendered for prompts within a token budget.
+
+    The most recent steps are always rendered verbatim. When the rendered history exceeds the
+    token budget, the results of older steps are first truncated to short summaries and, if that
+    is not enough, reduced to structured digests holding only the tool, sub-goal and result size.
+
+    Attributes:
+        token_budget (int): The estimated token budget of the rendered history.
+        keep_recent (int): Number of most recent steps that are never compacted.
+        summary_chars (int): Number of result characters kept in a truncated summary.
+        tokens_saved (int): Estimated tokens saved by compaction in the latest render.
+    """
+
+    def __init__(self, token_budget: int = 8000, keep_recent: int = 2, summary_chars: int = 400):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_chars = summary_chars
+        self.tokens_saved = 0
+        self._steps: list[ActionStep] = []
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    @property
+    def steps(self) -> list[ActionStep]:
+        return list(self._steps)
+
+    def add_step(self, step_no: int, tool_name: str, sub_goal: str, argument: str, result: Any):
+        """
+        Records a step.
+
+        Args:
+            step_no (int): The step number.
+            tool_name (str): The name of the tool used in the step.
+            sub_goal (str): The sub-goal the tool was asked to achieve.
+            argument (str): The argument the tool was invoked with.
+            result (Any): The tool result, or an error message.
+        """
+        self._steps.append(ActionStep(step_no, tool_name, sub_goal, argument, result))
+
+    def add_batch(self, step_no: int, calls: list[ActionStep]):
+        """
+        Records a step that ran several independent tool calls in parallel as a single step.
+
+        Args:
+            step_no (int): The step number.
+            calls (list[ActionStep]): The tool calls of the step with their results.
+        """
+        self._steps.append(ActionStep(
+            step_no=step_no,
+            tool_name=", ".join(call.tool_name for call in calls),
+            sub_goal="; ".join(call.sub_goal for call in calls),
+            argument=json.dumps([call.argument for call in calls], ensure_ascii=False),
+            result=None,
+            calls=list(calls)))
+
+    def _entry(self, step: ActionStep, mode: str) -> dict:
+        if step.calls is not None:
+            return {"parallel_tool_calls": [self._entry(call, mode) for call in step.calls]}
+        entry = {
+            "tool_name": step.tool_name,
+            "sub_goal": step.sub_goal,
+            "argument": step.argument,
+        }
+        text = step.result_text()
+        if mode == "verbatim" or len(text) <= self.summary_chars:
+            entry["result"] = text
+        elif mode == "summary":
+            entry["result"] = f"{text[:self.summary_chars]}... [{len(text) - self.summary_chars} more characters truncated]"
+        else:
+            entry["result_digest"] = f"{len(text)} characters, omitted to save context"
+        return entry
+
+    def _render(self, modes: list[str]) -> str:
+        return json.dumps(
+            {f"Step {step.step_no}": self._entry(step, mode) for step, mode in zip(self._steps, modes)},
+            ensure_ascii=False, indent=1)
+
+    def render(self) -> str:
+        """
+        Renders the history for a prompt, compacting older steps when the token budget is exceeded.
+
+        Returns:
+            str: The rendered history.
+        """
+        modes = ["verbatim"] * len(self._steps)
+        verbatim = self._render(modes)
+        rendered = verbatim
+        compactable = range(max(len(self._steps) - self.keep_recent, 0))
+        for mode in ("summary", "digest"):
+            for i in compactable:
+                if estimate_tokens(rendered) <= self.token_budget:
+                    break
+                modes[i] = mode
+                rendered = self._render(modes)
+        saved = estimate_tokens(verbatim) - estimate_tokens(rendered)
+        self.tokens_saved = max(saved, 0)
+        if saved > 0:
+            logger.debug(f"ActionHistory compacted {len(self._steps)} steps, saved ~{saved} tokens")
+        return rendered
+
+    def __str__(self) -> str:
+        return self.render()
@@ -0,0 +1,184 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import asyncio
+import importlib.util
+import json
+import logging
+
+import httpx
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+@dataclass
+class HTTPResponse:
+    """
+    A fully read HTTP response.
+
+    Attributes:
+        status_code (int): The HTTP status code.
+        reason (str): The HTTP reason phrase.
+        url (str): The final request URL.
+        headers (dict): The response headers.
+        content (bytes): The response body, cut at the maximum response size.
+        truncated (bool): True if the body was cut because it exceeded the maximum response size.
+    """
+    status_code: int
+    reason: str
+    url: str
+    headers: dict = field(default_factory=dict)
+    content: bytes = b""
+    truncated: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.content.decode(encoding, errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class HTTPClientPool:
+    """
+    Shared async HTTP client with keep-alive connection pooling for tools.
+
+    Connections are reused across calls and sessions. HTTP/2 is negotiated when the `h2`
+    package is installed. The number of concurrent requests to a single host is bounded, and
+    response bodies are streamed and cut at a maximum size.
+
+    Attributes:
+        max_connections (int): Maximum number of connections in the pool.
+        max_keepalive_connections (int): Maximum number of idle keep-alive connections.
+        max_connections_per_host (int): Maximum number of concurrent requests to a single host.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        connect_timeout (float): Connection timeout in seconds.
+        read_timeout (float): Read timeout in seconds.
+        max_response_bytes (int): Default maximum size of a response body.
+        http2 (bool): Whether HTTP/2 is enabled.
+    """
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 max_connections_per_host: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 max_response_bytes: int = 5 * 1024 * 1024,
+                 http2: Optional[bool] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_response_bytes = max_response_bytes
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self.metrics = metrics or MetricsRegistry()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_connections_per_host)
+            self._host_limits[host] = semaphore
+        return semaphore
+
+    async def request(self, method: str, url: str, *,
+                      params: Optional[dict] = None,
+                      headers: Optional[dict] = None,
+                      json: Any = None,
+                      content: Optional[bytes] = None,
+                      max_bytes: Optional[int] = None,
+                      timeout: Optional[float] = None) -> HTTPResponse:
+        """
+        Sends a request through the pooled client and reads the streamed body up to a maximum size.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            params (dict, optional): Query parameters.
+            headers (dict, optional): Request headers.
+            json (Any, optional): A JSON body.
+            content (bytes, optional): A raw body.
+            max_bytes (int, optional): Maximum size of the body. Defaults to `max_response_bytes`.
+            timeout (float, optional): Read timeout for this request. Defaults to `read_timeout`.
+
+        Returns:
+            HTTPResponse: The response. The body is cut, and `truncated` set, when it exceeds `max_bytes`.
+
+        Raises:
+            httpx.HTTPError: If the request fails at the transport level or times out.
+        """
+        max_bytes = self.max_response_bytes if max_bytes is None else max_bytes
+        request_timeout = httpx.Timeout(timeout or self.read_timeout, connect=self.connect_timeout)
+        client = self._get_client()
+        host = httpx.URL(url).host
+        async with self._host_limit(host):
+            self.metrics.inc("http_requests", host=host)
+            async with client.stream(method, url, params=params, headers=headers, json=json,
+                                     content=content, timeout=request_timeout) as response:
+                body = bytearray()
+                truncated = False
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > max_bytes:
+                        del body[max_bytes:]
+                        truncated = True
+                        break
+                if truncated:
+                    self.metrics.inc("http_truncated_responses", host=host)
+                    logger.debug(f"HTTPClientPool response from {url} truncated at {max_bytes} bytes")
+                return HTTPResponse(
+                    status_code=response.status_code,
+                    reason=response.reason_phrase,
+                    url=str(response.url),
+                    headers=dict(response.headers),
+                    content=bytes(body),
+                    truncated=truncated,
+                )
+
+    async def aclose(self):
+        """
+        Closes the pooled client and its connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_default_pool: Optional[HTTPClientPool] = None
+
+
+def default_http_pool() -> HTTPClientPool:
+    """
+    Returns a process-wide pool used by tools that are run outside of a `Runtime`.
+
+    Returns:
+        HTTPClientPool: The lazily created default pool.
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = HTTPClientPool()
+    return _default_pool
@@ -0,0 +1,403 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Callable, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
+
+from .cache import ResponseCache, cache_key
+from .metrics import MetricsRegistry
+from .history import estimate_tokens
+from .resilience import ResiliencePolicy, ResilientCaller
+from .routing import ModelRouter
+from .scheduler import LLMScheduler
+from .tracing import Tracer, current_span
+from .usage import UsageTracker
+
+logger = logging.getLogger("otools_autogen")
+
+
+class LLMClientPool:
+    """
+    Shared, pooled LLM client layer used by all agents and LLM-backed tools.
+
+    A single `AsyncOpenAI` client is kept per (api_key, base_url) pair. Each client is backed by
+    a keep-alive HTTP connection pool, so consecutive completions reuse already established
+    connections instead of paying for a new TCP/TLS handshake on every call. Concurrency towards
+    every model is bounded by a per-model semaphore. Token usage of every completion, including
+    the prompt tokens served from the provider's prompt cache, is recorded in the metrics.
+    Every completion runs under the pool's resilience policy: a per-attempt deadline, retries of
+    transient failures with jittered exponential backoff, optional hedged requests and a circuit
+    breaker per model.
+
+    Attributes:
+        api_key (str): Default API key, read from `OPENROUTER_API_KEY` when not provided.
+        base_url (str): Default API base URL, read from `OPENROUTER_BASE_PATH` when not provided.
+        max_connections (int): Maximum number of connections held by each client pool.
+        max_keepalive_connections (int): Maximum number of idle keep-alive connections per client pool.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        timeout (float): Default request timeout in seconds.
+        model_concurrency (dict[str, int]): Per-model limit of concurrent in-flight completions.
+        default_model_concurrency (int): Limit used for models not listed in `model_concurrency`.
+        cache_hints (Optional[bool]): Whether prompts carry explicit `cache_control` breakpoints.
+            None enables them for OpenRouter base URLs, which forward them to providers that
+            need them; providers with automatic prefix caching do not need them.
+        metrics (MetricsRegistry): Registry receiving request and token usage metrics.
+        completion_cache (Optional[ResponseCache]): Cache of structured completions, used by
+            calls made with `cache=True`. None disables completion caching.
+        resilience (ResilientCaller): Applies the resilience policy to every completion.
+        tracer (Tracer): Records an `llm.<agent>` span for every completion. Agents and tools
+            use it for their own spans as well.
+        usage (UsageTracker): Accounts the token usage and cost of every completion, attributed
+            to the session of the enclosing span.
+        scheduler (Optional[LLMScheduler]): Admits every completion attempt under per-model rate
+            limits, by priority and fairly across sessions. None sends calls without waiting.
+        router (ModelRouter): Selects the model of every call by the calling agent or tool and
+            escalates calls whose completion fails validation to stronger models.
+    """
+
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0,
+                 timeout: float = 120.0,
+                 model_concurrency: Optional[dict[str, int]] = None,
+                 default_model_concurrency: int = 16,
+                 cache_hints: Optional[bool] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 completion_cache: Optional[ResponseCache] = None,
+                 resilience: Optional[ResiliencePolicy] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.model_concurrency = dict(model_concurrency or {})
+        self.default_model_concurrency = default_model_concurrency
+        self.cache_hints = cache_hints
+        self.resilience = ResilientCaller(resilience)
+        self.tracer = Tracer()
+        self.usage = UsageTracker()
+        self.scheduler: Optional[LLMScheduler] = None
+        self.router = ModelRouter()
+        self.metrics = metrics or MetricsRegistry()
+        self.completion_cache = completion_cache
+        self._clients: dict[tuple, AsyncOpenAI] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._closed = False
+
+    @property
+    def metrics(self) -> MetricsRegistry:
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: MetricsRegistry):
+        self._metrics = metrics
+        self.resilience.metrics = metrics
+        self.tracer.metrics = metrics
+        self.router.metrics = metrics
+
+    def get_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """
+        Returns the pooled client for the given credentials, creating it on first use.
+
+        Args:
+            api_key (str, optional): API key. Defaults to the pool key or `OPENROUTER_API_KEY`.
+            base_url (str, optional): API base URL. Defaults to the pool URL or `OPENROUTER_BASE_PATH`.
+
+        Returns:
+            AsyncOpenAI: A client sharing the keep-alive connection pool for these credentials.
+
+        Raises:
+            RuntimeError: If the pool has already been closed.
+        """
+        if self._closed:
+            raise RuntimeError("LLMClientPool is closed.")
+        api_key = api_key or self.api_key or os.getenv("OPENROUTER_API_KEY")
+        base_url = base_url or self.base_url or os.getenv("OPENROUTER_BASE_PATH")
+        key = (api_key, base_url)
+        client = self._clients.get(key)
+        if client is None:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.timeout,
+            )
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            self._clients[key] = client
+            logger.debug(f"LLMClientPool created client for base url {base_url}")
+        return client
+
+    def limit(self, model: str) -> asyncio.Semaphore:
+        """
+        Returns the semaphore bounding concurrent completions for the given model.
+
+        Args:
+            model (str): The model name.
+
+        Returns:
+            asyncio.Semaphore: The per-model concurrency limiter.
+        """
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.model_concurrency.get(model, self.default_model_concurrency))
+            self._semaphores[model] = semaphore
+        return semaphore
+
+    @property
+    def use_cache_hints(self) -> bool:
+        """
+        Returns whether agents should add explicit prompt cache breakpoints to their prompts.
+        """
+        if self.cache_hints is not None:
+            return self.cache_hints
+        return "openrouter" in (self.base_url or os.getenv("OPENROUTER_BASE_PATH") or "")
+
+    def _record_usage(self, completion, model: str, agent: Optional[str]):
+        self.metrics.inc("llm_requests", model=model, agent=agent)
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        self.metrics.inc("llm_prompt_tokens", usage.prompt_tokens or 0, model=model, agent=agent)
+        self.metrics.inc("llm_completion_tokens", usage.completion_tokens or 0, model=model, agent=agent)
+        self.metrics.inc("llm_cached_prompt_tokens", cached_tokens, model=model, agent=agent)
+        span = current_span()
+        recorded = self.usage.record(
+            span.attributes.get("session_id") if span is not None else None, agent, model,
+            usage.prompt_tokens or 0, usage.completion_tokens or 0, cached_tokens)
+        if recorded.cost:
+            self.metrics.inc("llm_cost", recorded.cost, model=model, agent=agent)
+        if span is not None:
+            span.add("prompt_tokens", recorded.prompt_tokens)
+            span.add("completion_tokens", recorded.completion_tokens)
+            span.add("cached_prompt_tokens", recorded.cached_prompt_tokens)
+            span.add("cost", recorded.cost)
+        logger.debug(f"LLMClientPool {agent} used {usage.prompt_tokens} prompt tokens "
+                     f"({cached_tokens} cached) and {usage.completion_tokens} completion tokens")
+
+    @staticmethod
+    def _normalize_messages(messages: list[dict]) -> list[dict]:
+        def normalize(value):
+            if isinstance(value, dict):
+                return {key: normalize(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [normalize(item) for item in value]
+            if isinstance(value, str) and value.startswith("data:"):
+                return "sha256:" + hashlib.sha256(value.encode("utf-8")).hexdigest()
+            return value
+        return normalize(messages)
+
+    def _admission(self, messages: list[dict]) -> tuple[Optional[str], int]:
+        span = current_span()
+        session_id = span.attributes.get("session_id") if span is not None else None
+        estimated = estimate_tokens(json.dumps(self._normalize_messages(messages), ensure_ascii=False))
+        return session_id, estimated
+
+    def completion_cache_key(self, model: str, messages: list[dict], response_format: Optional[type] = None,
+                             **kwargs: Any) -> str:
+        """
+        Builds the completion cache key of a call.
+
+        Inline images are replaced by hashes of their content, so the key stays small and
+        identical images map to the same key.
+
+        Args:
+            model (str): The model name.
+            messages (list[dict]): Chat messages in OpenAI format.
+            response_format (type, optional): The pydantic model of the structured output.
+            **kwargs: Additional arguments of the completion call.
+
+        Returns:
+            str: The cache key.
+        """
+        response_schema = ""
+        if response_format is not None:
+            response_schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+        return cache_key(
+            model or "",
+            json.dumps(self._normalize_messages(messages), sort_keys=True, ensure_ascii=False),
+            getattr(response_format, "__qualname__", ""),
+            response_schema,
+            json.dumps(kwargs, sort_keys=True, default=str))
+
+    async def complete(self, messages: list[dict], model: Optional[str] = None,
+                       response_format: Optional[type] = None, agent: Optional[str] = None,
+                       cache: bool = False, validate: Optional[Callable[[Any], None]] = None,
+                       **kwargs: Any):
+        """
+        Runs a chat completion through the pooled client, respecting the per-model concurrency limit.
+        The model is selected by the router from the route of the calling agent; a completion that
+        fails validation is repeated on the next model of the route's escalation, if any.
+        Calls made with `cache=True` are served from the completion cache when one is configured.
+
+        Args:
+            messages (list[dict]): Chat messages in OpenAI format.
+            model (str, optional): The model used when the router has no route for the agent.
+                Defaults to the router's default model.
+            response_format (type, optional): A pydantic model for structured output. When provided the
+                completion is parsed and `choices[0].message.parsed` holds the model instance.
+            agent (str, optional): Name of the calling agent or tool, used for routing, logging and metrics.
+            cache (bool, optional): Whether the call may be answered from the completion cache.
+                Only callers whose completion depends on the prompt alone should set it.
+            validate (Callable[[Any], None], optional): Checks the completion and raises a pydantic
+                `ValidationError` or a `json.JSONDecodeError` if it is unusable, which escalates the
+                call when the route allows it.
+                Structured completions without a parsed output are always rejected before an
+                escalation. Completions of the last model of a route are not checked.
+            **kwargs: Additional arguments passed to the completion call.
+
+        Returns:
+            The chat completion returned by the provider.
+        """
+        with self.tracer.span(f"llm.{agent}") as span:
+            def check(completion, routed: str):
+                message = completion.choices[0].message
+                if response_format is not None and message.parsed is None:
+                    # Refusals and empty responses carry no parsed output; validating their content
+                    # raises the ValidationError that escalates the call.
+                    message.parsed = response_format.model_validate_json(message.content or "")
+                if validate is not None:
+                    validate(completion)
+                return completion
+
+            async def run(routed: str, can_escalate: bool):
+                span.set(model=routed)
+                if not (cache and self.completion_cache is not None):
+                    completion = await self._complete(routed, messages, response_format, agent, **kwargs)
+                    return check(completion, routed) if can_escalate else completion
+                key = self.completion_cache_key(routed, messages, response_format, **kwargs)
+                called = False
+
+                async def call() -> str:
+                    nonlocal called
+                    called = True
+                    completion = await self._complete(routed, messages, response_format, agent, **kwargs)
+                    if can_escalate:
+                        check(completion, routed)
+                    return completion.model_dump_json(warnings=False)
+
+                value = await self.completion_cache.get_or_call(key, call)
+                span.set(cache_hit=not called)
+                if response_format is not None:
+                    completion = ParsedChatCompletion[response_format].model_validate_json(value)
+                else:
+                    completion = ChatCompletion.model_validate_json(value)
+                return check(completion, routed) if can_escalate and not called else completion
+
+            return await self.router.call(agent, model, run)
+
+    async def _complete(self, model: str, messages: list[dict], response_format: Optional[type],
+                        agent: Optional[str], **kwargs: Any):
+        client = self.get_client()
+        if self.scheduler is not None:
+            session_id, estimated = self._admission(messages)
+
+        async def attempt():
+            if self.scheduler is not None:
+                await self.scheduler.acquire(model, estimated, session_id=session_id, agent=agent)
+            async with self.limit(model):
+                logger.debug(f"LLMClientPool completion for {agent} on model {model}")
+                if response_format is not None:
+                    return await client.beta.chat.completions.parse(
+                        model=model,
+                        messages=messages,
+                        response_format=response_format,
+                        **kwargs)
+                return await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    **kwargs)
+
+        completion = await self.resilience.call(model, attempt, agent=agent)
+        self._record_usage(completion, model, agent)
+        if self.scheduler is not None and completion.usage is not None:
+            self.scheduler.settle(model, estimated, completion.usage.total_tokens)
+        return completion
+
+    async def stream(self, messages: list[dict], model: Optional[str] = None, agent: Optional[str] = None,
+                     **kwargs: Any) -> AsyncIterator[str]:
+        """
+        Streams a chat completion through the pooled client, yielding content deltas as they arrive.
+        The per-model concurrency slot and the connection are held until the stream is exhausted
+        or closed; they are released as well when the consumer stops iterating or is cancelled.
+        Opening the stream is retried under the resilience policy, and every chunk must arrive
+        within its `call_timeout`; once content has been yielded, errors are raised to the caller. The stream is admitted by the scheduler once.
+        The model is selected by the router; streams are not escalated.
+
+        Args:
+            messages (list[dict]): Chat messages in OpenAI format.
+            model (str, optional): The model used when the router has no route for the agent.
+                Defaults to the router's default model.
+            agent (str, optional): Name of the calling agent or tool, used for routing, logging and metrics.
+            **kwargs: Additional arguments passed to the completion call.
+
+        Yields:
+            str: The content deltas of the completion.
+        """
+        model = self.router.model(agent, model)
+        client = self.get_client()
+        if self.scheduler is not None:
+            session_id, estimated = self._admission(messages)
+            await self.scheduler.acquire(model, estimated, session_id=session_id, agent=agent)
+        async with self.limit(model):
+            logger.debug(f"LLMClientPool streamed completion for {agent} on model {model}")
+            stream = await self.resilience.call(model, lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs), agent=agent, hedge=False)
+            try:
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await self.resilience.next_chunk(model, chunks)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.usage is not None:
+                        self._record_usage(chunk, model, agent)
+                        if self.scheduler is not None:
+                            self.scheduler.settle(model, estimated, chunk.usage.total_tokens)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # returns the connection to the pool when the consumer stops early or is cancelled
+                await stream.close()
+
+    async def aclose(self):
+        """
+        Closes all pooled clients and their connection pools.
+        """
+        self._closed = True
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.close()
+
+
+_default_pool: Optional[LLMClientPool] = None
+
+
+def default_llm_pool() -> LLMClientPool:
+    """
+    Returns a process-wide pool used by tools that are run outside of a `Runtime`.
+
+    Returns:
+        LLMClientPool: The lazily created default pool.
+    """
+    global _default_pool
+    if _default_pool is None or _default_pool._closed:
+        _default_pool = LLMClientPool()
+    return _default_pool
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from typing import Callable, Optional
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _metric_key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets.
+
+    Attributes:
+        buckets (tuple[float, ...]): Upper bounds of the buckets; values above the last one
+            fall into an implicit overflow bucket.
+        count (int): Number of observed values.
+        sum (float): Sum of the observed values.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates the q-th quantile, between 0 and 1, as the upper bound of the bucket containing it.
+        Returns None if nothing was observed and infinity if it lies in the overflow bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+class MetricsRegistry:
+    """
+    In-process registry of runtime metrics.
+
+    Counters accumulate values, gauges hold the last set value, gauge callbacks are
+    evaluated when a snapshot is taken, and histograms hold distributions such as latencies. Metrics can carry labels, which become part of the
+    metric key in the snapshot, e.g. `llm_requests{model=gpt-4o}`.
+    """
+
+    def __init__(self):
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._gauge_callbacks: dict[str, Callable[[], float]] = {}
+        self._histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The counter name.
+            value (float, optional): The increment. Defaults to 1.
+            **labels: Labels of the counter.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Sets a gauge to a value.
+
+        Args:
+            name (str): The gauge name.
+            value (float): The value.
+            **labels: Labels of the gauge.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float], **labels):
+        """
+        Registers a gauge whose value is read from a callback when a snapshot is taken.
+
+        Args:
+            name (str): The gauge name.
+            callback (Callable[[], float]): Returns the current value.
+            **labels: Labels of the gauge.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauge_callbacks[key] = callback
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Records a value in a histogram.
+
+        Args:
+            name (str): The histogram name.
+            value (float): The observed value, e.g. a latency in seconds.
+            **labels: Labels of the histogram.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        """
+        Returns a histogram, or None if nothing was observed in it.
+        """
+        with self._lock:
+            return self._histograms.get(_metric_key(name, labels))
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Returns the current value of a counter, or 0 if it was never incremented.
+        """
+        with self._lock:
+            return self._counters.get(_metric_key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current values of all metrics.
+
+        Returns:
+            dict: A dictionary with `counters` and `gauges` mappings of metric keys to values, and a
+                `histograms` mapping of metric keys to their count, sum, cumulative bucket counts
+                and estimated p50, p95 and p99.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+            histograms = {key: histogram.snapshot() for key, histogram in self._histograms.items()}
+        for key, callback in callbacks.items():
+            gauges[key] = callback()
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
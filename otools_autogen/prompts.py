@@ -0,0 +1,57 @@
+from typing import Sequence
+
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def toolbox_prefix(tool_names: Sequence[str], tools_metadata: str) -> str:
+    """
+    Renders the toolbox block placed at the start of agent prompts.
+
+    The block only depends on the registered tool set, so it is byte-identical for every
+    agent and session and forms a prefix the provider can cache across all of them.
+
+    Args:
+        tool_names (Sequence[str]): The registered tool names.
+        tools_metadata (str): The prompt-ready metadata of all tools.
+
+    Returns:
+        str: The toolbox block.
+    """
+    return f"""Available tools: {list(tool_names)}
+
+Metadata for the tools:
+{tools_metadata}"""
+
+
+def build_messages(static_blocks: Sequence[str],
+                   content: str,
+                   images: Sequence[str] = (),
+                   cache_hints: bool = False) -> list[dict]:
+    """
+    Assembles chat messages with a stable, cacheable prefix.
+
+    The static blocks of a prompt, such as the toolbox block and the agent's instructions, are
+    put in a leading system message in the given order. Everything that changes between calls,
+    such as the date, the query, the memory or images, follows in the user message. Providers
+    that cache prompt prefixes can therefore reuse the static part across steps and sessions.
+
+    Args:
+        static_blocks (Sequence[str]): The static blocks, most widely shared first.
+        content (str): The variable content of the call.
+        images (Sequence[str], optional): Inline image data URLs appended to the user message.
+        cache_hints (bool, optional): If True, marks the end of every static block with a
+            `cache_control` breakpoint, for providers that need explicit cache hints.
+
+    Returns:
+        list[dict]: The chat messages.
+    """
+    static_parts = [{"type": "text", "text": block} for block in static_blocks if block]
+    if cache_hints:
+        for part in static_parts:
+            part["cache_control"] = CACHE_CONTROL
+    images_part = [{"type": "image_url", "image_url": {"url": image}} for image in images]
+    return [
+        {"role": "system", "content": static_parts},
+        {"role": "user", "content": [{"type": "text", "text": content}] + images_part},
+    ]
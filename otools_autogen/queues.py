@@ -0,0 +1,211 @@
+from collections import deque
+from dataclasses import replace
+from typing import Any, Optional
+import asyncio
+import enum
+import logging
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+class QueuePolicy(enum.Enum):
+    """
+    Policy applied when a session's client queue is full.
+
+    Attributes:
+        BLOCK: The producer waits for the client to consume responses, up to the put timeout.
+        DROP: Intermediate responses are dropped.
+        COALESCE: The newest intermediate response replaces the last queued intermediate one,
+            so the client receives the latest state.
+    """
+    BLOCK = "block"
+    DROP = "drop"
+    COALESCE = "coalesce"
+
+
+class QueueClosed(RuntimeError):
+    """
+    Raised by `ClientQueue.get` when the queue is closed and holds no more responses.
+    """
+
+
+class ClientQueue:
+    """
+    Bounded queue of responses sent to a session's client.
+
+    Intermediate responses (ToolRequest and ToolResponse events) are subject to the queue policy
+    once `maxsize` responses are waiting. FinalOutputDelta events are never dropped, whatever the
+    policy: when the queue is full they are merged into the last queued delta, so the client
+    receives the whole answer text in order. Other responses, including the final one, are always
+    delivered; when the queue is full they displace the oldest queued intermediate response instead.
+
+    The queue is therefore bounded by `maxsize` only as long as it holds a response it may drop
+    or merge into. A full queue holding none, e.g. full of undelivered deltas and final responses
+    of several requests, grows past `maxsize` rather than lose them; every such response is
+    counted in the `client_queue_overflow` metric. Producers under the BLOCK policy wait first,
+    so this only happens when the client stops consuming.
+
+    Once closed, the queue drops new responses, releases blocked producers and, after the
+    queued responses are consumed, raises `QueueClosed` from `get` instead of waiting.
+
+    Attributes:
+        maxsize (int): Number of responses held before the policy applies.
+        policy (QueuePolicy): The policy applied when the queue is full.
+        put_timeout (Optional[float]): Seconds a producer waits under the BLOCK policy before the
+            response is dropped. None waits indefinitely.
+        dropped (int): Number of responses dropped from this queue.
+        coalesced (int): Number of responses coalesced into a newer one.
+    """
+
+    INTERMEDIATE_TYPES = frozenset({"ToolRequest", "ToolResponse", "FinalOutputDelta"})
+
+    def __init__(self, maxsize: int = 100, policy: QueuePolicy = QueuePolicy.DROP,
+                 put_timeout: Optional[float] = 30.0, metrics: Optional[MetricsRegistry] = None):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.metrics = metrics or MetricsRegistry()
+        self.dropped = 0
+        self.coalesced = 0
+        self._items: deque = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._closed = False
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def full(self) -> bool:
+        return len(self._items) >= self.maxsize
+
+    def is_intermediate(self, item: Any) -> bool:
+        return not getattr(item, "final", False) and getattr(item, "type", None) in self.INTERMEDIATE_TYPES
+
+    def is_droppable(self, item: Any) -> bool:
+        return self.is_intermediate(item) and item.type != "FinalOutputDelta"
+
+    def _append(self, item: Any):
+        self._items.append(item)
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+
+    def _drop(self, reason: str = "full"):
+        self.dropped += 1
+        self.metrics.inc("client_queue_dropped", reason=reason)
+
+    def _coalesce_into(self, item: Any) -> bool:
+        for i in range(len(self._items) - 1, -1, -1):
+            queued = self._items[i]
+            if self.is_droppable(queued):
+                del self._items[i]
+                self._items.append(item)
+                self.coalesced += 1
+                self.metrics.inc("client_queue_coalesced")
+                return True
+        return False
+
+    def _merge_delta(self, item: Any) -> bool:
+        for i in range(len(self._items) - 1, -1, -1):
+            queued = self._items[i]
+            if queued.type == "FinalOutputDelta":
+                self._items[i] = replace(queued, message=queued.message + item.message)
+                self.coalesced += 1
+                self.metrics.inc("client_queue_coalesced")
+                return True
+        return False
+
+    def _evict_intermediate(self) -> bool:
+        for i, queued in enumerate(self._items):
+            if self.is_droppable(queued):
+                del self._items[i]
+                self._drop()
+                return True
+        return False
+
+    def put_nowait(self, item: Any):
+        """
+        Puts a response on the queue without waiting, applying the DROP or COALESCE policy when full.
+        Under the BLOCK policy an intermediate response is dropped if the queue is full.
+        FinalOutputDelta events are merged into the last queued delta instead of being dropped.
+        Responses that are never dropped are appended past `maxsize` when nothing can make room.
+
+        Args:
+            item (Any): The response.
+        """
+        if self._closed:
+            self._drop("closed")
+            return
+        if not self.full():
+            self._append(item)
+            return
+        if self.is_intermediate(item) and not self.is_droppable(item):
+            if not self._merge_delta(item):
+                self._append_evicting(item)
+            return
+        if self.is_intermediate(item):
+            if self.policy == QueuePolicy.COALESCE and self._coalesce_into(item):
+                return
+            self._drop()
+            return
+        self._append_evicting(item)
+
+    def _append_evicting(self, item: Any):
+        if not self._evict_intermediate():
+            self.metrics.inc("client_queue_overflow")
+        self._append(item)
+
+    async def put(self, item: Any):
+        """
+        Puts a response on the queue. Under the BLOCK policy an intermediate response waits for free
+        space, up to `put_timeout`, and is dropped if none becomes available; a FinalOutputDelta
+        is merged into the last queued delta instead.
+
+        Args:
+            item (Any): The response.
+        """
+        if self.policy == QueuePolicy.BLOCK and self.is_intermediate(item) and not self._closed:
+            while self.full() and not self._closed:
+                try:
+                    await asyncio.wait_for(self._not_full.wait(), self.put_timeout)
+                except asyncio.TimeoutError:
+                    if not self.is_droppable(item):
+                        break
+                    self._drop("timeout")
+                    return
+        self.put_nowait(item)
+
+    async def get(self) -> Any:
+        """
+        Removes and returns the next response, waiting until one is available.
+
+        Returns:
+            Any: The response.
+
+        Raises:
+            QueueClosed: If the queue is closed and empty.
+        """
+        while not self._items:
+            if self._closed:
+                raise QueueClosed("Client queue is closed.")
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item = self._items.popleft()
+        if not self.full():
+            self._not_full.set()
+        return item
+
+    def close(self):
+        """
+        Closes the queue. Responses put afterwards are dropped, blocked producers are released and
+        consumers waiting on the empty queue receive `QueueClosed`.
+        """
+        self._closed = True
+        self._not_full.set()
+        self._not_empty.set()
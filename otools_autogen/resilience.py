@@ -0,0 +1,348 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+import openai
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised when a call is rejected because the circuit breaker of its model is open.
+    """
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Returns whether a failed call may succeed when it is repeated: timeouts, connection errors,
+    rate limits and server errors. Other errors, such as invalid requests, are not retried.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Retries of failed calls with jittered exponential backoff.
+
+    Attributes:
+        max_attempts (int): Maximum number of attempts, including the first one. Defaults to 3.
+        base_delay (float): Backoff before the first retry in seconds. Defaults to 0.5.
+        max_delay (float): Upper bound of the backoff in seconds. Defaults to 8.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the backoff after the given failed attempt, counted from 0, drawn uniformly
+        between zero and the exponential bound so concurrent retries spread out.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """
+    Hedged requests: when a call has not finished after the given latency percentile of recent
+    calls to the same model, a duplicate is sent and the first successful response is used.
+
+    Attributes:
+        percentile (float): Latency percentile, between 0 and 1, after which a duplicate is sent.
+            Defaults to 0.95.
+        min_samples (int): Number of recorded latencies needed before calls are hedged. Defaults to 20.
+        max_hedges (int): Maximum number of duplicates per call. Defaults to 1.
+    """
+    percentile: float = 0.95
+    min_samples: int = 20
+    max_hedges: int = 1
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    """
+    Resilience settings of the LLM calls made through an `LLMClientPool`.
+
+    Attributes:
+        call_timeout (Optional[float]): Seconds an attempt may take before it is cancelled and
+            counted as a retryable failure. None relies on the HTTP client timeout. Defaults to None.
+        retry (RetryPolicy): Retries of retryable failures.
+        hedge (Optional[HedgePolicy]): Hedged requests. None disables hedging. Defaults to None.
+        breaker_failure_threshold (int): Consecutive retryable failures of a model after which its
+            circuit opens and calls fail fast. Defaults to 5.
+        breaker_reset_timeout (float): Seconds an open circuit waits before letting a trial call
+            through. Defaults to 30.
+    """
+    call_timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    hedge: Optional[HedgePolicy] = None
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a single model.
+
+    The circuit opens after `failure_threshold` consecutive failures and rejects calls until
+    `reset_timeout` has passed. Then a single trial call is let through: its success closes the
+    circuit, its failure opens it again.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures opening the circuit.
+        reset_timeout (float): Seconds the circuit stays open.
+        failures (int): Current number of consecutive failures.
+        opened_at (Optional[float]): Monotonic time the circuit opened at, None while closed.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may be made, reserving the trial call of a half-open circuit.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def release(self):
+        """
+        Releases the trial call of a half-open circuit that ended without an outcome, e.g. because
+        it was cancelled, so the next call can make the trial.
+        """
+        self._trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> bool:
+        """
+        Records a failed call.
+
+        Returns:
+            bool: True if the failure opened the circuit.
+        """
+        self.failures += 1
+        if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+            opened = self.opened_at is None
+            self.opened_at = time.monotonic()
+            self._trial = False
+            return opened
+        return False
+
+
+class LatencyTracker:
+    """
+    Window of the most recent call latencies of a model.
+
+    Attributes:
+        window (int): Number of latencies kept.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies: deque = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Returns the q-th percentile, between 0 and 1, of the recorded latencies, or None if none were recorded.
+        """
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """
+    Runs calls to models with per-attempt deadlines, retries, hedged requests and per-model
+    circuit breakers, reporting every decision to the metrics.
+
+    Attributes:
+        policy (ResiliencePolicy): The resilience settings.
+        metrics (MetricsRegistry): Registry receiving timeout, retry, hedge and circuit breaker counters.
+    """
+
+    def __init__(self, policy: Optional[ResiliencePolicy] = None, metrics: Optional[MetricsRegistry] = None):
+        self.policy = policy or ResiliencePolicy()
+        self.metrics = metrics or MetricsRegistry()
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latencies: dict[str, LatencyTracker] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of the model, creating it on first use.
+        """
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(self.policy.breaker_failure_threshold, self.policy.breaker_reset_timeout)
+            self._breakers[model] = breaker
+        return breaker
+
+    def latencies(self, model: str) -> LatencyTracker:
+        """
+        Returns the latency window of the model, creating it on first use.
+        """
+        tracker = self._latencies.get(model)
+        if tracker is None:
+            tracker = LatencyTracker()
+            self._latencies[model] = tracker
+        return tracker
+
+    async def call(self, model: str, attempt: Callable[[], Awaitable[T]], agent: Optional[str] = None,
+                   hedge: bool = True) -> T:
+        """
+        Runs a call with retries, hedging and the circuit breaker of its model.
+
+        Args:
+            model (str): The model name.
+            attempt (Callable[[], Awaitable[T]]): Makes one attempt of the call.
+            agent (str, optional): Name of the calling agent or tool, used for logging.
+            hedge (bool, optional): Whether the call may be hedged. Calls whose result is consumed
+                incrementally, such as streams, must not be. Defaults to True.
+
+        Returns:
+            T: The result of the first successful attempt.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker of the model is open.
+            Exception: The error of the last attempt, or the first non-retryable error.
+        """
+        breaker = self.breaker(model)
+        retry = self.policy.retry
+        for attempt_no in range(retry.max_attempts):
+            trial = breaker.state == CircuitBreaker.HALF_OPEN
+            if not breaker.allow():
+                self.metrics.inc("llm_circuit_rejections", model=model)
+                raise CircuitOpenError(f"Circuit breaker of model {model} is open.")
+            try:
+                result = await (self._hedged(model, attempt) if hedge else self._timed(model, attempt))
+            except Exception as e:
+                if not is_retryable(e):
+                    # the provider answered, so the model is reachable
+                    breaker.record_success()
+                    raise
+                if breaker.record_failure():
+                    self.metrics.inc("llm_circuit_opened", model=model)
+                    logger.warning(f"Circuit breaker of model {model} opened after {breaker.failures} failures")
+                if attempt_no + 1 >= retry.max_attempts:
+                    raise
+                delay = retry.delay(attempt_no)
+                self.metrics.inc("llm_retries", model=model, reason=type(e).__name__)
+                logger.debug(f"Retrying {agent} call on model {model} in {delay:.2f}s after {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # cancelled, e.g. by a session or tool timeout: the trial call has no outcome
+                if trial:
+                    breaker.release()
+                raise
+            breaker.record_success()
+            return result
+
+    async def _timed(self, model: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(attempt(), timeout=self.policy.call_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.inc("llm_call_timeouts", model=model)
+            raise TimeoutError(f"Call to model {model} did not finish within {self.policy.call_timeout} seconds.")
+        self.latencies(model).record(time.monotonic() - start)
+        return result
+
+    async def next_chunk(self, model: str, chunks: AsyncIterator[T]) -> T:
+        """
+        Reads the next chunk of a streamed completion within the per-attempt deadline, so a
+        stalled stream fails instead of holding its connection and concurrency slot.
+
+        Args:
+            model (str): The model of the stream.
+            chunks (AsyncIterator[T]): The iterator over the stream's chunks.
+
+        Returns:
+            T: The next chunk.
+
+        Raises:
+            StopAsyncIteration: If the stream is exhausted.
+            TimeoutError: If no chunk arrives within the policy's `call_timeout`.
+        """
+        try:
+            return await asyncio.wait_for(chunks.__anext__(), timeout=self.policy.call_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.inc("llm_stream_timeouts", model=model)
+            raise TimeoutError(f"Stream of model {model} stalled for {self.policy.call_timeout} seconds.")
+
+    async def _hedged(self, model: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        hedge = self.policy.hedge
+        tracker = self.latencies(model)
+        if hedge is None or len(tracker) < hedge.min_samples:
+            return await self._timed(model, attempt)
+        threshold = tracker.percentile(hedge.percentile)
+        first = asyncio.ensure_future(self._timed(model, attempt))
+        tasks = {first}
+        hedges = 0
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = threshold if hedges < hedge.max_hedges else None
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    self.metrics.inc("llm_hedged_requests", model=model)
+                    tasks.add(asyncio.ensure_future(self._timed(model, attempt)))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.metrics.inc("llm_hedge_wins", model=model)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+import json
+import logging
+import os
+import time
+
+import openai
+from pydantic import ValidationError
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+T = TypeVar("T")
+
+ESCALATION_ERRORS = (ValidationError, json.JSONDecodeError,
+                     openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError)
+"""
+Errors of a completion that a stronger model may avoid: responses that fail validation, including
+structured outputs that are not valid JSON of their schema, and truncated or filtered responses.
+Other errors, such as a `ValueError` raised by a bug in the caller, are not escalated.
+"""
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """
+    Model assignment of an agent or LLM-backed tool.
+
+    Attributes:
+        model (Optional[str]): The model serving the calls. None uses the model the caller asks
+            for, or the router's default model.
+        escalate_to (tuple[str, ...]): Models a call is repeated on, in order, when the completion
+            of the previous model fails with one of the `escalate_on` errors or is rejected by the
+            caller's validation. Defaults to no escalation.
+        escalate_on (tuple[type[BaseException], ...]): Errors triggering an escalation. Defaults to
+            validation, truncation and content filter errors.
+    """
+    model: Optional[str] = None
+    escalate_to: tuple[str, ...] = ()
+    escalate_on: tuple[type[BaseException], ...] = ESCALATION_ERRORS
+
+
+class ModelRouter:
+    """
+    Selects the model of every LLM call by the agent or tool making it, and escalates calls whose
+    completion fails validation to stronger models.
+
+    Routes are looked up by the name the caller passes as `agent` to the LLM client pool: the agent
+    type for agents, e.g. "CommandGenerator", and the tool class name for tools, e.g.
+    "PageContentExtractionTool". Every decision is logged with the latency of the call on the
+    selected model and recorded in the `llm_route_seconds` histogram; escalations are counted in
+    `llm_escalations`.
+
+    Attributes:
+        routes (dict[str, ModelRoute]): Routes by agent or tool name. Plain model names are
+            accepted as routes without escalation.
+        default_model (Optional[str]): Model of calls without a route or caller model. None reads
+            the `OTOOLS_MODEL` environment variable on every call.
+        metrics (MetricsRegistry): Registry receiving the routing latency histograms and
+            escalation counters.
+    """
+
+    def __init__(self, routes: Optional[dict[str, Union[str, ModelRoute]]] = None,
+                 default_model: Optional[str] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.routes = {name: route if isinstance(route, ModelRoute) else ModelRoute(model=route)
+                       for name, route in (routes or {}).items()}
+        self.default_model = default_model
+        self.metrics = metrics or MetricsRegistry()
+
+    def route(self, agent: Optional[str]) -> ModelRoute:
+        """
+        Returns the route of an agent or tool, an empty route if none is configured.
+        """
+        return self.routes.get(agent) or ModelRoute()
+
+    def model(self, agent: Optional[str], model: Optional[str] = None) -> str:
+        """
+        Returns the model serving the calls of an agent or tool.
+
+        Args:
+            agent (str, optional): The agent or tool name.
+            model (str, optional): The model the caller asks for, used when the route does not
+                assign one.
+
+        Returns:
+            str: The model name.
+        """
+        return self.route(agent).model or model or self.default_model or os.getenv("OTOOLS_MODEL")
+
+    async def call(self, agent: Optional[str], model: Optional[str],
+                   run: Callable[[str, bool], Awaitable[T]]) -> T:
+        """
+        Runs a call on the model routed for the agent, escalating along the route on failure.
+
+        Args:
+            agent (str, optional): The agent or tool name.
+            model (str, optional): The model the caller asks for, used when the route does not
+                assign one.
+            run (Callable[[str, bool], Awaitable[T]]): Makes the call on the given model. The flag
+                tells whether the call can still be escalated; only then should the caller reject
+                completions it considers invalid by raising a pydantic `ValidationError` or a
+                `json.JSONDecodeError`, so the last model's completion is returned as before.
+
+        Returns:
+            T: The result of the first model that succeeds.
+        """
+        route = self.route(agent)
+        models = [self.model(agent, model), *route.escalate_to]
+        for tier, selected in enumerate(models):
+            can_escalate = tier + 1 < len(models)
+            start = time.monotonic()
+            try:
+                result = await run(selected, can_escalate)
+            except route.escalate_on as e:
+                if not can_escalate:
+                    raise
+                elapsed = time.monotonic() - start
+                self.metrics.observe("llm_route_seconds", elapsed, agent=agent, model=selected)
+                self.metrics.inc("llm_escalations", agent=agent, from_model=selected,
+                                 to_model=models[tier + 1], reason=type(e).__name__)
+                logger.info(f"Escalating {agent} call from model {selected} to {models[tier + 1]} "
+                            f"after {elapsed:.2f}s: {type(e).__name__}: {e}")
+                continue
+            elapsed = time.monotonic() - start
+            self.metrics.observe("llm_route_seconds", elapsed, agent=agent, model=selected)
+            logger.debug(f"Routed {agent} call to model {selected} (tier {tier}) in {elapsed:.2f}s")
+            return result
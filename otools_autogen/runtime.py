@@ -1,44 +1,104 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import asyncio
+import time
 from functools import wraps
 
 from autogen_core._default_subscription import DefaultSubscription
 from autogen_core._default_topic import DefaultTopicId
 import uuid
 import enum
-from typing import Any, Optional
+from typing import Any, Mapping, Optional, Union
 from autogen_core import (SingleThreadedAgentRuntime)
-from .tools import create_tool_class, Tool, ToolCard
+from .tools import create_tool_class, Tool, ToolCard, CompiledToolCard, ToolRegistry, AsyncHTTPTool
+from .llm import LLMClientPool
+from .resilience import ResiliencePolicy
+from .tracing import SpanExporter, Tracer
+from .usage import ModelPricing, UsageTracker
+from .scheduler import LLMScheduler, Priority, RateLimit
+from .routing import ModelRoute, ModelRouter
+from .executor import ToolExecutor
+from .http_client import HTTPClientPool
+from .cache import CachePolicy, ResponseCache
+from .metrics import MetricsRegistry
+from .queues import ClientQueue, QueueClosed, QueuePolicy
+from .distributed import DistributedConfig, create_worker_runtime, message_types, register_serializers
 
 
 from autogen_core import TRACE_LOGGER_NAME
 
-from .agents import Orchestrator, QueryAnalyzer, ActionPredictor, CommandGenerator, ContextVerifier, FinalOutputAgent
+from .agents import Orchestrator, QueryAnalyzer, ActionPredictor, CommandGenerator, ContextVerifier, FinalOutputAgent, FusedPlanner
+from .dag import DagOrchestrator, DagPlanner
 import logging
 
 logger = logging.getLogger("otools_autogen")
 
 
+def release_agent_instances(runtime: Any, key: str) -> int:
+    """
+    Removes the agent instances created for the given agent key, e.g. a session id, from an
+    agent runtime, so they are garbage collected.
+
+    autogen has no public API to remove agent instances. Both `SingleThreadedAgentRuntime` and
+    the gRPC worker runtime keep them in the private `_instantiated_agents` dict, as of
+    autogen-core and autogen-ext 0.7.5; re-check this when upgrading autogen.
+
+    Args:
+        runtime (Any): The agent runtime, or None if it was not started.
+        key (str): The key of the agent ids to remove.
+
+    Returns:
+        int: The number of removed agent instances.
+    """
+    if runtime is None:
+        return 0
+    instantiated_agents = getattr(runtime, "_instantiated_agents", None)
+    if not isinstance(instantiated_agents, dict):
+        logger.warning(f"{type(runtime).__name__} does not expose _instantiated_agents; "
+                       f"agent instances of {key} are not released.")
+        return 0
+    agent_ids = [agent_id for agent_id in instantiated_agents if agent_id.key == key]
+    for agent_id in agent_ids:
+        del instantiated_agents[agent_id]
+    return len(agent_ids)
+
+
 
 @dataclass
 class UserRequest:
     """
     Represents a user request containing a message, a list of files, and an optional maximum number of steps.
 
+    The request may also carry wall-clock, token and cost budgets. When a budget is used up, or
+    would be by the next step, the Orchestrator sends a `BudgetExceeded` response and generates
+    the final answer from the results collected so far, without asking the ContextVerifier.
+    Budgets are also checked before every agent and tool call of a step, and calls still running
+    when the wall-clock budget runs out are cancelled.
+
     Attributes:
         message (str): The message provided by the user.
         files (list[str]): A list of file paths associated with the request.
         max_steps (int): The maximum number of steps allowed for processing the request. Defaults to 5.
+        max_seconds (float): Wall-clock budget of the request in seconds. Defaults to 0, no budget.
+        max_tokens (int): Budget of prompt and completion tokens of the request. Defaults to 0, no budget.
+        max_cost (float): Cost budget of the request, in the currency of the runtime's model
+            pricing. Defaults to 0, no budget.
     """
     message: str
     files: list[str]
     max_steps: int = 5
+    max_seconds: float = 0
+    max_tokens: int = 0
+    max_cost: float = 0
 
 @dataclass
 class UserResponse:
     """
     Represents a user's response during a session.
 
+    While the final answer is generated, `FinalOutputDelta` responses carry its text as it is
+    produced. They are followed by the `FinalOutput` response with `final` set to True, which
+    holds the complete answer.
+
     Attributes:
         type (str): The type of the response.
         session_id (str): The unique identifier for the session.
@@ -48,6 +108,8 @@ class UserResponse:
         conclusion (bool): Indicates if the response contains a conclusion.
         step_no (int): The step number associated with the response.
         command (Optional[str]): An optional command associated with the response.
+        usage (Optional[dict]): On the final response, the token usage and cost of the request:
+            its `total`, its totals by `steps` and `agents`, and the `session_total`.
     """
     type: str
     session_id: str
@@ -57,6 +119,7 @@ class UserResponse:
     conclusion: bool
     step_no: int
     command: Optional[str] = None
+    usage: Optional[dict] = None
 
 
        
@@ -71,13 +134,17 @@ class Runtime:
     Classes:
         - SessionState: An enumeration representing the state of a session (WAITING or PROCESSING).
         - Session: A dataclass representing a session with attributes for session ID, a queue for
-          communication with the client, and the session state.
+          communication with the client, the session state and its last activity time.
     Methods:
-        - __init__(): Initializes the Runtime instance with empty tool and session registries.
-        - register_tool(tool_name, tool): Registers a tool by its name and type.
+        - __init__(llm): Initializes the Runtime instance with empty tool and session registries and
+          the shared LLM client pool.
+        - register_tool(tool_name, tool): Registers a tool by its name and type and compiles its card.
         - get_tool(tool_name): Retrieves a registered tool by its name.
         - get_session(session_id): Retrieves a session by its ID.
-        - get_tool_cards(): Returns a dictionary of tool names and their associated cards.
+        - close_session(session_id): Closes a session and removes its agent instances.
+        - evict_sessions(): Evicts idle sessions and sessions over the maximum session count.
+        - get_tool_registry(): Returns the read-only registry of compiled tool cards.
+        - get_tool_cards(): Returns a mapping of tool names and their associated card snapshots.
         - _init_session(session_id): Initializes a new session with a unique ID and sets its state
           to WAITING. Publishes a bootstrap message to the runtime.
         - send_message(message, session_id): Sends a user request message to the runtime. If the
@@ -87,10 +154,16 @@ class Runtime:
         - start(): Starts the runtime by initializing internal agents, registering tools, and
           adding subscriptions.
         - stop(when_idle): Stops the runtime. If `when_idle` is True, the runtime stops when idle.
+          Closes the shared LLM and HTTP client pools, the response caches and the tool executor afterwards.
+        - get_metrics(): Returns a snapshot of the runtime metrics, including the span latency histograms.
+        - get_usage_stats(): Returns the aggregated token usage and cost by agent, model and session.
+        - is_front / hosts(agent_type): Tell whether a distributed node owns sessions and which agents it hosts.
         - _add_internal_agents(runtime): Adds internal agents to the runtime, such as QueryAnalyzer,
-          ActionPredictor, CommandGenerator, ContextVerifier, FinalOutputAgent, and Orchestrator.
+          ActionPredictor, CommandGenerator, ContextVerifier, FinalOutputAgent, FusedPlanner and Orchestrator.
     """
-    
+    PLANNING_MODES = ("two_stage", "fused")
+    ORCHESTRATORS = {"linear": Orchestrator, "dag": DagOrchestrator}
+
     class SessionState(enum.Enum):
         """
         SessionState is an enumeration that represents the state of a session.
@@ -109,15 +182,62 @@ class Runtime:
 
         Attributes:
             session_id (str): A unique identifier for the session.
-            to_client_queue (asyncio.Queue): A queue used for sending messages to the client.
+            to_client_queue (ClientQueue): A bounded queue used for sending messages to the client.
             state (Runtime.SessionState): The current state of the session.
+            created_at (float): Monotonic time the session was created at.
+            last_active (float): Monotonic time of the last activity in the session.
+            pending_requests (int): Number of requests sent to the session and not yet picked
+                up by the Orchestrator.
         """
         session_id: str
-        to_client_queue: asyncio.Queue
+        to_client_queue: ClientQueue
         state: "Runtime.SessionState"
+        created_at: float = field(default_factory=time.monotonic)
+        last_active: float = field(default_factory=time.monotonic)
+        pending_requests: int = 0
+
+        @property
+        def idle(self) -> bool:
+            """
+            Whether the session neither processes nor has queued requests, so it may be evicted.
+            """
+            return self.state == Runtime.SessionState.WAITING and self.pending_requests == 0
+
+        def touch(self):
+            """
+            Records activity in the session, resetting its idle time.
+            """
+            self.last_active = time.monotonic()
         
         
-    def __init__(self):
+    def __init__(self, llm: Optional[LLMClientPool] = None,
+                 http: Optional[HTTPClientPool] = None,
+                 history_token_budget: int = 8000,
+                 history_keep_recent: int = 2,
+                 tool_executor_workers: int = 8,
+                 session_idle_ttl: Optional[float] = 3600.0,
+                 max_sessions: Optional[int] = 1000,
+                 session_sweep_interval: float = 60.0,
+                 client_queue_size: int = 100,
+                 client_queue_policy: QueuePolicy = QueuePolicy.DROP,
+                 client_queue_put_timeout: Optional[float] = 30.0,
+                 completion_cache: Optional[CachePolicy] = None,
+                 planning: str = "two_stage",
+                 speculative_planning: bool = False,
+                 max_parallel_tools: int = 1,
+                 parallel_tool_concurrency: int = 4,
+                 tool_call_timeout: Optional[float] = None,
+                 orchestrator: str = "linear",
+                 distributed: Optional[DistributedConfig] = None,
+                 resilience: Optional[ResiliencePolicy] = None,
+                 session_timeout: Optional[float] = None,
+                 trace_exporters: Optional[list[SpanExporter]] = None,
+                 model_pricing: Optional[dict[str, ModelPricing]] = None,
+                 rate_limits: Optional[dict[str, RateLimit]] = None,
+                 default_rate_limit: Optional[RateLimit] = None,
+                 agent_priorities: Optional[dict[str, Priority]] = None,
+                 model_routes: Optional[dict[str, Union[str, ModelRoute]]] = None,
+                 default_model: Optional[str] = None):
         """
         Initializes the runtime environment.
 
@@ -125,13 +245,152 @@ class Runtime:
         and sessions. It initializes two dictionaries:
         - `_tools`: A dictionary to store tool-related information.
         - `_sessions`: A dictionary to manage session-related data.
+        It also keeps the compiled tool cards and the lazily built tool registry.
+
+        Args:
+            llm (LLMClientPool, optional): The shared LLM client pool used by all agents and
+                LLM-backed tools. A pool with default settings is created when not provided.
+            http (HTTPClientPool, optional): The shared HTTP client pool used by tools built on
+                `AsyncHTTPTool`. A pool with default settings is created when not provided.
+            history_token_budget (int, optional): Estimated token budget of the action history
+                rendered into agent prompts. Defaults to 8000.
+            history_keep_recent (int, optional): Number of most recent steps always kept verbatim
+                in the action history. Defaults to 2.
+            tool_executor_workers (int, optional): Size of the thread pool running blocking
+                tools. Defaults to 8.
+            session_idle_ttl (float, optional): Seconds after which a session that is not being
+                processed and has no activity is evicted. None disables idle eviction. Defaults to 3600.
+            max_sessions (int, optional): Maximum number of sessions kept. When exceeded, the least
+                recently active idle sessions are evicted. None disables the limit. Defaults to 1000.
+            session_sweep_interval (float, optional): Seconds between background eviction sweeps.
+                Defaults to 60.
+            client_queue_size (int, optional): Number of responses held in each session's client
+                queue before the queue policy applies. Defaults to 100.
+            client_queue_policy (QueuePolicy, optional): What happens to intermediate responses when
+                a client queue is full: block the orchestrator, drop them, or coalesce them into the
+                latest state. Final responses are always delivered. Defaults to QueuePolicy.DROP.
+            client_queue_put_timeout (float, optional): Seconds the orchestrator waits under the BLOCK
+                policy before dropping a response. Defaults to 30.
+            completion_cache (CachePolicy, optional): Enables caching of the structured completions
+                of deterministic agents with the given TTL, size and storage. Defaults to None,
+                which disables it.
+            planning (str, optional): How the Orchestrator plans each step. "two_stage" selects the
+                tool with the ActionPredictor and generates its argument with the CommandGenerator.
+                "fused" does both in a single FusedPlanner completion, falling back to two-stage
+                planning for a step if it fails. Defaults to "two_stage".
+            speculative_planning (bool, optional): If True, the next step is planned while the
+                ContextVerifier runs. The speculative plan is used when the verifier continues and
+                cancelled when it stops. Defaults to False.
+            max_parallel_tools (int, optional): Maximum number of independent tool invocations the
+                planners may return for a single step. They run concurrently and are recorded as
+                one step of the action history. Defaults to 1, which plans one tool per step.
+            parallel_tool_concurrency (int, optional): Maximum number of tool invocations of a
+                step running at the same time. Defaults to 4.
+            tool_call_timeout (float, optional): Seconds after which a tool call is cancelled and
+                reported as an error. None waits indefinitely. Defaults to None.
+            orchestrator (str, optional): The orchestrator handling user requests. "linear" plans and
+                verifies one step at a time. "dag" plans a dependency graph of tool invocations, runs
+                each as soon as its inputs are ready and re-plans only on failures or when the
+                ContextVerifier asks for more. Defaults to "linear".
+            distributed (DistributedConfig, optional): Runs the agents on the autogen gRPC worker
+                runtime, hosting on this node only the agents and tools placed in its group. Only
+                the front node accepts user requests and evicts sessions. Token usage is
+                accounted on the node making a completion, so the usage attached to responses
+                and the request budgets only cover the agents hosted on the front node. Defaults
+                to None, which runs everything in process on a `SingleThreadedAgentRuntime`.
+            resilience (ResiliencePolicy, optional): Deadlines, retries, hedging and circuit breaker
+                settings of the LLM calls. Defaults to None, which keeps the policy of the LLM pool.
+            session_timeout (float, optional): Seconds the Orchestrator may spend on a user request.
+                When exceeded, processing is cancelled and the client receives a final
+                `SessionTimeout` response. None waits indefinitely. Defaults to None.
+            trace_exporters (list[SpanExporter], optional): Exporters receiving the spans of every
+                Orchestrator stage, agent call, LLM completion and tool run, such as an
+                `InMemorySpanExporter` or an `OpenTelemetrySpanExporter`. Span durations are
+                always recorded in the `span_duration_seconds` histograms of the metrics.
+            model_pricing (dict[str, ModelPricing], optional): Prices of the models by name, used
+                to compute the cost of completions. Completions of models without pricing are
+                accounted with zero cost. Defaults to None.
+            rate_limits (dict[str, RateLimit], optional): Requests and tokens per minute limits by
+                model. LLM calls of all agents and tools that would exceed them wait in a queue
+                and are admitted by priority class, then round robin across sessions. Limits
+                apply per process: `ShardedRuntime` divides them among its workers, while on a
+                distributed deployment every node making LLM calls applies them on its own, so
+                they should be divided by the number of such nodes. Defaults to None, which
+                sends calls without rate limiting.
+            default_rate_limit (RateLimit, optional): Rate limit of models not listed in
+                `rate_limits`. Defaults to None, unlimited.
+            agent_priorities (dict[str, Priority], optional): Priority classes of the calls of
+                agents and tools under rate limiting. Defaults to the FinalOutputAgent being HIGH,
+                the QueryAnalyzer LOW and all others NORMAL, so sessions close to their answer
+                are served before new ones.
+            model_routes (dict[str, Union[str, ModelRoute]], optional): Model of each agent type
+                and LLM-backed tool, by agent type or tool class name, e.g.
+                `{"CommandGenerator": ModelRoute("small-model", escalate_to=("large-model",)),
+                "FinalOutputAgent": "large-model"}`. A route may escalate a call to stronger
+                models when its completion fails validation, such as a CommandGenerator argument
+                that is not valid JSON. Defaults to None, which uses the default model everywhere.
+            default_model (str, optional): Model of agents and tools without a route. Defaults to
+                None, which reads the `OTOOLS_MODEL` environment variable on every call.
+
+        Raises:
+            ValueError: If `planning` or `orchestrator` is not a supported mode.
         """
+        if planning not in self.PLANNING_MODES:
+            raise ValueError(f"Unsupported planning mode: {planning}. Expected one of {self.PLANNING_MODES}.")
+        if orchestrator not in self.ORCHESTRATORS:
+            raise ValueError(f"Unsupported orchestrator: {orchestrator}. Expected one of {tuple(self.ORCHESTRATORS)}.")
         self._tools = {}
         self._sessions = {}
+        self._compiled_cards: dict[str, CompiledToolCard] = {}
+        self._tool_registry: Optional[ToolRegistry] = None
+        self._tool_caches: dict[str, ResponseCache] = {}
+        self._caches: list[ResponseCache] = []
+        self.metrics = MetricsRegistry()
+        self.llm = llm or LLMClientPool()
+        self.llm.metrics = self.metrics
+        self.tracer = Tracer(self.metrics, trace_exporters)
+        self.llm.tracer = self.tracer
+        self.usage = UsageTracker(model_pricing)
+        self.llm.usage = self.usage
+        self.router = ModelRouter(model_routes, default_model, metrics=self.metrics)
+        self.llm.router = self.router
+        if rate_limits or default_rate_limit is not None:
+            self.llm.scheduler = LLMScheduler(rate_limits, default_rate_limit, agent_priorities, metrics=self.metrics)
+        if resilience is not None:
+            self.llm.resilience.policy = resilience
+        self.executor = ToolExecutor(max_workers=tool_executor_workers, metrics=self.metrics)
+        if completion_cache is not None:
+            self.llm.completion_cache = ResponseCache.from_policy(
+                "llm_completions", completion_cache, metrics=self.metrics, executor=self.executor)
+            self._caches.append(self.llm.completion_cache)
+        self.http = http or HTTPClientPool(metrics=self.metrics)
+        self.session_idle_ttl = session_idle_ttl
+        self.max_sessions = max_sessions
+        self.session_sweep_interval = session_sweep_interval
+        self._sweep_task: Optional[asyncio.Task] = None
+        self.client_queue_size = client_queue_size
+        self.client_queue_policy = client_queue_policy
+        self.client_queue_put_timeout = client_queue_put_timeout
+        self.metrics.register_gauge("sessions_active", lambda: len(self._sessions))
+        self.metrics.register_gauge("sessions_processing", lambda: sum(
+            1 for session in self._sessions.values() if session.state == Runtime.SessionState.PROCESSING))
+        self.history_token_budget = history_token_budget
+        self.planning = planning
+        self.speculative_planning = speculative_planning
+        self.max_parallel_tools = max_parallel_tools
+        self.parallel_tool_concurrency = parallel_tool_concurrency
+        self.tool_call_timeout = tool_call_timeout
+        self.orchestrator = orchestrator
+        self.history_keep_recent = history_keep_recent
+        self.distributed = distributed
+        self.session_timeout = session_timeout
         
     def register_tool(self, tool_name,tool: type[Tool]):
         """
-        Registers a tool with the given name and type.
+        Registers a tool with the given name and type. The tool instance is bound to the
+        shared LLM client pool, the tool executor and, for `AsyncHTTPTool` tools, the HTTP
+        client pool, and its card is copied and compiled once. The tool registry
+        is invalidated so it is rebuilt for the new tool set.
 
         Args:
             tool_name (str): The name to associate with the tool.
@@ -141,7 +400,14 @@ class Runtime:
         Returns:
             None
         """
-        self._tools[tool_name] = tool()
+        tool_instance = tool()
+        tool_instance.llm = self.llm
+        tool_instance.executor = self.executor
+        if isinstance(tool_instance, AsyncHTTPTool):
+            tool_instance.http = self.http
+        self._tools[tool_name] = tool_instance
+        self._compiled_cards[tool_name] = CompiledToolCard.compile(tool_instance.card)
+        self._tool_registry = None
     
     def get_tool(self, tool_name: str) -> Tool:
         """
@@ -173,18 +439,121 @@ class Runtime:
         """
         return self._sessions[session_id]
     
-    def get_tool_cards(self) -> dict:
+    def close_session(self, session_id: str, reason: str = "closed") -> bool:
+        """
+        Close a session and release its resources.
+
+        The session is removed from the session registry and the agent instances created for it
+        are removed from the agent runtime. A final `SessionClosed` response is put on the session
+        queue so a client still streaming the session stops waiting.
+
+        Args:
+            session_id (str): The unique identifier of the session to close.
+            reason (str, optional): The reason recorded in the metrics. Defaults to "closed".
+
+        Returns:
+            bool: True if the session existed and was closed, False otherwise.
+        """
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        release_agent_instances(getattr(self, "runtime", None), session_id)
+        session.to_client_queue.put_nowait(UserResponse(
+            type="SessionClosed",
+            session_id=session_id,
+            message=f"Session {reason}.",
+            tool_used=None,
+            final=True,
+            conclusion=False,
+            step_no=0))
+        session.to_client_queue.close()
+        self.usage.close_session(session_id)
+        self.metrics.inc("sessions_evicted" if reason != "closed" else "sessions_closed", reason=reason)
+        logger.debug(f"Session {session_id} {reason}.")
+        return True
+
+    def evict_sessions(self, reserve: int = 0) -> int:
+        """
+        Evict idle sessions and, when over the session limit, the least recently active ones.
+
+        Sessions that are currently being processed or have requests queued for the
+        Orchestrator are never evicted.
+
+        Args:
+            reserve (int, optional): Number of sessions about to be created that must fit
+                within the session limit. Defaults to 0.
+
+        Returns:
+            int: The number of evicted sessions.
+        """
+        now = time.monotonic()
+        idle = [session for session in self._sessions.values() if session.idle]
+        evicted = 0
+        if self.session_idle_ttl is not None:
+            for session in idle:
+                if now - session.last_active > self.session_idle_ttl:
+                    evicted += self.close_session(session.session_id, reason="idle")
+        limit = None if self.max_sessions is None else self.max_sessions - reserve
+        if limit is not None and len(self._sessions) > limit:
+            idle = sorted((session for session in idle if session.session_id in self._sessions),
+                          key=lambda session: session.last_active)
+            for session in idle[:len(self._sessions) - limit]:
+                evicted += self.close_session(session.session_id, reason="capacity")
+        return evicted
+
+    async def _sweep_sessions(self):
+        while True:
+            await asyncio.sleep(self.session_sweep_interval)
+            self.evict_sessions()
+
+    def get_metrics(self) -> dict:
+        """
+        Retrieve a snapshot of the runtime metrics, such as the tool executor saturation.
+
+        Returns:
+            dict: A dictionary with `counters` and `gauges` mappings of metric keys to values.
+        """
+        return self.metrics.snapshot()
+
+    def get_usage_stats(self) -> dict:
+        """
+        Retrieve the token usage and cost of all completions made by agents and LLM-backed tools.
+        On a distributed deployment, only the completions made on this node are included.
+
+        Returns:
+            dict: The `total` usage, the usage by `agents` and by `models`, and the total usage
+                of each open session in `sessions`. Every usage holds the number of requests,
+                prompt, completion, cached prompt and total tokens, and the cost.
+        """
+        return self.usage.stats()
+
+    def get_tool_registry(self) -> ToolRegistry:
         """
-        Retrieve a dictionary of tool cards.
+        Retrieve the read-only registry of compiled tool cards.
 
-        This method returns a dictionary where the keys are tool names and the 
-        values are the corresponding tool card objects.
+        The registry is built on first access after the tool set changes and served
+        unchanged afterwards, so tool JSON schemas and prompt strings are not regenerated
+        on every step.
 
         Returns:
-            dict: A dictionary mapping tool names (str) to their respective 
+            ToolRegistry: The registry of all registered tools.
+        """
+        if self._tool_registry is None:
+            self._tool_registry = ToolRegistry.build(self._compiled_cards)
+        return self._tool_registry
+
+    def get_tool_cards(self) -> Mapping[str, ToolCard]:
+        """
+        Retrieve a mapping of tool cards.
+
+        This method returns a read-only mapping where the keys are tool names and the 
+        values are snapshots of the corresponding tool cards.
+
+        Returns:
+            Mapping[str, ToolCard]: A mapping of tool names (str) to their respective 
             tool card objects.
         """
-        return {tool_name: tool.card for tool_name, tool in self._tools.items()}
+        return self.get_tool_registry().tool_cards
 
     async def  _init_session(self, session_id: str):
         """
@@ -200,6 +569,7 @@ class Runtime:
             ValueError: If a session with the given session ID already exists.
 
         Notes:
+            - Idle sessions are evicted first, so the session limit is enforced on creation.
             - A new session is added to the `_sessions` dictionary with the specified or generated session ID.
             - A message with the topic "bootstrap" is published to the runtime with the session ID as the source.
         """
@@ -208,9 +578,14 @@ class Runtime:
         else:
             if session_id in self._sessions:
                 raise ValueError(f"Session with id {session_id} already exists.")
+        self.evict_sessions(reserve=1)
         self._sessions[session_id] = Runtime.Session(
             session_id=session_id,
-            to_client_queue=asyncio.Queue(),
+            to_client_queue=ClientQueue(
+                maxsize=self.client_queue_size,
+                policy=self.client_queue_policy,
+                put_timeout=self.client_queue_put_timeout,
+                metrics=self.metrics),
             state=Runtime.SessionState.WAITING
         )
         await self.runtime.publish_message("bootstrap", DefaultTopicId(source=session_id))   
@@ -234,11 +609,22 @@ class Runtime:
 
         Returns:
             str: The session ID associated with the message.
+
+        Raises:
+            RuntimeError: If the runtime is a distributed node outside the front group.
         """
+        if not self.is_front:
+            raise RuntimeError(f"Group {self.distributed.group} does not accept user requests; send them to the front node.")
         if session_id not in self._sessions:
             session_id = await self._init_session(session_id)
         _session = self._sessions[session_id]
-        await self.runtime.publish_message(message=message,topic_id=DefaultTopicId(source=session_id))
+        _session.touch()
+        _session.pending_requests += 1
+        try:
+            await self.runtime.publish_message(message=message,topic_id=DefaultTopicId(source=session_id))
+        except BaseException:
+            _session.pending_requests -= 1
+            raise
         return session_id
     
     async def stream(self, session_id):
@@ -253,15 +639,21 @@ class Runtime:
         Behavior:
             - Continuously retrieves messages from the session's `to_client_queue`.
             - Yields each message to the caller.
-            - Terminates the stream when a message with the `final` attribute set to True is encountered.
+            - Terminates the stream when a message with the `final` attribute set to True is encountered,
+              or when the session's queue is closed and empty.
         """
         if session_id not in self._sessions:
             raise RuntimeError("Invalid session")
 
-        queue = self._sessions[session_id].to_client_queue
+        session = self._sessions[session_id]
+        queue = session.to_client_queue
 
         while True:
-            msg:UserResponse = await queue.get()
+            try:
+                msg:UserResponse = await queue.get()
+            except QueueClosed:
+                break
+            session.touch()
             yield msg
             if msg.final:
                 break
@@ -270,19 +662,40 @@ class Runtime:
         """
         Asynchronously starts the runtime and initializes tools and subscriptions.
         This method performs the following steps:
-        1. Creates an instance of `SingleThreadedAgentRuntime` and assigns it to `self.runtime`.
+        1. Creates an instance of `SingleThreadedAgentRuntime`, or in distributed mode a gRPC worker
+           runtime with serializers for all message types connected to the host, and assigns it
+           to `self.runtime`.
         2. Adds internal agents to the runtime by calling `_add_internal_agents`.
-        3. Iterates over the tools in `self._tools`, creates tool classes using `create_tool_class`,
-           and registers them with the runtime.
+        3. Iterates over the tools in `self._tools`, creates tool classes using `create_tool_class`
+           with their card snapshots and, for cards with a `cache_policy`, their response caches,
+           and registers them with the runtime. In distributed mode only the tools placed in the
+           node's group are registered.
         4. Creates a default subscription for each tool and adds it to the runtime.
-        5. Starts the runtime.
+        5. Starts the local runtime and, on the front node, the background session eviction sweep.
         Raises:
             Any exceptions raised during the initialization or runtime start process.
         """
-        self.runtime = SingleThreadedAgentRuntime()
+        if self.distributed is None:
+            self.runtime = SingleThreadedAgentRuntime()
+        else:
+            self.runtime = create_worker_runtime(self.distributed.host_address)
+            register_serializers(self.runtime, message_types(self.get_tool_registry()))
+            # Agents register their types with the host, so the worker connects first.
+            await self.runtime.start()
         await self._add_internal_agents(self.runtime)
         for tool_id, tool in self._tools.items():
-            tool_cls = create_tool_class(tool)
+            if not self.hosts(tool_id):
+                continue
+            card = self._compiled_cards[tool_id].card
+            cache = None
+            if card.cache_policy is not None:
+                cache = self._tool_caches.get(tool_id)
+                if cache is None:
+                    cache = ResponseCache.from_policy(card.tool_id, card.cache_policy, metrics=self.metrics,
+                                                      executor=self.executor)
+                    self._tool_caches[tool_id] = cache
+                    self._caches.append(cache)
+            tool_cls = create_tool_class(tool, card, cache)
             await tool_cls.register(
                 runtime=self.runtime,
                 type=tool_id,
@@ -292,25 +705,59 @@ class Runtime:
             await self.runtime.add_subscription(subscr)
         
         
-        self.runtime.start()
+        if self.distributed is None:
+            self.runtime.start()
+        if self.is_front:
+            self._sweep_task = asyncio.create_task(self._sweep_sessions())
          
 
     async def stop(self,when_idle=False):
         """
-        Stops the runtime either immediately or when it becomes idle.
+        Stops the runtime either immediately or when it becomes idle, then closes
+        the shared LLM and HTTP client pools and the response caches it created, and shuts
+        the tool executor down.
 
         Args:
             when_idle (bool, optional): If True, the runtime will stop when it becomes idle.
                                         If False, the runtime will stop immediately. Defaults to False.
+                                        Distributed nodes always stop immediately.
 
         Raises:
             Any exceptions raised by the `stop_when_idle` or `stop` methods of the runtime.
         """
-        if when_idle:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if when_idle and self.distributed is None:
             await self.runtime.stop_when_idle()
         else:
             await self.runtime.stop()
+        await self.llm.aclose()
+        await self.http.aclose()
+        for cache in self._caches:
+            cache.close()
+        self.executor.shutdown()
+
 
+    @property
+    def is_front(self) -> bool:
+        """
+        Returns whether this runtime owns sessions, which is always the case unless it is a
+        distributed node outside the front group.
+        """
+        return self.distributed is None or self.distributed.is_front
+
+    def hosts(self, agent_type: str) -> bool:
+        """
+        Returns whether the agent type, an internal agent or a tool id, is registered on this runtime.
+
+        Args:
+            agent_type (str): The agent type.
+
+        Returns:
+            bool: True unless the runtime is distributed and the agent type is placed in another group.
+        """
+        return self.distributed is None or self.distributed.hosts(agent_type)
 
     async def _add_internal_agents(self, runtime):
         """
@@ -328,39 +775,49 @@ class Runtime:
             - CommandGenerator
             - ContextVerifier
             - FinalOutputAgent
+            - FusedPlanner
+            - DagPlanner
             - OrchestratorAgent
         Each agent is registered with a factory function that creates an instance
-        of the respective agent class. A `DefaultSubscription` is created for each
+        of the respective agent class bound to the shared LLM client pool. The
+        FinalOutputAgent also receives `self` to stream the answer to the session queue, and the
+        FusedPlanner to read the tool registry. A `DefaultSubscription` is created for each
         registered agent type and added to the runtime.
         Note:
-            The Orchestrator agent is registered separately after the internal
+            The orchestrator agent is registered separately after the internal
             agents and uses a factory function that passes `self` to its
-            constructor.
+            constructor. Its class is selected by the runtime's `orchestrator` mode.
         """
         internal_agents = [
-            ("QueryAnalyzer", QueryAnalyzer),
-            ("ActionPredictor", ActionPredictor),
-            ("CommandGenerator", CommandGenerator),
-            ("ContextVerifier", ContextVerifier),
-            ("FinalOutputAgent", FinalOutputAgent),
+            ("QueryAnalyzer", QueryAnalyzer, lambda: QueryAnalyzer(self.llm)),
+            ("ActionPredictor", ActionPredictor, lambda: ActionPredictor(self.llm)),
+            ("CommandGenerator", CommandGenerator, lambda: CommandGenerator(self.llm)),
+            ("ContextVerifier", ContextVerifier, lambda: ContextVerifier(self.llm)),
+            ("FinalOutputAgent", FinalOutputAgent, lambda: FinalOutputAgent(self.llm, self)),
+            ("FusedPlanner", FusedPlanner, lambda: FusedPlanner(self.llm, self)),
+            ("DagPlanner", DagPlanner, lambda: DagPlanner(self.llm)),
         ]
         
-        for agent_name, agent_cls in internal_agents:
+        for agent_name, agent_cls, agent_factory in internal_agents:
+            if not self.hosts(agent_name):
+                continue
             agent_type = await agent_cls.register(
                 runtime=runtime,
                 type=agent_name,
-                factory=lambda cls=agent_cls: cls()
+                factory=agent_factory
             )
             subscr = DefaultSubscription(agent_type=agent_type)
             await runtime.add_subscription(subscr)
             
             
         
-        from .agents import Orchestrator
-        orch_agent_type = await Orchestrator.register(
+        if not self.hosts("OrchestratorAgent"):
+            return
+        orchestrator_cls = self.ORCHESTRATORS[self.orchestrator]
+        orch_agent_type = await orchestrator_cls.register(
             runtime=runtime,
             type="OrchestratorAgent",
-            factory=lambda: Orchestrator(self)
+            factory=lambda: orchestrator_cls(self)
         )
         
         orch_subscr = DefaultSubscription(agent_type=orch_agent_type)
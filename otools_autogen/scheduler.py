@@ -0,0 +1,256 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+import asyncio
+import enum
+import logging
+import time
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+class Priority(enum.IntEnum):
+    """
+    Priority classes of LLM calls. Waiting calls of a higher class are always admitted first.
+    """
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+DEFAULT_AGENT_PRIORITIES = {
+    "FinalOutputAgent": Priority.HIGH,
+    "QueryAnalyzer": Priority.LOW,
+}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    Rate limit of a model.
+
+    Attributes:
+        requests_per_minute (Optional[int]): Maximum completions per minute. None is unlimited.
+        tokens_per_minute (Optional[int]): Maximum prompt and completion tokens per minute.
+            None is unlimited.
+    """
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+
+    def share(self, parts: int) -> "RateLimit":
+        """
+        Returns the share of the limit of one of `parts` processes applying it independently.
+        """
+        def divide(limit: Optional[int]) -> Optional[int]:
+            return None if limit is None else max(1, limit // parts)
+        return RateLimit(divide(self.requests_per_minute), divide(self.tokens_per_minute))
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate, holding at most one minute of capacity.
+    Consuming more than is available leaves a debt that is refilled before further calls are admitted.
+
+    Attributes:
+        capacity (float): Maximum content of the bucket.
+        rate (float): Refill per second.
+        tokens (float): Current content of the bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Returns the seconds until the amount is available. Amounts above the capacity wait for a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """
+        Takes the amount from the bucket. Negative amounts give tokens back.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    session_id: str
+    tokens: int
+    priority: Priority
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _ModelQueue:
+    """
+    Waiting calls of a model with its rate limit buckets. Within a priority class, sessions are
+    served round robin, so a session with many waiting calls does not hold back the others.
+    """
+
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(limit.requests_per_minute) if limit.requests_per_minute else None
+        self.tokens = TokenBucket(limit.tokens_per_minute) if limit.tokens_per_minute else None
+        self.sessions: dict[Priority, "OrderedDict[str, deque]"] = {priority: OrderedDict() for priority in Priority}
+        self.depth = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def push(self, waiter: _Waiter):
+        self.sessions[waiter.priority].setdefault(waiter.session_id, deque()).append(waiter)
+        self.depth += 1
+
+    def peek(self) -> Optional[_Waiter]:
+        for sessions in self.sessions.values():
+            while sessions:
+                session_id, waiters = next(iter(sessions.items()))
+                while waiters and waiters[0].future.done():
+                    waiters.popleft()
+                    self.depth -= 1
+                if waiters:
+                    return waiters[0]
+                del sessions[session_id]
+        return None
+
+    def pop(self, waiter: _Waiter):
+        sessions = self.sessions[waiter.priority]
+        waiters = sessions[waiter.session_id]
+        waiters.popleft()
+        self.depth -= 1
+        if waiters:
+            sessions.move_to_end(waiter.session_id)
+        else:
+            del sessions[waiter.session_id]
+
+    def wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1) if self.requests else 0.0,
+                   self.tokens.wait_time(tokens) if self.tokens else 0.0)
+
+    def consume(self, tokens: int):
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(tokens)
+
+    def refund(self, tokens: int):
+        """
+        Gives back the request slot and tokens of an admitted call that was not sent.
+        """
+        if self.requests:
+            self.requests.consume(-1)
+        if self.tokens:
+            self.tokens.consume(-tokens)
+
+
+class LLMScheduler:
+    """
+    Admits LLM calls under per-model requests-per-minute and tokens-per-minute limits.
+    The limits apply to the calls of the process the scheduler runs in.
+
+    Calls that exceed the limits wait in a queue per model instead of being sent and rejected by
+    the provider. Waiting calls are admitted by priority class, and within a class round robin
+    across sessions. Calls are admitted with an estimate of their tokens, which is corrected with
+    the actual usage once they finish.
+
+    Attributes:
+        limits (dict[str, RateLimit]): Rate limits by model name.
+        default_limit (Optional[RateLimit]): Rate limit of models not listed in `limits`. None
+            leaves them unlimited.
+        agent_priorities (dict[str, Priority]): Priority classes by agent or tool name. Calls of
+            agents not listed are NORMAL. By default the FinalOutputAgent, which finishes a
+            session, is HIGH and the QueryAnalyzer, which starts one, is LOW.
+        metrics (MetricsRegistry): Registry receiving the queue depth gauges, queue wait
+            histograms and throttling counters.
+    """
+
+    def __init__(self, limits: Optional[dict[str, RateLimit]] = None,
+                 default_limit: Optional[RateLimit] = None,
+                 agent_priorities: Optional[dict[str, Priority]] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.agent_priorities = dict(DEFAULT_AGENT_PRIORITIES if agent_priorities is None else agent_priorities)
+        self.metrics = metrics or MetricsRegistry()
+        self._queues: dict[str, Optional[_ModelQueue]] = {}
+
+    def priority_of(self, agent: Optional[str]) -> Priority:
+        """
+        Returns the priority class of an agent's calls.
+        """
+        return self.agent_priorities.get(agent, Priority.NORMAL)
+
+    def _queue(self, model: str) -> Optional[_ModelQueue]:
+        if model not in self._queues:
+            limit = self.limits.get(model, self.default_limit)
+            queue = _ModelQueue(limit) if limit is not None else None
+            if queue is not None:
+                self.metrics.register_gauge("llm_queue_depth", lambda: queue.depth, model=model)
+            self._queues[model] = queue
+        return self._queues[model]
+
+    async def acquire(self, model: str, tokens: int, session_id: Optional[str] = None, agent: Optional[str] = None):
+        """
+        Waits until a call may be sent to the model.
+
+        Args:
+            model (str): The model name.
+            tokens (int): Estimated tokens of the call.
+            session_id (str, optional): The session the call is made for.
+            agent (str, optional): The agent or tool making the call, which selects its priority class.
+        """
+        queue = self._queue(model)
+        if queue is None:
+            return
+        priority = self.priority_of(agent)
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), session_id or "", tokens, priority)
+        queue.push(waiter)
+        self._dispatch(model, queue)
+        if not waiter.future.done():
+            self.metrics.inc("llm_throttled", model=model)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                queue.refund(tokens)
+            raise
+        self.metrics.observe("llm_queue_wait_seconds", time.monotonic() - waiter.enqueued_at,
+                             model=model, priority=priority.name.lower())
+
+    def settle(self, model: str, estimated: int, actual: int):
+        """
+        Corrects the token bucket of the model with the actual tokens of an admitted call.
+        """
+        queue = self._queues.get(model)
+        if queue is None or queue.tokens is None:
+            return
+        queue.tokens.consume(actual - estimated)
+
+    def _dispatch(self, model: str, queue: _ModelQueue):
+        if queue.timer is not None:
+            queue.timer.cancel()
+            queue.timer = None
+        while True:
+            waiter = queue.peek()
+            if waiter is None:
+                return
+            wait = queue.wait_time(waiter.tokens)
+            if wait > 0:
+                queue.timer = asyncio.get_running_loop().call_later(wait, self._dispatch, model, queue)
+                return
+            queue.pop(waiter)
+            queue.consume(waiter.tokens)
+            waiter.future.set_result(None)
@@ -0,0 +1,467 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+
+from .metrics import MetricsRegistry
+from .queues import ClientQueue, QueueClosed, QueuePolicy
+from .usage import merge_usage_stats
+
+logger = logging.getLogger("otools_autogen")
+
+
+def shard_for(session_id: str, workers: int) -> int:
+    """
+    Returns the index of the worker owning a session. The mapping only depends on the session ID
+    and the number of workers, so it is stable across worker restarts.
+
+    Args:
+        session_id (str): The session ID.
+        workers (int): The number of workers.
+
+    Returns:
+        int: The worker index.
+    """
+    digest = hashlib.sha1(session_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % workers
+
+
+def _start_reader(conn, loop: asyncio.AbstractEventLoop, on_item):
+    """
+    Reads items from a pipe connection on a daemon thread and hands them to the event loop.
+    A closed connection is reported as None.
+    """
+    def read():
+        while True:
+            try:
+                item = conn.recv()
+            except (EOFError, OSError):
+                item = None
+            try:
+                loop.call_soon_threadsafe(on_item, item)
+            except RuntimeError:
+                return
+            if item is None:
+                return
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_worker(conn, tools: list, runtime_options: dict):
+    """
+    Entry point of a worker process: runs a `Runtime` serving commands received over the pipe.
+    """
+    asyncio.run(_serve_worker(conn, tools, runtime_options))
+
+
+async def _serve_worker(conn, tools: list, runtime_options: dict):
+    from .runtime import Runtime
+
+    runtime = Runtime(**runtime_options)
+    for tool_name, tool_cls in tools:
+        runtime.register_tool(tool_name, tool_cls)
+    await runtime.start()
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+    _start_reader(conn, loop, inbox.put_nowait)
+    pending: dict[str, int] = {}
+    forwarders: dict[str, asyncio.Task] = {}
+    tasks: set[asyncio.Task] = set()
+
+    def reply(kind: str, request_id: int, payload: Any):
+        try:
+            conn.send((kind, request_id, payload))
+        except (BrokenPipeError, OSError):
+            logger.debug("Worker lost the connection to the front process")
+
+    async def forward(session_id: str):
+        try:
+            while pending.get(session_id, 0) > 0:
+                async for response in runtime.stream(session_id):
+                    reply("event", 0, response)
+                pending[session_id] -= 1
+        except RuntimeError:
+            pass
+        finally:
+            forwarders.pop(session_id, None)
+            pending.pop(session_id, None)
+
+    async def handle(command: str, request_id: int, payload: Any):
+        try:
+            if command == "send":
+                session_id, message = payload
+                session_id = await runtime.send_message(message, session_id)
+                pending[session_id] = pending.get(session_id, 0) + 1
+                if session_id not in forwarders:
+                    forwarders[session_id] = asyncio.create_task(forward(session_id))
+                reply("result", request_id, session_id)
+            elif command == "ping":
+                reply("result", request_id, "pong")
+            elif command == "metrics":
+                reply("result", request_id, runtime.get_metrics())
+            elif command == "usage":
+                reply("result", request_id, runtime.get_usage_stats())
+            elif command == "close_session":
+                runtime.close_session(payload)
+                reply("result", request_id, None)
+            else:
+                raise ValueError(f"Unknown worker command: {command}")
+        except Exception as e:
+            reply("error", request_id, f"{type(e).__name__}: {e}")
+
+    while True:
+        item = await inbox.get()
+        if item is None or item[0] == "stop":
+            when_idle = bool(item[2]) if item is not None else False
+            await runtime.stop(when_idle)
+            if item is not None:
+                reply("result", item[1], None)
+            break
+        task = asyncio.create_task(handle(*item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    conn.close()
+
+
+class ShardedRuntime:
+    """
+    Front end that shards sessions across worker processes, each running its own `Runtime`.
+
+    Sessions are assigned to workers by a hash of their session ID, so all messages of a session
+    are handled by the same worker, its agents and its tool instances. `send_message` and `stream`
+    have the same interface as on `Runtime`; requests and responses travel over local pipes. A
+    background task pings every worker and restarts workers that died or stopped responding. The
+    sessions of a restarted worker are lost: their clients receive a final `SessionClosed` response,
+    and commands awaiting the worker's answer fail with a `RuntimeError`.
+
+    Tool classes and runtime options are sent to the workers when they are spawned, so tool
+    classes must be importable from a module and the options must be picklable. Shared pools
+    (`llm`, `http`) cannot be passed; every worker creates its own. The `rate_limits` and
+    `default_rate_limit` options are divided evenly among the workers, so together they stay
+    within the configured limits.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        runtime_options (dict): Keyword arguments of the `Runtime` created in every worker.
+        health_check_interval (float): Seconds between worker health checks.
+        health_check_timeout (float): Seconds a worker has to answer a health check.
+        request_timeout (float): Seconds a worker has to answer a command.
+        metrics (MetricsRegistry): Metrics of the front process, such as worker restarts.
+    """
+
+    @dataclass
+    class Worker:
+        index: int
+        process: Any
+        conn: Any
+        started_at: float = field(default_factory=time.monotonic)
+
+    def __init__(self, workers: int = 2,
+                 runtime_options: Optional[dict] = None,
+                 health_check_interval: float = 5.0,
+                 health_check_timeout: float = 5.0,
+                 request_timeout: float = 30.0,
+                 session_idle_ttl: Optional[float] = 3600.0):
+        """
+        Initializes the sharded runtime.
+
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to 2.
+            runtime_options (dict, optional): Keyword arguments of the `Runtime` created in every
+                worker, such as `planning` or `max_sessions`. Defaults to None.
+            health_check_interval (float, optional): Seconds between health checks. Defaults to 5.
+            health_check_timeout (float, optional): Seconds a worker has to answer a health check
+                before it is restarted. Defaults to 5.
+            request_timeout (float, optional): Seconds a worker has to answer a command. Defaults to 30.
+            session_idle_ttl (float, optional): Seconds after which the front process forgets the
+                response queue of an idle session. Defaults to 3600.
+        """
+        self.workers = workers
+        self.runtime_options = dict(runtime_options or {})
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.request_timeout = request_timeout
+        self.session_idle_ttl = session_idle_ttl
+        self.metrics = MetricsRegistry()
+        self._tools: list[tuple[str, type]] = []
+        self._workers: list[Optional[ShardedRuntime.Worker]] = []
+        self._pending: dict[int, tuple[ShardedRuntime.Worker, asyncio.Future]] = {}
+        self._request_ids = itertools.count(1)
+        self._queues: dict[str, ClientQueue] = {}
+        self._last_active: dict[str, float] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        self._context = multiprocessing.get_context("spawn")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.metrics.register_gauge("shard_sessions", lambda: len(self._queues))
+
+    def register_tool(self, tool_name: str, tool: type):
+        """
+        Registers a tool in every worker.
+
+        Args:
+            tool_name (str): The name to associate with the tool.
+            tool (type[Tool]): The tool class; it must be importable from a module.
+        """
+        self._tools.append((tool_name, tool))
+
+    def _worker_options(self) -> dict:
+        """
+        Returns the runtime options of a worker, with its share of the rate limits.
+        """
+        options = dict(self.runtime_options)
+        if options.get("rate_limits"):
+            options["rate_limits"] = {model: limit.share(self.workers)
+                                      for model, limit in options["rate_limits"].items()}
+        if options.get("default_rate_limit") is not None:
+            options["default_rate_limit"] = options["default_rate_limit"].share(self.workers)
+        return options
+
+    def _spawn(self, index: int) -> "ShardedRuntime.Worker":
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(child_conn, list(self._tools), self._worker_options()),
+            name=f"otools-worker-{index}",
+            daemon=True)
+        process.start()
+        child_conn.close()
+        worker = ShardedRuntime.Worker(index=index, process=process, conn=parent_conn)
+        _start_reader(parent_conn, self._loop, lambda item, worker=worker: self._on_item(worker, item))
+        logger.debug(f"ShardedRuntime started worker {index} with pid {process.pid}")
+        return worker
+
+    def _on_item(self, worker: "ShardedRuntime.Worker", item):
+        if item is None:
+            logger.debug(f"ShardedRuntime lost the connection to worker {worker.index}")
+            self._fail_pending(worker, "lost the connection")
+            return
+        kind, request_id, payload = item
+        if kind == "event":
+            queue = self._queues.get(payload.session_id)
+            if queue is not None:
+                queue.put_nowait(payload)
+            return
+        _, future = self._pending.pop(request_id, (None, None))
+        if future is None or future.done():
+            return
+        if kind == "error":
+            future.set_exception(RuntimeError(payload))
+        else:
+            future.set_result(payload)
+
+    def _fail_pending(self, worker: "ShardedRuntime.Worker", reason: str):
+        """
+        Fails the commands awaiting an answer from a worker that died or is being restarted.
+        """
+        for request_id, (owner, future) in list(self._pending.items()):
+            if owner is worker:
+                self._pending.pop(request_id, None)
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Worker {worker.index} {reason}"))
+
+    async def _request(self, index: int, command: str, payload: Any = None,
+                       timeout: Optional[float] = None) -> Any:
+        worker = self._workers[index]
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (worker, future)
+        try:
+            worker.conn.send((command, request_id, payload))
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def start(self):
+        """
+        Spawns the workers and starts the background health checks.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._workers = [self._spawn(index) for index in range(self.workers)]
+        await asyncio.gather(*(self._request(index, "ping", timeout=max(self.request_timeout, 60.0))
+                               for index in range(self.workers)))
+        self._health_task = asyncio.create_task(self._check_health())
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for index, worker in enumerate(self._workers):
+                healthy = worker.process.is_alive()
+                if healthy:
+                    try:
+                        await self._request(index, "ping", timeout=self.health_check_timeout)
+                    except Exception:
+                        healthy = False
+                if not healthy:
+                    try:
+                        await self._restart(index)
+                    except Exception:
+                        # retried on the next health check, which finds the worker unhealthy again
+                        logger.exception(f"ShardedRuntime could not restart worker {index}")
+                        self.metrics.inc("shard_worker_restart_failures", worker=index)
+            try:
+                self._forget_idle_sessions()
+            except Exception:
+                logger.exception("ShardedRuntime could not forget idle sessions")
+
+    async def _restart(self, index: int):
+        worker = self._workers[index]
+        logger.warning(f"ShardedRuntime restarting unhealthy worker {index}")
+        self.metrics.inc("shard_worker_restarts", worker=index)
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        self._fail_pending(worker, "restarted")
+        for session_id in [sid for sid in self._queues if shard_for(sid, self.workers) == index]:
+            self._close_queue(session_id, "worker restarted")
+        self._workers[index] = self._spawn(index)
+
+    def _forget_idle_sessions(self):
+        if self.session_idle_ttl is None:
+            return
+        now = time.monotonic()
+        for session_id in [sid for sid, last in self._last_active.items() if now - last > self.session_idle_ttl]:
+            self._close_queue(session_id, "idle")
+
+    def _close_queue(self, session_id: str, reason: str):
+        """
+        Forgets the response queue of a session, ending its stream with a final `SessionClosed` response.
+        """
+        from .runtime import UserResponse
+
+        self._last_active.pop(session_id, None)
+        queue = self._queues.pop(session_id, None)
+        if queue is None:
+            return
+        queue.put_nowait(UserResponse(
+            type="SessionClosed",
+            session_id=session_id,
+            message=f"Session closed: {reason}",
+            tool_used=None,
+            final=True,
+            conclusion=False,
+            step_no=0))
+        queue.close()
+
+    def _queue_for(self, session_id: str) -> ClientQueue:
+        queue = self._queues.get(session_id)
+        if queue is None:
+            queue = ClientQueue(
+                maxsize=self.runtime_options.get("client_queue_size", 100),
+                policy=self.runtime_options.get("client_queue_policy", QueuePolicy.DROP),
+                metrics=self.metrics)
+            self._queues[session_id] = queue
+        self._last_active[session_id] = time.monotonic()
+        return queue
+
+    async def send_message(self, message, session_id: str = None) -> str:
+        """
+        Sends a message to the worker owning the session, creating the session if needed.
+
+        Args:
+            message (UserRequest): The message to be sent.
+            session_id (str, optional): The ID of the session. A new session is created when not
+                provided or unknown to the worker.
+
+        Returns:
+            str: The session ID associated with the message.
+        """
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        self._queue_for(session_id)
+        index = shard_for(session_id, self.workers)
+        self.metrics.inc("shard_requests", worker=index)
+        return await self._request(index, "send", (session_id, message))
+
+    async def stream(self, session_id: str):
+        """
+        Streams the responses of a session until a final response is received or its queue is closed.
+
+        Args:
+            session_id (str): The unique identifier for the session.
+
+        Yields:
+            UserResponse: The responses of the session.
+
+        Raises:
+            RuntimeError: If the session is unknown.
+        """
+        queue = self._queues.get(session_id)
+        if queue is None:
+            raise RuntimeError("Invalid session")
+        while True:
+            try:
+                response = await queue.get()
+            except QueueClosed:
+                break
+            self._last_active[session_id] = time.monotonic()
+            yield response
+            if response.final:
+                break
+
+    async def close_session(self, session_id: str):
+        """
+        Closes a session on its worker.
+
+        Args:
+            session_id (str): The session ID.
+        """
+        await self._request(shard_for(session_id, self.workers), "close_session", session_id)
+
+    async def get_metrics(self) -> dict:
+        """
+        Collects the metrics of the front process and of every worker.
+
+        Returns:
+            dict: The front process snapshot under `front` and the worker snapshots under `workers`.
+        """
+        snapshots = await asyncio.gather(
+            *(self._request(index, "metrics") for index in range(self.workers)), return_exceptions=True)
+        return {
+            "front": self.metrics.snapshot(),
+            "workers": [None if isinstance(snapshot, BaseException) else snapshot for snapshot in snapshots],
+        }
+
+    async def get_usage_stats(self) -> dict:
+        """
+        Collects the token usage and cost of the completions of all workers.
+
+        Returns:
+            dict: The usage of all workers merged, in the format of `Runtime.get_usage_stats`,
+                with the number of workers that did not answer under `unavailable_workers`.
+        """
+        snapshots = await asyncio.gather(
+            *(self._request(index, "usage") for index in range(self.workers)), return_exceptions=True)
+        usage = merge_usage_stats([snapshot for snapshot in snapshots if not isinstance(snapshot, BaseException)])
+        usage["unavailable_workers"] = sum(isinstance(snapshot, BaseException) for snapshot in snapshots)
+        return usage
+
+    async def stop(self, when_idle: bool = False):
+        """
+        Stops the health checks and all workers.
+
+        Args:
+            when_idle (bool, optional): If True, every worker stops when its runtime becomes idle.
+        """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for index, worker in enumerate(self._workers):
+            try:
+                await self._request(index, "stop", when_idle)
+            except Exception as e:
+                logger.debug(f"ShardedRuntime worker {index} did not stop cleanly: {e}")
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.conn.close()
+        for session_id in list(self._queues):
+            self._close_queue(session_id, "runtime stopped")
+        self._last_active.clear()
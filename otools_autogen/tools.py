@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from copy import deepcopy
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+import json
 from pydantic import BaseModel
 from autogen_core import BaseAgent, MessageContext
-from .utils import only_direct
+from .utils import only_direct, run_cancellable
+from .llm import LLMClientPool, default_llm_pool
+from .executor import ToolExecutor, default_tool_executor
+from .http_client import HTTPClientPool, HTTPResponse, default_http_pool
+from .cache import CachePolicy, ResponseCache, cache_key
 import logging
 
 logger = logging.getLogger("otools_autogen")
@@ -19,6 +27,8 @@ class ToolCard:
         inputs (type[BaseModel]): The input data model type, derived from BaseModel.
         outputs (type[BaseModel]): The output data model type, derived from BaseModel.
         user_metadata (dict): Additional metadata provided by the user.
+        cache_policy (Optional[CachePolicy]): If set, responses are memoized per validated input
+            following the policy. Only tools whose output depends on the input alone should set it.
     Methods:
         get_metadata():
             Returns a dictionary containing metadata about the tool, including
@@ -32,6 +42,7 @@ class ToolCard:
     inputs: type[BaseModel]
     outputs: type[BaseModel]
     user_metadata: dict
+    cache_policy: Optional[CachePolicy] = None
 
     def get_metadata(self):
         return {
@@ -45,6 +56,82 @@ class ToolCard:
         }
     
     
+@dataclass(frozen=True)
+class CompiledToolCard:
+    """
+    A snapshot of a `ToolCard` taken at registration time, with its metadata precomputed.
+
+    The snapshot holds deep copies of the card's demo inputs and user metadata, so later changes
+    to the registered card do not reach it. It is shared by all sessions and must be treated as
+    read-only.
+
+    Attributes:
+        card (ToolCard): A copy of the tool card taken at registration time.
+        metadata (Mapping[str, Any]): The JSON-compatible metadata of the tool, including the
+            input and output JSON schemas and the dumped demo inputs.
+        prompt (str): The metadata serialized to a JSON string, ready to be placed in LLM prompts.
+    """
+    card: ToolCard
+    metadata: Mapping[str, Any]
+    prompt: str
+
+    @classmethod
+    def compile(cls, card: ToolCard) -> "CompiledToolCard":
+        """
+        Copies the card and generates its JSON schemas and prompt string once.
+
+        Args:
+            card (ToolCard): The tool card to compile.
+
+        Returns:
+            CompiledToolCard: The compiled card.
+        """
+        card = replace(card, demo_input=deepcopy(card.demo_input), user_metadata=deepcopy(card.user_metadata))
+        metadata = card.get_metadata()
+        metadata["demo_input"] = [
+            demo.model_dump(mode="json") if isinstance(demo, BaseModel) else demo
+            for demo in card.demo_input
+        ]
+        prompt = json.dumps(metadata, ensure_ascii=False, default=str)
+        return cls(card=card, metadata=MappingProxyType(metadata), prompt=prompt)
+
+
+@dataclass(frozen=True)
+class ToolRegistry:
+    """
+    A read-only view of all registered tools, built once per tool set.
+
+    Attributes:
+        cards (Mapping[str, CompiledToolCard]): Compiled cards keyed by the registered tool name.
+        tool_cards (Mapping[str, ToolCard]): The tool card snapshots keyed by the registered tool name.
+        names (tuple[str, ...]): The registered tool names.
+        prompt (str): The metadata of all tools serialized for LLM prompts, one tool per line.
+    """
+    cards: Mapping[str, CompiledToolCard]
+    tool_cards: Mapping[str, ToolCard]
+    names: tuple[str, ...]
+    prompt: str
+
+    @classmethod
+    def build(cls, compiled_cards: Mapping[str, CompiledToolCard]) -> "ToolRegistry":
+        """
+        Builds the registry from compiled tool cards.
+
+        Args:
+            compiled_cards (Mapping[str, CompiledToolCard]): Compiled cards keyed by tool name.
+
+        Returns:
+            ToolRegistry: The registry.
+        """
+        cards = MappingProxyType(dict(compiled_cards))
+        return cls(
+            cards=cards,
+            tool_cards=MappingProxyType({name: compiled.card for name, compiled in cards.items()}),
+            names=tuple(cards.keys()),
+            prompt="\n".join(compiled.prompt for compiled in cards.values()),
+        )
+
+
 
 
 class Tool(ABC):
@@ -60,7 +147,35 @@ class Tool(ABC):
             An abstract asynchronous method that must be implemented to define
             the tool's execution logic. It takes an input of type `BaseModel` and
             returns an output of type `BaseModel`.
+        llm (LLMClientPool):
+            The pooled LLM client layer for LLM-backed tools. It is bound by `Runtime.register_tool`
+            and falls back to a process-wide default pool when the tool runs standalone.
+        executor (ToolExecutor):
+            The thread pool for blocking code, bound by `Runtime.register_tool` the same way.
+        blocking (bool):
+            Declares the tool as blocking. Blocking tools implement `run` as a plain synchronous
+            method, which is executed on the runtime's `ToolExecutor` instead of the event loop.
     """
+    blocking: bool = False
+    _llm: LLMClientPool = None
+    _executor: ToolExecutor = None
+
+    @property
+    def llm(self) -> LLMClientPool:
+        return self._llm or default_llm_pool()
+
+    @llm.setter
+    def llm(self, pool: LLMClientPool):
+        self._llm = pool
+
+    @property
+    def executor(self) -> ToolExecutor:
+        return self._executor or default_tool_executor()
+
+    @executor.setter
+    def executor(self, executor: ToolExecutor):
+        self._executor = executor
+
     @property
     @abstractmethod
     def card(self) -> ToolCard:
@@ -69,10 +184,52 @@ class Tool(ABC):
     @abstractmethod
     async def run(self, inputs: BaseModel) -> BaseModel:
         pass
+
+
+class AsyncHTTPTool(Tool):
+    """
+    Base class for tools calling HTTP APIs without blocking the event loop.
+    Requests go through the runtime's shared `HTTPClientPool`, so connections to the same
+    hosts are kept alive and reused across calls and sessions.
+    Attributes:
+        base_url (Optional[str]): Base URL that relative request paths are resolved against.
+            Subclasses set their API's URL; tests can point an instance at a local stub server
+            by passing `base_url` to the constructor or assigning the attribute.
+        max_response_bytes (Optional[int]): Maximum response body size. Defaults to the pool limit.
+        timeout (Optional[float]): Read timeout in seconds. Defaults to the pool timeout.
+        http (HTTPClientPool): The pooled HTTP client, bound by `Runtime.register_tool` and
+            falling back to a process-wide default pool when the tool runs standalone.
+    Methods:
+        request(method, url, **kwargs) -> HTTPResponse:
+            Sends a request, resolving `url` against `base_url` when it is relative.
+    """
+    base_url: Optional[str] = None
+    max_response_bytes: Optional[int] = None
+    timeout: Optional[float] = None
+    _http: HTTPClientPool = None
+
+    def __init__(self, base_url: Optional[str] = None):
+        if base_url is not None:
+            self.base_url = base_url
+
+    @property
+    def http(self) -> HTTPClientPool:
+        return self._http or default_http_pool()
+
+    @http.setter
+    def http(self, pool: HTTPClientPool):
+        self._http = pool
+
+    async def request(self, method: str, url: str, **kwargs) -> HTTPResponse:
+        if self.base_url and not url.startswith(("http://", "https://")):
+            url = self.base_url.rstrip("/") + "/" + url.lstrip("/")
+        kwargs.setdefault("max_bytes", self.max_response_bytes)
+        kwargs.setdefault("timeout", self.timeout)
+        return await self.http.request(method, url, **kwargs)
     
     
     
-def create_tool_class(tool: Tool) -> type[BaseAgent]:
+def create_tool_class(tool: Tool, card: ToolCard = None, cache: ResponseCache = None) -> type[BaseAgent]:
         """
         Dynamically creates a tool-specific agent class that inherits from `BaseAgent`.
         This function generates a new class with a custom `__init__` method and an
@@ -82,22 +239,67 @@ def create_tool_class(tool: Tool) -> type[BaseAgent]:
             tool (Tool): An instance of the `Tool` class containing the tool's
                          configuration, including its card inputs, outputs, and
                          execution logic.
+            card (ToolCard, optional): The card snapshot to use instead of `tool.card`.
+            cache (ResponseCache, optional): The cache memoizing the tool's responses. Defaults to
+                a cache built from the card's `cache_policy`, if any.
         Returns:
             type[BaseAgent]: A dynamically created class that inherits from `BaseAgent`
                              and implements the tool-specific behavior.
+        Note:
+            The tool card is read once when the class is created, so tools building their
+            card on every access are not asked for it again on each message.
+            Tools declared as `blocking` are run on the tool's executor.
+            With a cache, responses are keyed by the tool id and the canonical JSON of the
+            validated input, and concurrent identical calls share a single run of the tool.
+            Responses reporting `success=False` are not cached.
+            Every message is handled within a `tool.<tool id>` span of the tracer of the tool's
+            LLM client pool, recording whether the response came from the cache.
+            The tool run is linked to the message's cancellation token, so a cancelled call,
+            for example after a timeout, stops the tool. A cached run shared by concurrent
+            identical calls is stopped once all of them are cancelled.
         """
+        card = card or tool.card
+        if cache is None and card.cache_policy is not None:
+            cache = ResponseCache.from_policy(card.tool_id, card.cache_policy)
+
+        async def run_tool(parsed_message):
+            if tool.blocking:
+                out = await tool.executor.run(tool.run, parsed_message)
+            else:
+                out = await tool.run(parsed_message)
+            return card.outputs.model_validate(out)
+
+        async def run_cached(parsed_message, span):
+            called = False
+
+            async def call():
+                nonlocal called
+                called = True
+                return (await run_tool(parsed_message)).model_dump_json()
+
+            def should_store(value: str) -> bool:
+                return json.loads(value).get("success", True) is not False
+
+            key = cache_key(card.tool_id, json.dumps(parsed_message.model_dump(mode="json"),
+                                                     sort_keys=True, ensure_ascii=False))
+            value = await cache.get_or_call(key, call, should_store)
+            span.set(cache_hit=not called)
+            return card.outputs.model_validate_json(value)
+
         async def on_message_impl(self, message, ctx: MessageContext):
             parsed_message = None
-            if isinstance(message, tool.card.inputs):
+            if isinstance(message, card.inputs):
                 parsed_message = message
             else:
-                parsed_message = tool.card.inputs.model_validate(message)
-            out = await tool.run(parsed_message) 
-            parsed_response = tool.card.outputs.model_validate(out)                           
-            return parsed_response
+                parsed_message = card.inputs.model_validate(message)
+            with tool.llm.tracer.span(f"tool.{card.tool_id}", session_id=self.id.key, tool_id=card.tool_id) as span:
+                if cache is not None:
+                    return await run_cancellable(run_cached(parsed_message, span), ctx)
+                parsed_response = await run_cancellable(run_tool(parsed_message), ctx)
+                return parsed_response
 
         on_message_impl.__annotations__ = {
-            "message": tool.card.inputs,
+            "message": card.inputs,
             "ctx": MessageContext,
             "return": None,
         }
@@ -105,14 +307,14 @@ def create_tool_class(tool: Tool) -> type[BaseAgent]:
         on_message_impl = only_direct(on_message_impl)
 
         def __init__(self):
-            logger.debug(f"Tool initialization {tool.card.name} agent. {str(self)}")
-            super(self.__class__, self).__init__(f"Tool: {tool.card.name} agent.")
+            logger.debug(f"Tool initialization {card.name} agent. {str(self)}")
+            super(self.__class__, self).__init__(f"Tool: {card.name} agent.")
 
         class_dict = {
             "__init__": __init__,
             "on_message_impl": on_message_impl
         }
 
-        ToolCls = type(tool.card.tool_id, (BaseAgent,), class_dict)
+        ToolCls = type(card.tool_id, (BaseAgent,), class_dict)
 
         return ToolCls
\ No newline at end of file
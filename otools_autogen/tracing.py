@@ -0,0 +1,235 @@
+from abc import ABC
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Iterator, Optional
+import logging
+import time
+import uuid
+
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger("otools_autogen")
+
+
+@dataclass
+class Span:
+    """
+    A timed operation of a session, such as an Orchestrator stage, an agent call or a tool run.
+
+    Attributes:
+        name (str): Name of the operation, e.g. "stage.tool_call" or "agent.ContextVerifier".
+        trace_id (str): Identifier shared by all spans of a session.
+        span_id (str): Identifier of the span.
+        parent_id (Optional[str]): Identifier of the enclosing span.
+        start (float): Wall-clock start time in seconds.
+        end (Optional[float]): Wall-clock end time in seconds, None while the span is open.
+        attributes (dict[str, Any]): Attributes such as session_id, step_no, tool_id, token usage
+            and cache hits.
+        error (Optional[str]): The error that ended the span, if any.
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Returns the duration in seconds, or None while the span is open.
+        """
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes: Any):
+        """
+        Sets attributes of the span. None values are ignored.
+        """
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def add(self, key: str, value: float):
+        """
+        Adds a value to a numeric attribute, e.g. the tokens of several completions.
+        """
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+
+class SpanExporter(ABC):
+    """
+    Receives spans as they start and end.
+    """
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    Keeps the most recently finished spans in memory, e.g. for tests or a debug endpoint.
+
+    Attributes:
+        max_spans (int): Number of spans kept.
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self._spans: deque = deque(maxlen=max_spans)
+
+    def on_end(self, span: Span):
+        self._spans.append(span)
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> list[Span]:
+        """
+        Returns the finished spans, optionally only those of one trace.
+        """
+        return [span for span in self._spans if trace_id is None or span.trace_id == trace_id]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class OpenTelemetrySpanExporter(SpanExporter):
+    """
+    Mirrors spans as OpenTelemetry spans, keeping their nesting, so they reach any exporter
+    configured on the tracer provider, e.g. OTLP.
+
+    Attributes:
+        tracer_provider: The OpenTelemetry tracer provider. Defaults to the global provider.
+    """
+
+    def __init__(self, tracer_provider: Any = None):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer("otools_autogen", tracer_provider=tracer_provider)
+        self._open: dict[str, Any] = {}
+
+    def on_start(self, span: Span):
+        parent = self._open.get(span.parent_id)
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        self._open[span.span_id] = self._tracer.start_span(
+            span.name, context=context, start_time=int(span.start * 1e9))
+
+    def on_end(self, span: Span):
+        otel_span = self._open.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attributes({key: value if isinstance(value, (bool, int, float, str)) else str(value)
+                                  for key, value in span.attributes.items()})
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("otools_autogen_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """
+    Returns the innermost open span of the running task, if any.
+    """
+    return _current_span.get()
+
+
+class Tracer:
+    """
+    Creates spans, records their durations in the `span_duration_seconds` histogram of the
+    metrics, labelled by span name, and hands them to the exporters.
+
+    Spans nest within a task. Agents and tools handle their messages in tasks of the agent
+    runtime, which do not inherit the caller's context, so spans started without an enclosing
+    span are attached to the open session span of their `session_id`.
+
+    Attributes:
+        metrics (MetricsRegistry): Registry receiving the span duration histograms.
+        exporters (list[SpanExporter]): Exporters receiving the spans.
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None, exporters: Optional[list[SpanExporter]] = None):
+        self.metrics = metrics or MetricsRegistry()
+        self.exporters = list(exporters or [])
+        self._sessions: dict[str, Span] = {}
+
+    @contextmanager
+    def span(self, name: str, session_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Opens a span for the duration of the block.
+
+        Args:
+            name (str): Name of the span.
+            session_id (str, optional): The session the operation belongs to.
+            **attributes: Initial attributes of the span.
+
+        Yields:
+            Span: The open span, whose attributes may be extended within the block.
+        """
+        parent = _current_span.get()
+        if parent is None and session_id is not None:
+            parent = self._sessions.get(session_id)
+        if session_id is None and parent is not None:
+            session_id = parent.attributes.get("session_id")
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent is not None else None)
+        span.set(session_id=session_id, **attributes)
+        token = _current_span.set(span)
+        self._start(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self._end(span)
+
+    @contextmanager
+    def session(self, session_id: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Opens the root span of a session request. Spans of the session's agents and tools started
+        while it is open are attached to it.
+        """
+        with self.span("session", session_id=session_id, **attributes) as span:
+            self._sessions[session_id] = span
+            try:
+                yield span
+            finally:
+                if self._sessions.get(session_id) is span:
+                    del self._sessions[session_id]
+
+    def _start(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.on_start(span)
+            except Exception as e:
+                logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+    def _end(self, span: Span):
+        span.end = time.time()
+        self.metrics.observe("span_duration_seconds", span.duration, span=span.name)
+        for exporter in self.exporters:
+            try:
+                exporter.on_end(span)
+            except Exception as e:
+                logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+
+def traced_handler(func):
+    """
+    Decorates the message handler of an internal agent to run it within an `agent.<agent type>`
+    span of the session, using the tracer of the agent's LLM client pool.
+    """
+    @wraps(func)
+    async def wrapper(self, message, ctx):
+        with self._llm.tracer.span(f"agent.{self.id.type}", session_id=self.id.key):
+            return await func(self, message, ctx)
+    return wrapper
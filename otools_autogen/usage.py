@@ -0,0 +1,258 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+import threading
+
+
+@dataclass
+class TokenUsage:
+    """
+    Token usage and cost of a group of completions.
+
+    Attributes:
+        requests (int): Number of completions.
+        prompt_tokens (int): Prompt tokens, including the cached ones.
+        completion_tokens (int): Completion tokens.
+        cached_prompt_tokens (int): Prompt tokens served from the provider's prompt cache.
+        cost (float): Cost in the currency of the configured model pricing.
+    """
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "TokenUsage"):
+        """
+        Adds the usage of other completions to this one.
+        """
+        self.requests += other.requests
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_prompt_tokens += other.cached_prompt_tokens
+        self.cost += other.cost
+
+    @classmethod
+    def from_dict(cls, usage: dict) -> "TokenUsage":
+        return cls(
+            requests=usage["requests"],
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            cached_prompt_tokens=usage["cached_prompt_tokens"],
+            cost=usage["cost"])
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "total_tokens": self.total_tokens,
+            "cost": self.cost,
+        }
+
+
+@dataclass(frozen=True)
+class ModelPricing:
+    """
+    Price of a model per million tokens.
+
+    Attributes:
+        prompt (float): Price of a million uncached prompt tokens.
+        completion (float): Price of a million completion tokens.
+        cached_prompt (Optional[float]): Price of a million prompt tokens served from the prompt
+            cache. Defaults to the prompt price.
+    """
+    prompt: float
+    completion: float
+    cached_prompt: Optional[float] = None
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+        """
+        Returns the cost of a completion.
+        """
+        cached_price = self.prompt if self.cached_prompt is None else self.cached_prompt
+        return ((prompt_tokens - cached_prompt_tokens) * self.prompt
+                + cached_prompt_tokens * cached_price
+                + completion_tokens * self.completion) / 1_000_000
+
+
+@dataclass
+class RequestUsage:
+    """
+    Usage of the completions made while handling one user request of a session.
+
+    Attributes:
+        total (TokenUsage): Usage of all completions of the request.
+        steps (dict[int, TokenUsage]): Usage by step; step 0 holds the query analysis.
+        agents (dict[str, TokenUsage]): Usage by agent or LLM-backed tool.
+        step_no (int): The step the request is in; completions are attributed to it.
+    """
+    total: TokenUsage = field(default_factory=TokenUsage)
+    steps: dict[int, TokenUsage] = field(default_factory=lambda: defaultdict(TokenUsage))
+    agents: dict[str, TokenUsage] = field(default_factory=lambda: defaultdict(TokenUsage))
+    step_no: int = 0
+
+    def add(self, agent: str, usage: TokenUsage):
+        self.total.add(usage)
+        self.steps[self.step_no].add(usage)
+        self.agents[agent].add(usage)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total.to_dict(),
+            "steps": {step_no: usage.to_dict() for step_no, usage in sorted(self.steps.items())},
+            "agents": {agent: usage.to_dict() for agent, usage in self.agents.items()},
+        }
+
+
+class UsageTracker:
+    """
+    Accounts the token usage and cost of completions per request step, per agent, per session
+    and in aggregate per agent and model.
+
+    Completions are attributed to the session they are made for and to the step its current
+    request is in when they finish, so completions overlapping a step change, e.g. speculative
+    planning, count towards the earlier step.
+
+    Attributes:
+        pricing (dict[str, ModelPricing]): Pricing by model name. Completions of models without
+            pricing have no cost.
+    """
+
+    def __init__(self, pricing: Optional[dict[str, ModelPricing]] = None):
+        self.pricing = dict(pricing or {})
+        self._lock = threading.Lock()
+        self._total = TokenUsage()
+        self._agents: dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._models: dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._sessions: dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._requests: dict[str, RequestUsage] = {}
+
+    def record(self, session_id: Optional[str], agent: Optional[str], model: str,
+               prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> TokenUsage:
+        """
+        Records the usage of a completion.
+
+        Args:
+            session_id (str, optional): The session the completion was made for, if any.
+            agent (str, optional): The agent or tool that made the completion.
+            model (str): The model name.
+            prompt_tokens (int): Prompt tokens, including the cached ones.
+            completion_tokens (int): Completion tokens.
+            cached_prompt_tokens (int, optional): Prompt tokens served from the prompt cache.
+
+        Returns:
+            TokenUsage: The usage of the completion, including its cost.
+        """
+        pricing = self.pricing.get(model)
+        usage = TokenUsage(
+            requests=1,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+            cost=pricing.cost(prompt_tokens, completion_tokens, cached_prompt_tokens) if pricing else 0.0)
+        agent = agent or "unknown"
+        with self._lock:
+            self._total.add(usage)
+            self._agents[agent].add(usage)
+            self._models[model or "unknown"].add(usage)
+            if session_id is not None:
+                self._sessions[session_id].add(usage)
+                request = self._requests.get(session_id)
+                if request is not None:
+                    request.add(agent, usage)
+        return usage
+
+    def start_request(self, session_id: str):
+        """
+        Starts accounting a new user request of a session, beginning at step 0.
+        """
+        with self._lock:
+            self._requests[session_id] = RequestUsage()
+
+    def begin_step(self, session_id: str, step_no: int):
+        """
+        Attributes the following completions of the session's request to the given step.
+        """
+        with self._lock:
+            request = self._requests.get(session_id)
+            if request is not None:
+                request.step_no = step_no
+
+    def request_total(self, session_id: str) -> TokenUsage:
+        """
+        Returns a copy of the total usage of the session's current request.
+        """
+        with self._lock:
+            request = self._requests.get(session_id)
+            total = TokenUsage()
+            if request is not None:
+                total.add(request.total)
+            return total
+
+    def request_usage(self, session_id: str) -> Optional[dict]:
+        """
+        Returns the usage of the session's current request with its totals by step and agent,
+        and the total of the session, or None if no request was started.
+        """
+        with self._lock:
+            request = self._requests.get(session_id)
+            if request is None:
+                return None
+            usage = request.to_dict()
+            usage["session_total"] = self._sessions[session_id].to_dict()
+            return usage
+
+    def close_session(self, session_id: str):
+        """
+        Drops the per-session usage of a closed session. Aggregates are kept.
+        """
+        with self._lock:
+            self._requests.pop(session_id, None)
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        """
+        Returns the aggregated usage.
+
+        Returns:
+            dict: The `total` usage, the usage by `agents` and by `models`, and the total usage
+                of each open session in `sessions`.
+        """
+        with self._lock:
+            return {
+                "total": self._total.to_dict(),
+                "agents": {agent: usage.to_dict() for agent, usage in self._agents.items()},
+                "models": {model: usage.to_dict() for model, usage in self._models.items()},
+                "sessions": {session_id: usage.to_dict() for session_id, usage in self._sessions.items()},
+            }
+
+
+def merge_usage_stats(snapshots: list[dict]) -> dict:
+    """
+    Merges the usage statistics of several processes, e.g. the workers of a `ShardedRuntime`.
+
+    Args:
+        snapshots (list[dict]): Results of `UsageTracker.stats` of each process.
+
+    Returns:
+        dict: The merged statistics, in the format of `UsageTracker.stats`.
+    """
+    total = TokenUsage()
+    groups: dict[str, dict[str, TokenUsage]] = {"agents": defaultdict(TokenUsage),
+                                                 "models": defaultdict(TokenUsage),
+                                                 "sessions": defaultdict(TokenUsage)}
+    for snapshot in snapshots:
+        total.add(TokenUsage.from_dict(snapshot["total"]))
+        for group, usages in groups.items():
+            for name, usage in snapshot[group].items():
+                usages[name].add(TokenUsage.from_dict(usage))
+    merged = {"total": total.to_dict()}
+    merged.update({group: {name: usage.to_dict() for name, usage in usages.items()}
+                   for group, usages in groups.items()})
+    return merged
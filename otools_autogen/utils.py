@@ -1,34 +1,317 @@
 from functools import wraps
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Optional
 import logging
 from datetime import datetime
 import os
 import base64
+import threading
 from PIL import Image
 from io import BytesIO
 
 
-def image_to_base64_inline(image_path: str) -> str:
+class ImageEncodingCache:
+    """
+    Bounded LRU cache of encoded image data URLs.
+
+    Entries are keyed by the absolute file path together with its modification time and size,
+    so a file that changes on disk is re-encoded on the next access. The total size of the
+    stored data URLs is bounded by a byte budget; least recently used entries are evicted first.
+
+    Attributes:
+        max_bytes (int): The byte budget for all cached data URLs.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that required encoding the image.
+        evictions (int): Number of entries evicted to stay within the byte budget.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(image_path: str, *variant) -> tuple:
+        """
+        Builds the cache key for an image file.
+
+        Args:
+            image_path (str): The file path to the image.
+            *variant: Additional values distinguishing different encodings of the same file.
+
+        Returns:
+            tuple: The key made of the absolute path, mtime, size and the variant values.
+
+        Raises:
+            FileNotFoundError: If the specified image file does not exist.
+        """
+        stat = os.stat(image_path)
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size) + variant
+
+    def get(self, key: tuple):
+        """
+        Returns the cached data URL for the key, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: str):
+        """
+        Stores a data URL, evicting least recently used entries to stay within the byte budget.
+        Values larger than the whole budget are not stored.
+        """
+        size = len(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries. Statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Hits, misses, evictions, number of entries, used bytes and the byte budget.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+image_cache = ImageEncodingCache()
+
+
+@dataclass(frozen=True)
+class ImagePreprocessing:
+    """
+    Configuration of the preprocessing applied to images before they are inlined into LLM prompts.
+
+    Attributes:
+        max_side (Optional[int]): Longest side, in pixels, of the uploaded image. Larger images are
+            downscaled preserving the aspect ratio. None disables downscaling.
+        format (str): Target format used when the image is re-encoded: "JPEG", "WEBP" or "PNG".
+            Images with transparency are encoded as PNG when the target format is JPEG.
+        quality (int): Encoder quality for the lossy formats.
+        keep_original_max_bytes (int): Files up to this size that need no downscaling and are already
+            in a format accepted by the providers are sent as their original bytes.
+    """
+    max_side: Optional[int] = 2048
+    format: str = "JPEG"
+    quality: int = 85
+    keep_original_max_bytes: int = 256 * 1024
+
+
+image_preprocessing = ImagePreprocessing()
+
+_INLINE_MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+_HIGH_BIT_DEPTH_MODES = ("I", "F", "I;16", "I;16B", "I;16L", "I;16N")
+_ALPHA_MODES = ("LA", "La", "PA", "RGBA", "RGBa")
+_ENCODER_MODES = {
+    "JPEG": ("L", "RGB"),
+    "WEBP": ("RGB",),
+    "PNG": ("1", "L", "RGB"),
+}
+
+
+def set_image_preprocessing(preprocessing: ImagePreprocessing):
+    """
+    Replaces the default image preprocessing configuration used by `image_to_base64_inline`.
+
+    Args:
+        preprocessing (ImagePreprocessing): The new default configuration.
+    """
+    global image_preprocessing
+    image_preprocessing = preprocessing
+
+
+def get_image_info(image_path: str) -> Dict[str, Any]:
+        image_info = {}
+        if image_path and os.path.isfile(image_path):
+            image_info["image_path"] = image_path
+            try:
+                with Image.open(image_path) as img:
+                    width, height = img.size
+                    image_format = img.format
+                image_info.update({
+                    "width": width,
+                    "height": height,
+                    "format": image_format,
+                    "size_bytes": os.path.getsize(image_path)
+                })
+            except Exception as e:
+                print(f"Error processing image file: {str(e)}")
+        return image_info
+
+
+def _to_8bit(img: Image.Image) -> Image.Image:
+    """
+    Scales a 16 or 32 bit grayscale image down to 8 bit instead of clipping its values.
+    """
+    if img.mode.startswith("I;16"):
+        scale = 1 / 256
+    else:
+        _, high = img.getextrema()
+        scale = 255 / high if high > 255 else 1
+    if img.mode != "F":
+        img = img.convert("I")
+    return img.point(lambda value: value * scale).convert("L")
+
+
+def _prepare_for_encoding(img: Image.Image, target_format: str) -> tuple[Image.Image, str]:
+    """
+    Converts a decoded image to a mode the target encoder stores faithfully.
+
+    High bit depth images are scaled to 8 bit grayscale, and CMYK, palette and other modes are
+    converted to RGB. Images with transparency keep their alpha channel; as JPEG has none, they
+    are encoded as PNG instead.
+
+    Returns:
+        tuple[Image.Image, str]: The converted image and the format to encode it in.
+    """
+    if img.mode in _HIGH_BIT_DEPTH_MODES:
+        img = _to_8bit(img)
+    if img.mode in _ALPHA_MODES or "transparency" in img.info:
+        if target_format == "JPEG":
+            target_format = "PNG"
+        if img.mode != "RGBA" and not (img.mode == "LA" and target_format == "PNG"):
+            img = img.convert("RGBA")
+    elif img.mode not in _ENCODER_MODES[target_format]:
+        img = img.convert("L" if img.mode == "1" and "L" in _ENCODER_MODES[target_format] else "RGB")
+    return img, target_format
+
+
+def preprocess_image(image_path: str,
+                     preprocessing: Optional[ImagePreprocessing] = None,
+                     image_info: Optional[Dict[str, Any]] = None) -> tuple[str, bytes]:
+    """
+    Prepares an image for upload to an LLM.
+
+    The longest side is capped to `preprocessing.max_side` and the image is re-encoded to the
+    configured format, or as PNG when it is JPEG and the image has transparency. Palette, CMYK
+    and high bit depth images are converted to 8 bit RGB or grayscale first. Images that are
+    already small enough, in a provider supported format and within the size limit are returned
+    as their original bytes without being decoded. The original bytes are also kept when
+    re-encoding would not make them smaller.
+
+    Args:
+        image_path (str): The file path to the image.
+        preprocessing (ImagePreprocessing, optional): The configuration. Defaults to `image_preprocessing`.
+        image_info (dict, optional): Information returned by `get_image_info` for this file. When it
+            holds the dimensions and format, the image header is not read again.
+
+    Returns:
+        tuple[str, bytes]: The MIME type and the bytes to upload.
+
+    Raises:
+        FileNotFoundError: If the specified image file does not exist.
+        IOError: If the image file cannot be opened or processed.
+    """
+    preprocessing = preprocessing or image_preprocessing
+    if not image_info or "width" not in image_info:
+        image_info = get_image_info(image_path)
+    width = image_info.get("width", 0)
+    height = image_info.get("height", 0)
+    original_format = image_info.get("format")
+    size_bytes = image_info.get("size_bytes", os.path.getsize(image_path))
+
+    needs_resize = preprocessing.max_side is not None and max(width, height) > preprocessing.max_side
+    original_mime = _INLINE_MIME_TYPES.get(original_format)
+    if not needs_resize and original_mime and size_bytes <= preprocessing.keep_original_max_bytes:
+        with open(image_path, "rb") as f:
+            return original_mime, f.read()
+
+    target_format = preprocessing.format.upper()
+    with Image.open(image_path) as img:
+        img, target_format = _prepare_for_encoding(img, target_format)
+        if needs_resize:
+            img.thumbnail((preprocessing.max_side, preprocessing.max_side), Image.LANCZOS)
+        buffered = BytesIO()
+        if target_format == "PNG":
+            img.save(buffered, format="PNG", optimize=True)
+        else:
+            img.save(buffered, format=target_format, quality=preprocessing.quality)
+    img_bytes = buffered.getvalue()
+
+    if not needs_resize and original_mime and size_bytes <= len(img_bytes):
+        with open(image_path, "rb") as f:
+            return original_mime, f.read()
+    return _INLINE_MIME_TYPES[target_format], img_bytes
+
+
+def image_to_base64_inline(image_path: str,
+                           preprocessing: Optional[ImagePreprocessing] = None,
+                           image_info: Optional[Dict[str, Any]] = None) -> str:
     """
     Converts an image file to a Base64-encoded inline data URL.
 
+    The image is passed through `preprocess_image` first, so it is downscaled and encoded in
+    the configured format. Encoded data URLs are stored in the module level `image_cache`, so
+    repeated calls for an unchanged file skip decoding and re-encoding the image.
+
     Args:
         image_path (str): The file path to the image to be converted.
+        preprocessing (ImagePreprocessing, optional): The preprocessing configuration.
+            Defaults to `image_preprocessing`.
+        image_info (dict, optional): Information returned by `get_image_info` for this file.
 
     Returns:
         str: A Base64-encoded string representing the image in the format:
-             "data:image/png;base64,<base64_encoded_data>".
+             "data:<mime_type>;base64,<base64_encoded_data>".
 
     Raises:
         FileNotFoundError: If the specified image file does not exist.
         IOError: If the image file cannot be opened or processed.
     """
-    with Image.open(image_path) as img:
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        img_bytes = buffered.getvalue()
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        inline_base64 = f"data:image/png;base64,{img_base64}"
-        return inline_base64
+    preprocessing = preprocessing or image_preprocessing
+    key = ImageEncodingCache.key_for(image_path, preprocessing)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+    mime_type, img_bytes = preprocess_image(image_path, preprocessing, image_info)
+    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+    inline_base64 = f"data:{mime_type};base64,{img_base64}"
+    image_cache.put(key, inline_base64)
+    return inline_base64
     
 
 def only_direct(func):
@@ -54,4 +337,22 @@ def only_direct(func):
             return await func(*args, **kwargs)
         else:
             return None
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+async def run_cancellable(work: Awaitable, ctx: Any) -> Any:
+    """
+    Runs a message handler's work as a task linked to the message's cancellation token, so
+    cancelling the request also cancels the work, including in-flight LLM calls.
+
+    Args:
+        work (Awaitable): The handler's work.
+        ctx (MessageContext): The context of the message being handled.
+
+    Returns:
+        Any: The result of the work.
+    """
+    task = asyncio.ensure_future(work)
+    if ctx is not None and ctx.cancellation_token is not None:
+        ctx.cancellation_token.link_future(task)
+    return await task
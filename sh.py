@@ -1,16 +1,16 @@
 from shiny.express import ui, render
-from otools_autogen.runtime import Manager, UserRequest, UserResponse
-from news_fetch_tool import NewsFetchTool
-from diet_planner_tool import DietPlanningTool
-from wikipedia_search_tool import WikipediaSearch
+from otools_autogen.runtime import Runtime, UserRequest, UserResponse
+from tools.news_fetch_tool import NewsFetchTool
+from tools.diet_planner_tool import DietPlanningTool
+from tools.wikipedia_search_tool import WikipediaSearch
 
 
-m:Manager = None
+m:Runtime = None
 
 async def init_manager():
     global m
     if m is None:
-        m = Manager()
+        m = Runtime()
         m.register_tool("DietComposerTool", DietPlanningTool)
         m.register_tool("WikipediaSearchTool", WikipediaSearch)
         m.register_tool("NewsFetchTool", NewsFetchTool)
@@ -29,8 +29,23 @@ chat.ui()
 
 async def stream_respone(user_input):
     sid = await m.send_message(UserRequest(message=user_input, files=[]))
+    streamed = False
     async for msg in m.stream(sid):
         mm: UserResponse = msg
+        if mm.type == "FinalOutputDelta":
+            if not streamed:
+                streamed = True
+                yield "\n"
+            yield mm.message
+            continue
+        if mm.type == "FinalOutput" and streamed:
+            yield f"""
+
+**Step**: {mm.step_no}  
+**Conclusion**: {mm.conclusion}  
+**Final**: {mm.final}
+"""
+            continue
         msg =f"""
 **Message**: {mm.message}  
 **Tool**: {mm.tool_used}  
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Union
+
+from openai.types.chat import ParsedChatCompletion
+from pydantic import BaseModel
+
+from otools_autogen.llm import LLMClientPool
+from otools_autogen.tools import Tool, ToolCard
+
+
+class EchoTool(Tool):
+    class EchoToolInput(BaseModel):
+        text: str
+
+    class EchoToolOutput(BaseModel):
+        echo: str
+
+    @property
+    def card(self) -> ToolCard:
+        return echo_card
+
+    async def run(self, inputs: EchoToolInput) -> BaseModel:
+        return EchoTool.EchoToolOutput(echo=inputs.text)
+
+
+echo_card = ToolCard(
+    tool_id="EchoTool",
+    name="Echo tool",
+    description="Returns the given text.",
+    inputs=EchoTool.EchoToolInput,
+    outputs=EchoTool.EchoToolOutput,
+    user_metadata={},
+    demo_input=[EchoTool.EchoToolInput(text="hello")])
+
+
+def echo_action(text: str = "hello") -> dict:
+    return {"context": text, "sub_goal": f"echo {text}", "tool_name": "EchoTool", "argument": {"text": text}}
+
+
+ANSWERS = {
+    "QueryAnalysisLLMResponse": {"concise_summary": "echo hello", "required_skills": "echo",
+                                 "relevant_tools": "EchoTool", "additional_considerations": "none"},
+    "ActionPredictonLLMResponse": {"justification": "echo", "context": "hello", "sub_goal": "echo hello",
+                                   "tool_name": "EchoTool"},
+    "ActionBatchLLMResponse": {"justification": "echo", "actions": [
+        {"context": text, "sub_goal": f"echo {text}", "tool_name": "EchoTool"} for text in ("a", "b")]},
+    "ToolCommandLLMResponse": {"analysis": "echo", "explanation": "echo",
+                               "argument": json.dumps({"text": "hello"})},
+    "ContextVerifierLLMResponse": {"analysis": "done", "stop_signal": True},
+    "FusedPlanLLMResponse": {"justification": "echo", "context": "hello", "sub_goal": "echo hello",
+                             "action": {"tool_name": "EchoTool", "argument": {"text": "hello"}}},
+    "FusedBatchPlanLLMResponse": {"justification": "echo", "actions": [echo_action("a"), echo_action("b")]},
+}
+
+Answer = Union[dict, Callable[[list[dict], str], dict]]
+
+
+class FakeLLMClientPool(LLMClientPool):
+    """
+    Pool answering completions locally instead of calling a provider. Routing, caching, tracing
+    and usage accounting run as in the real pool.
+
+    Attributes:
+        answers (dict[str, Answer]): The parsed output by response format name, or a callable
+            building it from the messages and the model.
+        deltas (list[str]): The deltas of every streamed completion.
+        delay (float): Seconds every completion takes.
+        calls (list[tuple[str, str]]): The agent and the model of every completion and stream.
+    """
+
+    def __init__(self, answers: dict[str, Answer] = None, deltas: list[str] = None, delay: float = 0):
+        super().__init__(api_key="fake", base_url="http://localhost")
+        self.answers = {**ANSWERS, **(answers or {})}
+        self.deltas = deltas or ["hello ", "world"]
+        self.delay = delay
+        self.calls: list[tuple[str, str]] = []
+
+    def agents(self) -> list[str]:
+        return [agent for agent, _ in self.calls]
+
+    async def _complete(self, model: str, messages: list[dict], response_format: type, agent: str, **kwargs: Any):
+        self.calls.append((agent, model))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        answer = self.answers[response_format.__name__]
+        parsed = answer(messages, model) if callable(answer) else answer
+        completion = ParsedChatCompletion[response_format].model_validate({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": json.dumps(parsed), "parsed": parsed}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}})
+        self._record_usage(completion, model, agent)
+        return completion
+
+    async def stream(self, messages: list[dict], model: str = None, agent: str = None, **kwargs: Any):
+        model = self.router.model(agent, model)
+        self.calls.append((agent, model))
+        for delta in self.deltas:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield delta
+
+
+def make_runtime(llm: LLMClientPool = None, **options: Any):
+    from otools_autogen.runtime import Runtime
+    runtime = Runtime(llm=llm or FakeLLMClientPool(), default_model="fake", **options)
+    runtime.register_tool("EchoTool", EchoTool)
+    return runtime
+
+
+async def collect(runtime, session_id: str) -> list:
+    return [response async for response in runtime.stream(session_id)]
+
+
+async def run_request(runtime, user_request) -> list:
+    """
+    Starts the runtime, processes a single request and stops it, returning the streamed responses.
+    """
+    await runtime.start()
+    try:
+        session_id = await runtime.send_message(user_request)
+        return await collect(runtime, session_id)
+    finally:
+        await runtime.stop(True)
+
+
+def request(message: str = "echo hello", **options: Any):
+    from otools_autogen.runtime import UserRequest
+    return UserRequest(message=message, files=[], **options)
+
+
+class OpenAIStubHandler(BaseHTTPRequestHandler):
+    """
+    Answers chat completions like the OpenAI API from `ANSWERS`, by the name of the requested
+    response schema, and streams `deltas` for completions without one.
+    """
+    protocol_version = "HTTP/1.1"
+    deltas = ["hello ", "world"]
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, content_type: str, body: bytes):
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        model = request["model"]
+        if request.get("stream"):
+            events = [{"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                       "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                      for delta in self.deltas]
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            self.send_body("text/event-stream", body.encode())
+            return
+        content = json.dumps(ANSWERS[request["response_format"]["json_schema"]["name"]])
+        self.send_body("application/json", json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}}).encode())
+
+
+def start_openai_stub() -> ThreadingHTTPServer:
+    """
+    Starts the OpenAI stub server on a free localhost port; its API base URL is
+    `http://127.0.0.1:<port>/v1`. Stop it with `shutdown()` and `server_close()`.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OpenAIStubHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from otools_autogen.budget import BudgetExhausted, RequestBudget
+from otools_autogen.usage import TokenUsage
+
+from fakes import FakeLLMClientPool, make_runtime, request, run_request
+
+
+def usage(tokens: int) -> TokenUsage:
+    return TokenUsage(requests=1, prompt_tokens=tokens)
+
+
+def test_limit_projects_next_step():
+    budget = RequestBudget(max_tokens=1000)
+    assert budget.limit_reached(usage(400), steps=1) is None
+    assert budget.limit_reached(usage(600), steps=1)[0] == "tokens"
+    assert budget.limit_reached(usage(600), steps=0) is None
+
+
+def test_check_raises_once_used_up():
+    budget = RequestBudget(max_tokens=1000)
+    budget.check(usage(999))
+    with pytest.raises(BudgetExhausted) as exhausted:
+        budget.check(usage(1000))
+    assert exhausted.value.limit == "tokens"
+
+
+def test_remaining_seconds():
+    assert RequestBudget().remaining_seconds is None
+    budget = RequestBudget(max_seconds=10, started_at=time.monotonic() - 4)
+    assert 5.9 < budget.remaining_seconds <= 6
+    assert RequestBudget(max_seconds=1, started_at=time.monotonic() - 5).remaining_seconds == 0
+
+
+def test_token_budget_is_checked_before_each_call():
+    llm = FakeLLMClientPool()
+    runtime = make_runtime(llm)
+    responses = asyncio.run(run_request(runtime, request(max_steps=3, max_tokens=250)))
+    types = [response.type for response in responses]
+    assert types == ["ToolRequest", "BudgetExceeded", "FinalOutputDelta", "FinalOutputDelta", "FinalOutput"]
+    assert "used up" in responses[1].message
+    assert llm.agents() == ["QueryAnalyzer", "ActionPredictor", "CommandGenerator", "FinalOutputAgent"]
+    assert runtime.get_metrics()["counters"]["budget_exceeded{limit=tokens}"] == 1
+
+
+def test_seconds_budget_cancels_calls_in_flight():
+    llm = FakeLLMClientPool(delay=0.3)
+    runtime = make_runtime(llm)
+    start = time.monotonic()
+    responses = asyncio.run(run_request(runtime, request(max_steps=3, max_seconds=0.5)))
+    assert responses[0].type == "BudgetExceeded"
+    assert "during a call to ActionPredictor" in responses[0].message
+    assert responses[-1].final
+    assert llm.agents() == ["QueryAnalyzer", "ActionPredictor", "FinalOutputAgent"]
+    assert time.monotonic() - start < 2
+
+
+def test_requests_without_budget_are_not_limited():
+    llm = FakeLLMClientPool()
+    responses = asyncio.run(run_request(make_runtime(llm), request(max_steps=2)))
+    assert "BudgetExceeded" not in [response.type for response in responses]
+    assert "ContextVerifier" in llm.agents()
@@ -0,0 +1,163 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from otools_autogen.cache import CachePolicy, MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+from otools_autogen.executor import ToolExecutor
+
+from fakes import make_runtime
+
+
+def make_cache() -> ResponseCache:
+    return ResponseCache("test", MemoryCacheBackend())
+
+
+class SlowCall:
+    """
+    Call returning its value after a delay, recording whether it was cancelled.
+    """
+
+    def __init__(self, value: str = "value", delay: float = 0.05):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = False
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.value
+
+
+def test_caches_value():
+    cache = make_cache()
+    call = SlowCall()
+
+    async def run():
+        assert await cache.get_or_call("k", call) == "value"
+        assert await cache.get_or_call("k", call) == "value"
+
+    asyncio.run(run())
+    assert call.calls == 1
+
+
+def test_collapses_concurrent_calls():
+    cache = make_cache()
+    call = SlowCall()
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_call("k", call) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["value"] * 3
+    assert call.calls == 1
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    cache = make_cache()
+    call = SlowCall()
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_call("k", call))
+        second = asyncio.ensure_future(cache.get_or_call("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "value"
+    assert not call.cancelled
+
+
+def test_last_cancelled_caller_cancels_call():
+    cache = make_cache()
+    call = SlowCall()
+
+    async def run():
+        waiter = asyncio.ensure_future(cache.get_or_call("k", call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        assert call.cancelled
+        assert await cache.get_or_call("k", call) == "value"
+
+    asyncio.run(run())
+    assert call.calls == 2
+
+
+def test_does_not_store_rejected_values():
+    cache = make_cache()
+    call = SlowCall(delay=0)
+
+    async def run():
+        await cache.get_or_call("k", call, should_store=lambda value: False)
+        await cache.get_or_call("k", call, should_store=lambda value: False)
+
+    asyncio.run(run())
+    assert call.calls == 2
+
+
+class ThreadRecordingBackend(SQLiteCacheBackend):
+    """
+    SQLite backend recording the threads its reads and writes run on.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+def test_sqlite_backend_runs_off_the_event_loop(tmp_path):
+    backend = ThreadRecordingBackend(str(tmp_path / "cache.db"))
+    cache = ResponseCache("test", backend, executor=ToolExecutor(max_workers=1))
+    call = SlowCall(delay=0)
+
+    async def run():
+        assert await cache.get_or_call("k", call) == "value"
+        assert await cache.get_or_call("k", call) == "value"
+
+    asyncio.run(run())
+    assert call.calls == 1
+    assert backend.threads and threading.get_ident() not in backend.threads
+    cache.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        backend.get("k")
+
+
+def test_sqlite_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SQLiteCacheBackend(path, namespace="tool")
+    first.set("k", "value", ttl=None)
+    first.close()
+    second = SQLiteCacheBackend(path, namespace="tool")
+    assert second.get("k") == "value"
+    assert SQLiteCacheBackend(path, namespace="other").get("k") is None
+    second.close()
+
+
+def test_runtime_stop_closes_caches(tmp_path):
+    runtime = make_runtime(completion_cache=CachePolicy(path=str(tmp_path / "completions.db")))
+
+    async def run():
+        await runtime.start()
+        await runtime.stop()
+
+    asyncio.run(run())
+    with pytest.raises(sqlite3.ProgrammingError):
+        runtime.llm.completion_cache.backend.get("k")
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from otools_autogen.dag import PlanNode, order_plan
+
+from fakes import FakeLLMClientPool, make_runtime, request, run_request
+
+
+def node(id: str, *depends_on: str, tool_name: str = "EchoTool", argument: str = "") -> PlanNode:
+    return PlanNode(id=id, tool_name=tool_name, sub_goal=f"echo {id}", depends_on=list(depends_on), argument=argument)
+
+
+def test_order_plan_places_dependencies_first():
+    ordered = order_plan([node("c", "b"), node("b", "a"), node("a"), node("d")], ["EchoTool"])
+    ids = [n.id for n in ordered]
+    assert ids.index("a") < ids.index("b") < ids.index("c")
+    assert set(ids) == {"a", "b", "c", "d"}
+
+
+@pytest.mark.parametrize("nodes, error", [
+    ([node("a", "b"), node("b", "a")], "cycle"),
+    ([node("a", "x")], "unknown node"),
+    ([node("a"), node("a")], "Duplicate"),
+    ([node("a", tool_name="Missing")], "unknown tool"),
+])
+def test_order_plan_rejects_invalid_graphs(nodes, error):
+    with pytest.raises(ValueError, match=error):
+        order_plan(nodes, ["EchoTool"])
+
+
+def dag_plan(*nodes: PlanNode) -> dict:
+    return {"justification": "plan", "nodes": [n.model_dump() for n in nodes]}
+
+
+def test_dag_runs_dependent_nodes_after_their_inputs():
+    llm = FakeLLMClientPool({"DagPlanLLMResponse": dag_plan(
+        node("second", "first"), node("first", argument=json.dumps({"text": "first"})))})
+    runtime = make_runtime(llm, orchestrator="dag")
+    responses = asyncio.run(run_request(runtime, request(max_steps=2)))
+    tool_responses = [response for response in responses if response.type == "ToolResponse"]
+    assert [response.message for response in tool_responses] == ["echo first", "echo second"]
+    assert [response.step_no for response in tool_responses] == [1, 2]
+    # Only the dependent node needs its argument generated.
+    assert llm.agents().count("CommandGenerator") == 1
+    assert responses[-1].conclusion
+
+
+def test_dag_replans_after_failure_and_verifier():
+    plans = [
+        dag_plan(node("bad", argument=json.dumps({"wrong": 1}))),
+        dag_plan(node("good", argument=json.dumps({"text": "good"}))),
+        dag_plan(node("more", argument=json.dumps({"text": "more"}))),
+    ]
+    verdicts = iter([False, True])
+    llm = FakeLLMClientPool({
+        "DagPlanLLMResponse": lambda messages, model: plans.pop(0),
+        "ContextVerifierLLMResponse": lambda messages, model: {"analysis": "", "stop_signal": next(verdicts)},
+    })
+    runtime = make_runtime(llm, orchestrator="dag")
+    responses = asyncio.run(run_request(runtime, request(max_steps=5)))
+    assert [response.type for response in responses if response.type in ("Error", "ToolResponse")] == [
+        "Error", "ToolResponse", "ToolResponse"]
+    counters = runtime.get_metrics()["counters"]
+    assert counters["dag_replans{reason=failure}"] == 1
+    assert counters["dag_replans{reason=verifier}"] == 1
+    assert llm.agents().count("DagPlanner") == 3
+    assert responses[-1].conclusion
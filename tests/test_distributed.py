@@ -0,0 +1,53 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("autogen_ext.runtimes.grpc")
+
+from otools_autogen.distributed import DistributedConfig, serve_agents, start_host
+from otools_autogen.runtime import Runtime, UserRequest
+
+from fakes import EchoTool, FakeLLMClientPool
+
+
+def free_address() -> str:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return f"localhost:{sock.getsockname()[1]}"
+
+
+def test_session_across_grpc_nodes():
+    address = free_address()
+    placement = {"CommandGenerator": "workers", "ContextVerifier": "workers", "EchoTool": "workers"}
+    front_llm, worker_llm = FakeLLMClientPool(), FakeLLMClientPool()
+
+    async def run():
+        host = await start_host(address)
+        worker = asyncio.ensure_future(serve_agents(
+            DistributedConfig(address, placement, group="workers"), tools={"EchoTool": EchoTool},
+            llm=worker_llm, default_model="stub"))
+        runtime = Runtime(llm=front_llm, distributed=DistributedConfig(address, placement),
+                          default_model="stub")
+        runtime.register_tool("EchoTool", EchoTool)
+        try:
+            await asyncio.sleep(0.5)
+            await runtime.start()
+            session_id = await runtime.send_message(UserRequest(message="echo hello", files=[], max_steps=2))
+            responses = [response async for response in runtime.stream(session_id)]
+        finally:
+            try:
+                await runtime.stop()
+            finally:
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+                await host.stop()
+        return responses
+
+    responses = asyncio.run(asyncio.wait_for(run(), 60))
+    assert responses[-1].final
+    assert responses[-1].message == "hello world"
+    assert "ToolResponse" in [response.type for response in responses]
+    assert sorted(set(worker_llm.agents())) == ["CommandGenerator", "ContextVerifier"]
+    assert "CommandGenerator" not in front_llm.agents()
+    assert "ContextVerifier" not in front_llm.agents()
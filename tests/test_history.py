@@ -0,0 +1,53 @@
+import json
+
+from otools_autogen.history import ActionHistory, estimate_tokens
+
+
+def make_history(steps: int, result_chars: int = 2000, **options) -> ActionHistory:
+    history = ActionHistory(**options)
+    for no in range(1, steps + 1):
+        history.add_step(no, "EchoTool", f"goal {no}", json.dumps({"text": str(no)}), str(no) * result_chars)
+    return history
+
+
+def test_history_within_budget_is_verbatim():
+    history = make_history(3, result_chars=100)
+    rendered = json.loads(history.render())
+    assert rendered["Step 1"]["result"] == "1" * 100
+    assert history.tokens_saved == 0
+
+
+def test_history_summarizes_older_steps_first():
+    history = make_history(4, token_budget=1200, keep_recent=2, summary_chars=100)
+    rendered = json.loads(history.render())
+    assert rendered["Step 1"]["result"].startswith("1" * 100 + "... [1900 more characters truncated]")
+    assert rendered["Step 2"]["result"].startswith("2" * 100 + "...")
+    assert rendered["Step 3"]["result"] == "3" * 2000
+    assert rendered["Step 4"]["result"] == "4" * 2000
+    assert all("result_digest" not in entry for entry in rendered.values())
+
+
+def test_history_digests_when_summaries_do_not_fit():
+    history = make_history(6, token_budget=1450, keep_recent=2, summary_chars=400)
+    rendered_text = history.render()
+    rendered = json.loads(rendered_text)
+    assert estimate_tokens(rendered_text) <= history.token_budget
+    assert rendered["Step 1"] == {"tool_name": "EchoTool", "sub_goal": "goal 1", "argument": '{"text": "1"}',
+                                  "result_digest": "2000 characters, omitted to save context"}
+    assert rendered["Step 2"]["result_digest"] == "2000 characters, omitted to save context"
+    assert rendered["Step 3"]["result"].startswith("3" * 400 + "... [1600 more characters truncated]")
+    assert rendered["Step 6"]["result"] == "6" * 2000
+    assert history.tokens_saved > 0
+
+
+def test_tokens_saved_reports_latest_render_only():
+    history = make_history(4, token_budget=1800, keep_recent=2, summary_chars=100)
+    history.render()
+    saved = history.tokens_saved
+    assert saved > 0
+    history.render()
+    history.render()
+    assert history.tokens_saved == saved
+    history.token_budget = 100000
+    history.render()
+    assert history.tokens_saved == 0
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from otools_autogen.http_client import HTTPClientPool
+from otools_autogen.tools import AsyncHTTPTool
+
+from tools.api_caller_tool import APICallerTool, APICallerToolRequest
+from tools.news_api_tool import NewsAPITool, NewsAPIToollRequest
+from tools.news_fetch_tool import NewsFetchTool, NewsFetchToolRequest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with the status and body registered for its path, or echoes the
+    request as JSON.
+    """
+    routes: dict[str, tuple[int, bytes]] = {}
+    queries: list[dict] = []
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("content-length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.queries.append(parse_qs(url.query))
+        status, content = self.routes.get(url.path, (200, None))
+        if content is None:
+            content = json.dumps({"method": self.command, "path": url.path, "query": parse_qs(url.query),
+                                  "body": body.decode()}).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = answer
+
+
+@pytest.fixture
+def server():
+    StubHandler.routes = {}
+    StubHandler.queries = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run_tool(tool: AsyncHTTPTool, call):
+    async def run():
+        tool.http = HTTPClientPool()
+        try:
+            return await call()
+        finally:
+            await tool.http.aclose()
+
+    return asyncio.run(run())
+
+
+class StubTool(AsyncHTTPTool):
+    card = None
+
+    async def run(self, inputs):
+        return None
+
+
+def test_request_resolves_relative_urls(server):
+    tool = StubTool(base_url=server + "/api/")
+    response = run_tool(tool, lambda: tool.request("GET", "/v1/items", params={"q": "x"}))
+    assert response.ok
+    assert response.json()["path"] == "/api/v1/items"
+    assert response.json()["query"] == {"q": ["x"]}
+
+
+def test_request_keeps_absolute_urls(server):
+    tool = StubTool(base_url="http://unused.invalid")
+    response = run_tool(tool, lambda: tool.request("GET", server + "/absolute"))
+    assert response.json()["path"] == "/absolute"
+
+
+def test_request_truncates_large_bodies(server):
+    StubHandler.routes["/big"] = (200, b"x" * 1000)
+    tool = StubTool(base_url=server)
+    tool.max_response_bytes = 100
+    response = run_tool(tool, lambda: tool.request("GET", "/big"))
+    assert response.truncated
+    assert response.content == b"x" * 100
+
+
+def test_request_returns_error_status(server):
+    StubHandler.routes["/missing"] = (404, b"{}")
+    tool = StubTool(base_url=server)
+    response = run_tool(tool, lambda: tool.request("GET", "/missing"))
+    assert not response.ok
+    assert response.status_code == 404
+    assert not response.truncated
+
+
+def test_api_caller_reports_error_status(server):
+    StubHandler.routes["/fail"] = (500, b"down")
+    tool = APICallerTool()
+    output = run_tool(tool, lambda: tool.run(APICallerToolRequest(url=server + "/fail")))
+    assert not output.success
+    assert output.error.startswith("HTTP Error 500")
+
+
+def test_api_caller_sends_params(server):
+    tool = APICallerTool()
+    output = run_tool(tool, lambda: tool.run(APICallerToolRequest(url=server + "/ok", params={"a": 1})))
+    assert output.success
+    assert json.loads(output.response)["query"] == {"a": ["1"]}
+
+
+def test_news_fetch_returns_sections(server):
+    StubHandler.routes["/api/v1/news-section"] = (200, json.dumps({"World": [{"title": "t"}]}).encode())
+    tool = NewsFetchTool(base_url=server)
+    output = run_tool(tool, lambda: tool.run(NewsFetchToolRequest(sections=["World"])))
+    assert output.success
+    assert output.search_results["World"][0].title == "t"
+
+
+@pytest.mark.parametrize("status, body", [(503, b"{}"), (200, b"{" + b" " * 200)])
+def test_news_fetch_reports_failures(server, status, body):
+    StubHandler.routes["/api/v1/news-section"] = (status, body)
+    tool = NewsFetchTool(base_url=server)
+    tool.max_response_bytes = 100
+    output = run_tool(tool, lambda: tool.run(NewsFetchToolRequest(sections=["World"])))
+    assert not output.success
+    assert output.search_results is None
+
+
+def test_news_api_returns_articles(server):
+    articles = {"data": [{"title": "t", "url": "u", "source": "s", "snippet": "n"}]}
+    StubHandler.routes["/v1/news/all"] = (200, json.dumps(articles).encode())
+    tool = NewsAPITool(base_url=server, api_token="token")
+    output = run_tool(tool, lambda: tool.run(NewsAPIToollRequest(sections=["tech"])))
+    assert output.success
+    assert output.search_results["tech"][0].link == "u"
+
+
+def test_news_api_reads_token_from_env(server, monkeypatch):
+    StubHandler.routes["/v1/news/all"] = (200, b'{"data": []}')
+    monkeypatch.setenv("THENEWSAPI_API_TOKEN", "env-token")
+    tool = NewsAPITool(base_url=server)
+    assert run_tool(tool, lambda: tool.run(NewsAPIToollRequest(sections=["tech"]))).success
+    assert StubHandler.queries[-1]["api_token"] == ["env-token"]
+    monkeypatch.delenv("THENEWSAPI_API_TOKEN")
+    assert not run_tool(tool, lambda: tool.run(NewsAPIToollRequest(sections=["tech"]))).success
+
+
+@pytest.mark.parametrize("status, body", [(401, b'{"error": "invalid token"}'), (200, b"{" + b" " * 200)])
+def test_news_api_reports_failures(server, status, body):
+    StubHandler.routes["/v1/news/all"] = (status, body)
+    tool = NewsAPITool(base_url=server, api_token="token")
+    tool.max_response_bytes = 100
+    output = run_tool(tool, lambda: tool.run(NewsAPIToollRequest(sections=["tech"])))
+    assert not output.success
+    assert output.search_results is None
@@ -0,0 +1,109 @@
+import base64
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from otools_autogen.utils import ImageEncodingCache, ImagePreprocessing, image_to_base64_inline, preprocess_image
+
+
+def save(tmp_path, img: Image.Image, name: str, **params) -> str:
+    path = str(tmp_path / name)
+    img.save(path, **params)
+    return path
+
+
+def decode(data: bytes) -> Image.Image:
+    img = Image.open(BytesIO(data))
+    img.load()
+    return img
+
+
+def test_large_image_is_downscaled(tmp_path):
+    path = save(tmp_path, Image.effect_noise((3000, 1500), 64).convert("RGB"), "large.jpg")
+    mime, data = preprocess_image(path, ImagePreprocessing(max_side=1024))
+    img = decode(data)
+    assert mime == "image/jpeg"
+    assert (img.format, img.size) == ("JPEG", (1024, 512))
+
+
+def test_small_image_keeps_original_bytes(tmp_path):
+    path = save(tmp_path, Image.effect_noise((64, 64), 64), "small.png")
+    assert os.path.getsize(path) <= ImagePreprocessing().keep_original_max_bytes
+    with open(path, "rb") as f:
+        assert preprocess_image(path) == ("image/png", f.read())
+
+
+def test_transparent_image_is_encoded_as_png(tmp_path):
+    img = Image.new("RGBA", (32, 32), (255, 0, 0, 255))
+    img.putpixel((0, 0), (0, 0, 0, 0))
+    path = save(tmp_path, img, "alpha.tiff")
+    mime, data = preprocess_image(path, ImagePreprocessing(format="JPEG"))
+    out = decode(data)
+    assert (mime, out.mode) == ("image/png", "RGBA")
+    assert out.getpixel((0, 0))[3] == 0
+    assert out.getpixel((1, 1)) == (255, 0, 0, 255)
+
+
+@pytest.mark.parametrize("mode", ["LA", "P"])
+def test_transparency_of_other_modes_is_kept(tmp_path, mode):
+    img = Image.new("RGBA", (16, 16), (0, 128, 0, 255))
+    img.putpixel((0, 0), (0, 0, 0, 0))
+    img = img.convert(mode) if mode == "LA" else img.quantize(colors=4)
+    if mode == "P":
+        img.info["transparency"] = img.getpixel((0, 0))
+    path = save(tmp_path, img, f"{mode}.png", **({"transparency": img.info["transparency"]} if mode == "P" else {}))
+    mime, data = preprocess_image(path, ImagePreprocessing(keep_original_max_bytes=0))
+    out = decode(data)
+    assert mime == "image/png"
+    assert out.convert("RGBA").getpixel((0, 0))[3] == 0
+    assert out.convert("RGBA").getpixel((5, 5))[3] == 255
+
+
+def test_transparent_image_keeps_alpha_in_webp(tmp_path):
+    path = save(tmp_path, Image.new("LA", (16, 16), (200, 0)), "alpha.tiff")
+    mime, data = preprocess_image(path, ImagePreprocessing(format="WEBP"))
+    out = decode(data)
+    assert (mime, out.mode) == ("image/webp", "RGBA")
+    assert out.getpixel((0, 0))[3] == 0
+
+
+def test_cmyk_image_is_converted_to_rgb(tmp_path):
+    path = save(tmp_path, Image.new("RGB", (16, 16), (255, 0, 0)).convert("CMYK"), "cmyk.tiff")
+    mime, data = preprocess_image(path)
+    out = decode(data)
+    assert (mime, out.mode) == ("image/jpeg", "RGB")
+    red, green, blue = out.getpixel((8, 8))
+    assert red > 200 and green < 50 and blue < 50
+
+
+def test_16_bit_image_is_scaled_not_clipped(tmp_path):
+    img = Image.new("I;16", (16, 16), 32768)
+    path = save(tmp_path, img, "deep.tiff")
+    mime, data = preprocess_image(path, ImagePreprocessing(format="PNG"))
+    out = decode(data)
+    assert (mime, out.mode) == ("image/png", "L")
+    assert out.getpixel((8, 8)) == 128
+
+
+def test_inline_cache_is_invalidated_when_file_changes(tmp_path):
+    path = save(tmp_path, Image.new("RGB", (16, 16), (255, 0, 0)), "image.png")
+    first = image_to_base64_inline(path)
+    assert image_to_base64_inline(path) == first
+
+    Image.new("RGB", (16, 16), (0, 0, 255)).save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = image_to_base64_inline(path)
+    assert second != first
+    out = decode(base64.b64decode(second.split(",", 1)[1]))
+    assert out.getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_cache_key_follows_mtime(tmp_path):
+    path = save(tmp_path, Image.new("RGB", (4, 4)), "key.png")
+    key = ImageEncodingCache.key_for(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert ImageEncodingCache.key_for(path) != key
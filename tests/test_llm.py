@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from otools_autogen.llm import LLMClientPool
+from otools_autogen.resilience import ResiliencePolicy, RetryPolicy
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """
+    Streams `chunks` completion chunks, `interval` seconds apart, recording whether the client
+    disconnected before the end of the stream.
+    """
+    protocol_version = "HTTP/1.1"
+    chunks = 3
+    interval = 0.0
+    disconnected = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def write(self, data: str):
+        payload = f"data: {data}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def chunk(self, content: str) -> str:
+        return json.dumps({"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                           "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["content-length"]))
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        try:
+            for no in range(self.chunks):
+                self.write(self.chunk(f"{no} "))
+                time.sleep(self.interval)
+            self.write("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.disconnected.set()
+
+
+@pytest.fixture
+def server():
+    StreamHandler.chunks, StreamHandler.interval = 3, 0.0
+    StreamHandler.disconnected = threading.Event()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_pool(server: str, **policy) -> LLMClientPool:
+    policy.setdefault("retry", RetryPolicy(max_attempts=1))
+    return LLMClientPool(api_key="k", base_url=server, resilience=ResiliencePolicy(**policy))
+
+
+def test_stream_yields_deltas(server):
+    pool = make_pool(server)
+
+    async def run():
+        deltas = [delta async for delta in pool.stream([{"role": "user", "content": "hi"}], model="m")]
+        await pool.aclose()
+        return deltas
+
+    assert asyncio.run(run()) == ["0 ", "1 ", "2 "]
+
+
+def test_stream_closed_when_consumer_stops(server):
+    StreamHandler.chunks, StreamHandler.interval = 200, 0.02
+    pool = make_pool(server)
+
+    async def run():
+        stream = pool.stream([{"role": "user", "content": "hi"}], model="m")
+        assert await stream.__anext__() == "0 "
+        await stream.aclose()
+        assert pool.limit("m")._value == pool.default_model_concurrency
+        await asyncio.to_thread(StreamHandler.disconnected.wait, 2)
+        await pool.aclose()
+
+    asyncio.run(run())
+    assert StreamHandler.disconnected.is_set()
+
+
+def test_stalled_stream_times_out(server):
+    StreamHandler.chunks, StreamHandler.interval = 2, 1.0
+    pool = make_pool(server, call_timeout=0.2)
+
+    async def run():
+        deltas = []
+        with pytest.raises(TimeoutError):
+            async for delta in pool.stream([{"role": "user", "content": "hi"}], model="m"):
+                deltas.append(delta)
+        assert pool.limit("m")._value == pool.default_model_concurrency
+        await pool.aclose()
+        return deltas
+
+    assert asyncio.run(run()) == ["0 "]
+    assert pool.metrics.snapshot()["counters"]["llm_stream_timeouts{model=m}"] == 1
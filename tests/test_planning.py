@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from fakes import FakeLLMClientPool, make_runtime, request, run_request
+
+
+def counting_verifier(stop_at: int):
+    calls = []
+
+    def answer(messages, model):
+        calls.append(model)
+        return {"analysis": "checked", "stop_signal": len(calls) >= stop_at}
+
+    return answer
+
+
+def test_fused_planner_falls_back_to_two_stage():
+    def fail(messages, model):
+        raise RuntimeError("schema rejected")
+
+    llm = FakeLLMClientPool({"FusedPlanLLMResponse": fail})
+    runtime = make_runtime(llm, planning="fused")
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert llm.agents()[1:4] == ["FusedPlanner", "ActionPredictor", "CommandGenerator"]
+    assert "ToolResponse" in [response.type for response in responses]
+    assert runtime.get_metrics()["counters"]["planner_fallbacks"] == 1
+
+
+def test_fused_planner_plans_in_one_call():
+    llm = FakeLLMClientPool()
+    runtime = make_runtime(llm, planning="fused")
+    asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert "ActionPredictor" not in llm.agents()
+    assert "CommandGenerator" not in llm.agents()
+    assert "planner_fallbacks" not in runtime.get_metrics()["counters"]
+
+
+def test_speculative_plan_is_used_when_verifier_continues():
+    llm = FakeLLMClientPool({"ContextVerifierLLMResponse": counting_verifier(stop_at=2)})
+    runtime = make_runtime(llm, speculative_planning=True)
+    responses = asyncio.run(run_request(runtime, request(max_steps=3)))
+    counters = runtime.get_metrics()["counters"]
+    assert counters["speculation_hits"] == 1
+    assert counters["speculation_misses"] == 1
+    # Step 1 is planned sequentially, step 2 speculatively and reused, step 3 speculatively and discarded.
+    assert llm.agents().count("ActionPredictor") == 3
+    assert max(response.step_no for response in responses) == 2
+    assert responses[-1].conclusion
+
+
+def test_speculative_plan_is_cancelled_when_verifier_stops():
+    llm = FakeLLMClientPool({"ContextVerifierLLMResponse": counting_verifier(stop_at=1)}, delay=0.05)
+    runtime = make_runtime(llm, speculative_planning=True)
+    responses = asyncio.run(run_request(runtime, request(max_steps=3)))
+    counters = runtime.get_metrics()["counters"]
+    assert counters["speculation_misses"] == 1
+    assert counters["speculation_wasted_tokens"] > 0
+    assert "speculation_hits" not in counters
+    assert [response.type for response in responses].count("ToolResponse") == 1
+
+
+def test_parallel_batch_runs_in_one_step():
+    def command(messages, model):
+        sub_goal = "echo a" if "echo a" in json.dumps(messages) else "echo b"
+        return {"analysis": "echo", "explanation": "echo", "argument": json.dumps({"text": sub_goal[-1]})}
+
+    llm = FakeLLMClientPool({"ToolCommandLLMResponse": command})
+    runtime = make_runtime(llm, max_parallel_tools=2)
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    tool_responses = [response for response in responses if response.type == "ToolResponse"]
+    assert sorted(json.loads(response.command)["text"] for response in tool_responses) == ["a", "b"]
+    assert {response.step_no for response in tool_responses} == {1}
+    assert llm.agents().count("ActionPredictor") == 1
+    assert llm.agents().count("CommandGenerator") == 2
+
+
+def test_fused_parallel_batch():
+    llm = FakeLLMClientPool()
+    runtime = make_runtime(llm, planning="fused", max_parallel_tools=2)
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    tool_responses = [response for response in responses if response.type == "ToolResponse"]
+    assert sorted(json.loads(response.command)["text"] for response in tool_responses) == ["a", "b"]
+    assert llm.agents().count("FusedPlanner") == 1
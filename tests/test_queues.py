@@ -0,0 +1,131 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from otools_autogen.queues import ClientQueue, QueueClosed, QueuePolicy
+
+
+@dataclass
+class Response:
+    type: str
+    message: str = ""
+    final: bool = False
+
+
+def tool(no: int) -> Response:
+    return Response("ToolResponse", str(no))
+
+
+def delta(text: str) -> Response:
+    return Response("FinalOutputDelta", text)
+
+
+def drain(queue: ClientQueue) -> list[Response]:
+    return [queue._items.popleft() for _ in range(queue.qsize())]
+
+
+def test_drop_policy_drops_intermediate_responses():
+    queue = ClientQueue(maxsize=2, policy=QueuePolicy.DROP)
+    for no in range(3):
+        queue.put_nowait(tool(no))
+    assert [item.message for item in drain(queue)] == ["0", "1"]
+    assert queue.dropped == 1
+
+
+def test_coalesce_policy_keeps_latest_response():
+    queue = ClientQueue(maxsize=2, policy=QueuePolicy.COALESCE)
+    for no in range(4):
+        queue.put_nowait(tool(no))
+    assert [item.message for item in drain(queue)] == ["0", "3"]
+    assert queue.coalesced == 2
+
+
+def test_final_response_displaces_intermediate():
+    queue = ClientQueue(maxsize=2)
+    queue.put_nowait(tool(0))
+    queue.put_nowait(tool(1))
+    queue.put_nowait(Response("FinalOutput", "done", final=True))
+    assert [item.message for item in drain(queue)] == ["1", "done"]
+
+
+def test_deltas_merge_when_full():
+    queue = ClientQueue(maxsize=2)
+    queue.put_nowait(tool(0))
+    for text in ("a", "b", "c"):
+        queue.put_nowait(delta(text))
+    assert [item.message for item in drain(queue)] == ["0", "abc"]
+    assert queue.dropped == 0
+
+
+def test_delta_evicts_intermediate_when_nothing_to_merge():
+    queue = ClientQueue(maxsize=2)
+    queue.put_nowait(tool(0))
+    queue.put_nowait(tool(1))
+    queue.put_nowait(delta("a"))
+    assert [item.message for item in drain(queue)] == ["1", "a"]
+
+
+def test_overflow_when_nothing_droppable():
+    queue = ClientQueue(maxsize=1)
+    queue.put_nowait(Response("BudgetExceeded"))
+    queue.put_nowait(Response("FinalOutput", final=True))
+    assert queue.qsize() == 2
+    assert queue.metrics.snapshot()["counters"]["client_queue_overflow"] == 1
+
+
+def test_block_policy_waits_for_consumer():
+    queue = ClientQueue(maxsize=1, policy=QueuePolicy.BLOCK)
+
+    async def run():
+        await queue.put(tool(0))
+        producer = asyncio.ensure_future(queue.put(tool(1)))
+        await asyncio.sleep(0.01)
+        assert not producer.done()
+        assert (await queue.get()).message == "0"
+        await producer
+        return (await queue.get()).message
+
+    assert asyncio.run(run()) == "1"
+    assert queue.dropped == 0
+
+
+def test_block_policy_drops_after_put_timeout():
+    queue = ClientQueue(maxsize=1, policy=QueuePolicy.BLOCK, put_timeout=0.01)
+
+    async def run():
+        await queue.put(tool(0))
+        await queue.put(tool(1))
+        await queue.put(delta("a"))
+
+    asyncio.run(run())
+    assert [item.message for item in drain(queue)] == ["a"]
+    assert queue.metrics.snapshot()["counters"]["client_queue_dropped{reason=timeout}"] == 1
+
+
+def test_close_wakes_waiting_consumer():
+    queue = ClientQueue()
+
+    async def run():
+        consumer = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0.01)
+        queue.close()
+        with pytest.raises(QueueClosed):
+            await asyncio.wait_for(consumer, 1)
+
+    asyncio.run(run())
+
+
+def test_closed_queue_delivers_queued_responses_first():
+    queue = ClientQueue()
+    queue.put_nowait(Response("SessionClosed", final=True))
+    queue.close()
+    queue.put_nowait(tool(0))
+
+    async def run():
+        assert (await queue.get()).type == "SessionClosed"
+        with pytest.raises(QueueClosed):
+            await queue.get()
+
+    asyncio.run(run())
+    assert queue.dropped == 1
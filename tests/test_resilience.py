@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from otools_autogen.metrics import MetricsRegistry
+from otools_autogen.resilience import (CircuitBreaker, CircuitOpenError, HedgePolicy, ResiliencePolicy,
+                                       ResilientCaller, RetryPolicy)
+
+
+def make_caller(**policy) -> ResilientCaller:
+    policy.setdefault("retry", RetryPolicy(max_attempts=3, base_delay=0))
+    return ResilientCaller(ResiliencePolicy(**policy), MetricsRegistry())
+
+
+def counter(caller: ResilientCaller, name: str) -> float:
+    return sum(value for key, value in caller.metrics.snapshot()["counters"].items() if key.startswith(name))
+
+
+class Attempts:
+    """
+    Attempt factory failing with the given errors before succeeding.
+    """
+
+    def __init__(self, *errors: BaseException, result: str = "ok", delay: float = 0):
+        self.errors = list(errors)
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    assert breaker.allow()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_breaker_trial_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_trial_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_release_frees_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_retry_delay_is_bounded():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2)
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt) <= min(2, 0.5 * 2 ** attempt)
+
+
+def test_call_retries_retryable_errors():
+    caller = make_caller()
+    attempt = Attempts(TimeoutError(), TimeoutError())
+    assert asyncio.run(caller.call("m", attempt)) == "ok"
+    assert attempt.calls == 3
+    assert counter(caller, "llm_retries") == 2
+    assert caller.breaker("m").failures == 0
+
+
+def test_call_gives_up_after_max_attempts():
+    caller = make_caller()
+    attempt = Attempts(TimeoutError(), TimeoutError(), TimeoutError())
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.call("m", attempt))
+    assert attempt.calls == 3
+
+
+def test_call_does_not_retry_other_errors():
+    caller = make_caller()
+    attempt = Attempts(ValueError("invalid request"))
+    with pytest.raises(ValueError):
+        asyncio.run(caller.call("m", attempt))
+    assert attempt.calls == 1
+    assert caller.breaker("m").failures == 0
+
+
+def test_call_times_out_attempts():
+    caller = make_caller(call_timeout=0.01, retry=RetryPolicy(max_attempts=1))
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.call("m", Attempts(delay=1)))
+    assert counter(caller, "llm_call_timeouts") == 1
+
+
+def test_call_rejected_while_circuit_open():
+    caller = make_caller(retry=RetryPolicy(max_attempts=1), breaker_failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.call("m", Attempts(TimeoutError())))
+    attempt = Attempts()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call("m", attempt))
+    assert attempt.calls == 0
+    assert counter(caller, "llm_circuit_opened") == 1
+    assert counter(caller, "llm_circuit_rejections") == 1
+
+
+def test_cancelled_trial_does_not_wedge_circuit():
+    caller = make_caller(retry=RetryPolicy(max_attempts=1), breaker_failure_threshold=1,
+                         breaker_reset_timeout=0)
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.call("m", Attempts(TimeoutError())))
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(caller.call("m", Attempts(delay=1)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert asyncio.run(caller.call("m", Attempts())) == "ok"
+    assert caller.breaker("m").state == CircuitBreaker.CLOSED
+
+
+def test_hedge_waits_for_latency_samples():
+    caller = make_caller(hedge=HedgePolicy(percentile=0.5, min_samples=3))
+    attempt = Attempts(delay=0.02)
+    asyncio.run(caller.call("m", attempt))
+    assert attempt.calls == 1
+    assert counter(caller, "llm_hedged_requests") == 0
+
+
+def test_hedge_sends_duplicate_of_slow_call():
+    caller = make_caller(hedge=HedgePolicy(percentile=0.5, min_samples=3))
+    for _ in range(3):
+        caller.latencies("m").record(0.01)
+    delays = [1.0, 0.0]
+
+    async def attempt():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return "slow" if delay else "hedge"
+
+    assert asyncio.run(caller.call("m", attempt)) == "hedge"
+    assert counter(caller, "llm_hedged_requests") == 1
+    assert counter(caller, "llm_hedge_wins") == 1
+
+
+def test_hedge_not_used_when_disabled_for_call():
+    caller = make_caller(hedge=HedgePolicy(percentile=0.5, min_samples=1))
+    caller.latencies("m").record(0.001)
+    attempt = Attempts(delay=0.02)
+    asyncio.run(caller.call("m", attempt, hedge=False))
+    assert attempt.calls == 1
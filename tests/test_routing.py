@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from otools_autogen.routing import ModelRoute, ModelRouter
+
+from fakes import ANSWERS, FakeLLMClientPool, make_runtime, request, run_request
+
+
+def command_by_model(invalid_on: set[str]):
+    def answer(messages, model):
+        argument = "[1]" if model in invalid_on else json.dumps({"text": model})
+        return {"analysis": "echo", "explanation": "echo", "argument": argument}
+
+    return answer
+
+
+def command_models(llm: FakeLLMClientPool) -> list[str]:
+    return [model for agent, model in llm.calls if agent == "CommandGenerator"]
+
+
+def test_agents_use_routed_models():
+    llm = FakeLLMClientPool()
+    runtime = make_runtime(llm, model_routes={"CommandGenerator": "small", "FinalOutputAgent": "large"})
+    asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert command_models(llm) == ["small"]
+    assert ("FinalOutputAgent", "large") in llm.calls
+    assert ("QueryAnalyzer", "fake") in llm.calls
+
+
+def test_invalid_argument_escalates_to_stronger_model():
+    llm = FakeLLMClientPool({"ToolCommandLLMResponse": command_by_model({"small"})})
+    runtime = make_runtime(llm, model_routes={"CommandGenerator": ModelRoute("small", escalate_to=("large",))})
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert command_models(llm) == ["small", "large"]
+    tool_response = next(response for response in responses if response.type == "ToolResponse")
+    assert json.loads(tool_response.command) == {"text": "large"}
+    counters = runtime.get_metrics()["counters"]
+    assert sum(value for key, value in counters.items() if key.startswith("llm_escalations")) == 1
+
+
+def test_last_model_completion_is_returned_unchecked():
+    llm = FakeLLMClientPool({"ToolCommandLLMResponse": command_by_model({"small", "large"})})
+    runtime = make_runtime(llm, model_routes={"CommandGenerator": ModelRoute("small", escalate_to=("large",))})
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert command_models(llm) == ["small", "large"]
+    assert "Error" in [response.type for response in responses]
+
+
+def route_calls(error: BaseException) -> tuple[list[str], object]:
+    router = ModelRouter({"Agent": ModelRoute("small", escalate_to=("large",))})
+    models = []
+
+    async def run(model: str, can_escalate: bool):
+        models.append(model)
+        if model == "small":
+            raise error
+        return model
+
+    async def call():
+        try:
+            return await router.call("Agent", None, run)
+        except Exception as e:
+            return e
+
+    return models, asyncio.run(call())
+
+
+@pytest.mark.parametrize("error", [
+    json.JSONDecodeError("Expecting value", "", 0),
+    ValidationError.from_exception_data("Plan", [{"type": "missing", "loc": ("tool_name",), "input": {}}]),
+])
+def test_validation_errors_escalate(error):
+    assert route_calls(error) == (["small", "large"], "large")
+
+
+def test_other_errors_do_not_escalate():
+    error = ValueError("bug in the caller")
+    assert route_calls(error) == (["small"], error)
+
+
+def test_missing_parsed_output_escalates():
+    def plan(messages, model):
+        return None if model == "small" else ANSWERS["ActionPredictonLLMResponse"]
+
+    llm = FakeLLMClientPool({"ActionPredictonLLMResponse": plan})
+    runtime = make_runtime(llm, model_routes={"ActionPredictor": ModelRoute("small", escalate_to=("large",))})
+    responses = asyncio.run(run_request(runtime, request(max_steps=1)))
+    assert [model for agent, model in llm.calls if agent == "ActionPredictor"] == ["small", "large"]
+    assert "ToolResponse" in [response.type for response in responses]
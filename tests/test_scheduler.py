@@ -0,0 +1,60 @@
+import asyncio
+
+from otools_autogen.scheduler import LLMScheduler, RateLimit, TokenBucket, _ModelQueue
+
+
+def test_bucket_wait_time():
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+
+
+def test_bucket_caps_amount_at_capacity():
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(1000) == 0
+
+
+def test_refund_restores_request_and_tokens():
+    queue = _ModelQueue(RateLimit(requests_per_minute=10, tokens_per_minute=1000))
+    queue.consume(400)
+    queue.refund(400)
+    assert queue.requests.tokens == 10
+    assert queue.tokens.tokens == 1000
+
+
+def test_unlimited_model_is_not_queued():
+    scheduler = LLMScheduler({"m": RateLimit(requests_per_minute=1)})
+
+    async def run():
+        for _ in range(5):
+            await scheduler.acquire("other", 10)
+
+    asyncio.run(run())
+    assert "llm_queue_depth{model=other}" not in scheduler.metrics.snapshot()["gauges"]
+
+
+def test_admits_by_priority_then_round_robin():
+    scheduler = LLMScheduler({"m": RateLimit(requests_per_minute=6000)})
+    order = []
+
+    async def call(session_id, agent, no):
+        await scheduler.acquire("m", 1, session_id=session_id, agent=agent)
+        order.append((session_id, no))
+
+    async def run():
+        scheduler._queue("m").requests.tokens = 0
+        tasks = [asyncio.ensure_future(call("a", "ActionPredictor", no)) for no in range(3)]
+        tasks += [asyncio.ensure_future(call("b", "ActionPredictor", no)) for no in range(2)]
+        tasks.append(asyncio.ensure_future(call("c", "QueryAnalyzer", 0)))
+        tasks.append(asyncio.ensure_future(call("d", "FinalOutputAgent", 0)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == [("d", 0), ("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2), ("c", 0)]
+    assert scheduler.metrics.snapshot()["counters"]["llm_throttled{model=m}"] == 7
+
+
+def test_share_divides_limits():
+    assert RateLimit(requests_per_minute=60, tokens_per_minute=1000).share(4) == RateLimit(15, 250)
+    assert RateLimit(requests_per_minute=1).share(4) == RateLimit(requests_per_minute=1)
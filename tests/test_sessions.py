@@ -0,0 +1,111 @@
+import asyncio
+
+from otools_autogen.runtime import release_agent_instances
+
+from fakes import collect, make_runtime, request
+
+
+def test_session_runs_to_final_output():
+    runtime = make_runtime()
+
+    async def run():
+        await runtime.start()
+        session_id = await runtime.send_message(request(max_steps=2))
+        responses = await collect(runtime, session_id)
+        await runtime.stop(True)
+        return responses
+
+    responses = asyncio.run(run())
+    assert [response.type for response in responses][-1] == "FinalOutput"
+    assert responses[-1].message == "hello world"
+
+
+def test_close_session_releases_agent_instances():
+    runtime = make_runtime()
+
+    async def run():
+        await runtime.start()
+        session_id = await runtime.send_message(request(max_steps=1))
+        await collect(runtime, session_id)
+        instances = [agent_id for agent_id in runtime.runtime._instantiated_agents if agent_id.key == session_id]
+        assert {"OrchestratorAgent", "QueryAnalyzer", "FinalOutputAgent"} <= {agent_id.type for agent_id in instances}
+        assert runtime.close_session(session_id)
+        assert not [agent_id for agent_id in runtime.runtime._instantiated_agents if agent_id.key == session_id]
+        assert session_id not in runtime._sessions
+        await runtime.stop(True)
+
+    asyncio.run(run())
+
+
+def test_release_agent_instances_without_private_registry():
+    assert release_agent_instances(object(), "session") == 0
+    assert release_agent_instances(None, "session") == 0
+
+
+def test_idle_sessions_are_evicted():
+    runtime = make_runtime(session_idle_ttl=0)
+
+    async def run():
+        await runtime.start()
+        session_id = await runtime.send_message(request(max_steps=1))
+        responses = await collect(runtime, session_id)
+        assert runtime.evict_sessions() == 1
+        await runtime.stop(True)
+        return responses
+
+    asyncio.run(run())
+    assert runtime.get_metrics()["counters"]["sessions_evicted{reason=idle}"] == 1
+
+
+def test_capacity_eviction_spares_queued_requests():
+    runtime = make_runtime(max_sessions=1)
+
+    async def run():
+        await runtime.start()
+        # Pause message processing, so the first request stays queued for the Orchestrator.
+        await runtime.runtime.stop()
+        first = await runtime.send_message(request(max_steps=1))
+        assert runtime.get_session(first).pending_requests == 1
+        second = await runtime.send_message(request(max_steps=1))
+        assert set(runtime._sessions) == {first, second}
+        runtime.runtime.start()
+        responses = [await collect(runtime, first), await collect(runtime, second)]
+        assert runtime.get_session(first).pending_requests == 0
+        await runtime.stop(True)
+        return responses
+
+    responses = asyncio.run(run())
+    assert [session[-1].type for session in responses] == ["FinalOutput", "FinalOutput"]
+
+
+def test_capacity_eviction_of_idle_session():
+    runtime = make_runtime(max_sessions=1)
+
+    async def run():
+        await runtime.start()
+        first = await runtime.send_message(request(max_steps=1))
+        await collect(runtime, first)
+        second = await runtime.send_message(request(max_steps=1))
+        await collect(runtime, second)
+        assert set(runtime._sessions) == {second}
+        await runtime.stop(True)
+
+    asyncio.run(run())
+
+
+def test_request_of_closed_session_is_dropped():
+    runtime = make_runtime()
+
+    async def run():
+        await runtime.start()
+        await runtime.runtime.stop()
+        session_id = await runtime.send_message(request(max_steps=1))
+        session = runtime.get_session(session_id)
+        runtime.close_session(session_id)
+        runtime.runtime.start()
+        await runtime.stop(True)
+        return session
+
+    session = asyncio.run(run())
+    assert session.to_client_queue.qsize() == 1
+    assert runtime.get_metrics()["counters"]["requests_dropped{reason=session_closed}"] == 1
@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+import pytest
+
+from otools_autogen.sharding import ShardedRuntime, shard_for
+
+from fakes import EchoTool, collect, request, start_openai_stub
+
+
+def test_shard_for_is_stable_and_spreads_sessions():
+    assert shard_for("session", 4) == shard_for("session", 4)
+    shards = [shard_for(f"session-{no}", 4) for no in range(200)]
+    assert set(shards) == {0, 1, 2, 3}
+    assert min(shards.count(index) for index in range(4)) > 20
+
+
+def session_on(index: int, workers: int = 2, prefix: str = "session") -> str:
+    return next(f"{prefix}-{no}" for no in range(1000) if shard_for(f"{prefix}-{no}", workers) == index)
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    stub = start_openai_stub()
+    monkeypatch.setenv("OPENROUTER_API_KEY", "stub")
+    monkeypatch.setenv("OPENROUTER_BASE_PATH", f"http://127.0.0.1:{stub.server_address[1]}/v1")
+    runtime = ShardedRuntime(workers=2, runtime_options={"default_model": "stub"},
+                             health_check_interval=3600, request_timeout=30)
+    runtime.register_tool("EchoTool", EchoTool)
+    yield runtime
+    stub.shutdown()
+    stub.server_close()
+
+
+async def run_session(runtime: ShardedRuntime, session_id: str) -> list:
+    await runtime.send_message(request(max_steps=1), session_id)
+    return [response async for response in runtime.stream(session_id)]
+
+
+def test_sessions_run_on_their_workers(sharded):
+    async def run():
+        await sharded.start()
+        try:
+            return await asyncio.gather(*(run_session(sharded, session_on(index)) for index in (0, 1, 0)))
+        finally:
+            await sharded.stop()
+
+    sessions = asyncio.run(asyncio.wait_for(run(), 120))
+    assert [responses[-1].type for responses in sessions] == ["FinalOutput"] * 3
+    assert sessions[0][-1].message == "hello world"
+    counters = sharded.metrics.snapshot()["counters"]
+    assert counters["shard_requests{worker=0}"] == 2
+    assert counters["shard_requests{worker=1}"] == 1
+
+
+def test_restart_fails_pending_commands_and_closes_sessions(sharded):
+    async def run():
+        await sharded.start()
+        try:
+            lost = session_on(0)
+            sharded._queue_for(lost)
+            stream = asyncio.ensure_future(collect(sharded, lost))
+            old_pid = sharded._workers[0].process.pid
+            ping = asyncio.ensure_future(sharded._request(0, "ping"))
+            await asyncio.sleep(0)
+            await sharded._restart(0)
+            with pytest.raises(RuntimeError, match="Worker 0 restarted"):
+                await asyncio.wait_for(ping, 5)
+            closed = await asyncio.wait_for(stream, 5)
+            assert sharded._workers[0].process.pid != old_pid
+            responses = await run_session(sharded, session_on(0, prefix="after"))
+            return closed, responses
+        finally:
+            await sharded.stop()
+
+    closed, responses = asyncio.run(asyncio.wait_for(run(), 120))
+    assert [response.type for response in closed] == ["SessionClosed"]
+    assert responses[-1].type == "FinalOutput"
+
+
+def test_health_check_survives_failed_restart(sharded, monkeypatch):
+    sharded.health_check_interval = 0.05
+    restart = ShardedRuntime._restart
+    attempts = []
+
+    async def flaky_restart(self, index):
+        attempts.append(index)
+        if len(attempts) == 1:
+            raise OSError("spawn failed")
+        await restart(self, index)
+
+    monkeypatch.setattr(ShardedRuntime, "_restart", flaky_restart)
+
+    async def run():
+        await sharded.start()
+        try:
+            sharded._workers[1].process.kill()
+            while len(attempts) < 2:
+                await asyncio.sleep(0.05)
+            assert not sharded._health_task.done()
+            return await run_session(sharded, session_on(1))
+        finally:
+            await sharded.stop()
+
+    responses = asyncio.run(asyncio.wait_for(run(), 120))
+    assert responses[-1].type == "FinalOutput"
+    assert sharded.metrics.snapshot()["counters"]["shard_worker_restart_failures{worker=1}"] == 1
@@ -0,0 +1,23 @@
+from dataclasses import replace
+
+from otools_autogen.tools import CompiledToolCard, ToolRegistry
+
+from fakes import EchoTool, echo_card
+
+
+def test_compiled_card_is_isolated_from_registered_card():
+    card = replace(echo_card, user_metadata={"limits": {"rate": 1}},
+                   demo_input=[EchoTool.EchoToolInput(text="hello")])
+    compiled = CompiledToolCard.compile(card)
+    registry = ToolRegistry.build({"EchoTool": compiled})
+    prompt = registry.prompt
+
+    card.user_metadata["limits"]["rate"] = 2
+    card.demo_input[0].text = "changed"
+    card.demo_input.append(EchoTool.EchoToolInput(text="extra"))
+
+    snapshot = registry.tool_cards["EchoTool"]
+    assert snapshot.user_metadata == {"limits": {"rate": 1}}
+    assert [demo.text for demo in snapshot.demo_input] == ["hello"]
+    assert compiled.metadata["user_metadata"] == {"limits": {"rate": 1}}
+    assert registry.prompt == prompt
@@ -0,0 +1,34 @@
+import pytest
+
+from otools_autogen.usage import ModelPricing, UsageTracker, merge_usage_stats
+
+
+def test_cost_of_cached_prompt_tokens():
+    pricing = ModelPricing(prompt=1.0, completion=2.0, cached_prompt=0.5)
+    assert pricing.cost(1_000_000, 1_000_000, cached_prompt_tokens=500_000) == pytest.approx(2.75)
+
+
+def test_request_usage_by_step_and_agent():
+    tracker = UsageTracker({"m": ModelPricing(prompt=1.0, completion=2.0)})
+    tracker.start_request("s")
+    tracker.record("s", "QueryAnalyzer", "m", 100, 10)
+    tracker.begin_step("s", 1)
+    tracker.record("s", "ActionPredictor", "m", 200, 20)
+    usage = tracker.request_usage("s")
+    assert usage["total"]["total_tokens"] == 330
+    assert usage["steps"][0]["requests"] == 1
+    assert usage["steps"][1]["prompt_tokens"] == 200
+    assert usage["agents"]["ActionPredictor"]["cost"] == pytest.approx(240 / 1_000_000)
+
+
+def test_merge_usage_stats():
+    first, second = UsageTracker(), UsageTracker()
+    first.record("a", "QueryAnalyzer", "m", 100, 10)
+    second.record("b", "QueryAnalyzer", "m", 50, 5)
+    second.record("b", "GeneralistTool", "n", 20, 2)
+    merged = merge_usage_stats([first.stats(), second.stats()])
+    assert merged["total"]["requests"] == 3
+    assert merged["total"]["total_tokens"] == 187
+    assert merged["agents"]["QueryAnalyzer"]["prompt_tokens"] == 150
+    assert set(merged["models"]) == {"m", "n"}
+    assert set(merged["sessions"]) == {"a", "b"}
@@ -1,7 +1,5 @@
 from pydantic import BaseModel, Field
-from otools_autogen.tools import Tool, ToolCard
-import json
-import urllib.request
+from otools_autogen.tools import AsyncHTTPTool, ToolCard
 from typing import Optional, Dict
 
 
@@ -16,7 +14,7 @@ class APICallerToolRequest(BaseModel):
 class APICallerToolResponse(BaseModel):
     success: bool = Field(None, description="If the API call was successful")
     response: Optional[str] = Field(None, description="Response from the API call")
-    error: str = Field(None, description="Error message if the API call failed")
+    error: Optional[str] = Field(None, description="Error message if the API call failed")
  
 
 tool_card = ToolCard(
@@ -45,7 +43,7 @@ tool_card = ToolCard(
 
    
     
-class APICallerTool(Tool):
+class APICallerTool(AsyncHTTPTool):
     @property
     def card(self) -> ToolCard:
         return tool_card
@@ -56,26 +54,23 @@ class APICallerTool(Tool):
         headers = inputs.headers if inputs.headers else {}
         params = inputs.params if inputs.params else {}
         method = inputs.method.upper()
-        
-        if method == "GET":
-            request = urllib.request.Request(url, headers=headers, method=method)
-            if params:
-                url += "?" + urllib.parse.urlencode(params)
-        else:
-            json_data = json.dumps(inputs.body).encode("utf-8")
-            request = urllib.request.Request(url, data=json_data, headers=headers, method=method)
+        body = None if method == "GET" else inputs.body
         
         try:
-            with urllib.request.urlopen(request) as response:
-                response_body = response.read().decode("utf-8")
+            response = await self.request(method, url, params=params, headers=headers, json=body)
+            if not response.ok:
                 return APICallerToolResponse.model_validate({
-                    "success": True,
-                    "response": response_body,
-                    "error": None
+                    "success": False,
+                    "response": response.text(),
+                    "error": f"HTTP Error {response.status_code}: {response.reason}"
                 })
+            return APICallerToolResponse.model_validate({
+                "success": True,
+                "response": response.text(),
+                "error": None
+            })
         except Exception as e:
             return APICallerToolResponse.model_validate({
                 "success": False,
                 "error": str(e)
             })
-            
\ No newline at end of file
@@ -1,7 +1,5 @@
 from pydantic import BaseModel, Field
 from otools_autogen.tools import Tool, ToolCard
-from openai import AsyncOpenAI
-import os
 import logging
 
 llm_logger = logging.getLogger("otools_autogen_llm")
@@ -41,7 +39,6 @@ class CriticTool(Tool):
         return tool_card
     
     async def run(self, inputs: None) -> None:
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
         persona_prompt  = f"Act as a Critic of infomation you receive. Be demanding and strict, but not excessively."
         prompt = f"Validate the following information set in terms of comprehensiveness, correctness and relevance. Provide feedback about the information set. "
         prompt += f"Information set: {inputs.information_set}"
@@ -50,9 +47,9 @@ class CriticTool(Tool):
             {"role": "developer","content": [{"type": "text", "text": persona_prompt}]},
             {"role": "user","content": [{"type": "text", "text": prompt}]}
             ]
-        completion = await client.chat.completions.create(
-            model=os.getenv("OTOOLS_MODEL"),
-            messages=input)
+        completion = await self.llm.complete(
+            messages=input,
+            agent="CriticTool")
         llm_response = completion.choices[0].message.content
         
         llm_logger.debug(f"[CriticTool] LLM response: {llm_response}")
@@ -16,33 +16,7 @@ class DietPlanningTool(Tool):
                 diet_plan: str
             @property
             def card(self) -> ToolCard:
-                return ToolCard(
-                    tool_id="DietComposerTool",
-                    name="Diet composer tool",
-                    description="Tool for composing a diet. It is able to generate a diet based on the user's preferences.",
-                    inputs=DietPlanningTool.DietPlanningToolInput,
-                    outputs=DietPlanningTool.DietPlanningToolOutput,
-                    user_metadata={},
-                    demo_input=[DietPlanningTool.DietPlanningToolInput(
-                            age=30,
-                            weight=70.5,
-                            gender="male",
-                            height=175.0,
-                            activity_level="moderate",
-                            health_condition="good",
-                            deaseases="none"
-                        ), DietPlanningTool.DietPlanningToolInput(
-                           age=50,  
-                            weight=121.5,
-                            gender="male",
-                            height=203.0,
-                            activity_level="low",
-                            health_condition="moderate",
-                            deaseases="diabetes"
-                        )]
-                                
-                        
-                )
+                return tool_card
 
             async def run(self, inputs: DietPlanningToolInput) -> BaseModel:
                 print(f"Running MyTool with input: {inputs}")
@@ -83,4 +57,33 @@ class DietPlanningTool(Tool):
                 Snack: 1/4 cup of almonds
                 Dinner: 4 oz of grilled salmon with 1 cup of quinoa and 1 cup of steamed broccoli
                 """
-                return DietPlanningTool.DietPlanningToolOutput(diet_plan=diet_plan_for_diabetic)
\ No newline at end of file
+                return DietPlanningTool.DietPlanningToolOutput(diet_plan=diet_plan_for_diabetic)
+
+
+tool_card = ToolCard(
+        tool_id="DietComposerTool",
+        name="Diet composer tool",
+        description="Tool for composing a diet. It is able to generate a diet based on the user's preferences.",
+        inputs=DietPlanningTool.DietPlanningToolInput,
+        outputs=DietPlanningTool.DietPlanningToolOutput,
+        user_metadata={},
+        demo_input=[DietPlanningTool.DietPlanningToolInput(
+                age=30,
+                weight=70.5,
+                gender="male",
+                height=175.0,
+                activity_level="moderate",
+                health_condition="good",
+                deaseases="none"
+            ), DietPlanningTool.DietPlanningToolInput(
+               age=50,  
+                weight=121.5,
+                gender="male",
+                height=203.0,
+                activity_level="low",
+                health_condition="moderate",
+                deaseases="diabetes"
+            )]
+                    
+            
+    )
@@ -1,7 +1,5 @@
 from pydantic import BaseModel, Field
 from otools_autogen.tools import Tool, ToolCard
-from openai import AsyncOpenAI
-import os
 import logging
 
 llm_logger = logging.getLogger("otools_autogen_llm")
@@ -46,15 +44,14 @@ class GeneralistTool(Tool):
         return tool_card
     
     async def run(self, inputs: None) -> None:
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
         persona_prompt  = f"Act as a {inputs.persona_type}."
         input=[
             {"role": "developer","content": [{"type": "text", "text": persona_prompt}]},
             {"role": "user","content": [{"type": "text", "text": inputs.prompt}]}
             ]
-        completion = await client.chat.completions.create(
-            model=os.getenv("OTOOLS_MODEL"),
-            messages=input)
+        completion = await self.llm.complete(
+            messages=input,
+            agent="GeneralistTool")
         llm_response = completion.choices[0].message.content
         
         llm_logger.debug(f"[GeneralistTool] LLM response: {llm_response}")
@@ -1,10 +1,10 @@
 from pydantic import BaseModel, Field
-from otools_autogen.tools import Tool, ToolCard
-import json
-import requests
+from otools_autogen.cache import CachePolicy
+from otools_autogen.tools import AsyncHTTPTool, ToolCard
    
 from datetime import datetime, timedelta
 from typing import Optional
+import os
 
 
 class NewsAPIToollRequest(BaseModel):
@@ -21,7 +21,7 @@ class NewsAPIToolItem(BaseModel):
     
 class NewsAPIToolResponse(BaseModel):
     success: bool
-    search_results: dict[str, list[NewsAPIToolItem]]= Field(None, description="news feed items")
+    search_results: Optional[dict[str, list[NewsAPIToolItem]]]= Field(None, description="news feed items")
     
         
 tool_card=  ToolCard(
@@ -30,6 +30,7 @@ tool_card=  ToolCard(
                 description="Tool for fetch available News such as World, Sports, and Science",
                 inputs=NewsAPIToollRequest,
                 outputs=NewsAPIToolResponse,
+                cache_policy=CachePolicy(ttl=600.0),
                 user_metadata={
                     "limitations": "This tool can use topics as follows: general , science , sports , business , health , entertainment , tech , politics , food , travel"},
                 demo_input=[NewsAPIToollRequest(
@@ -39,7 +40,19 @@ tool_card=  ToolCard(
                 )])
 
 
-class NewsAPITool(Tool):
+class NewsAPITool(AsyncHTTPTool):
+    """
+    Fetches news from thenewsapi.com. The API token is read from `THENEWSAPI_API_TOKEN`
+    unless passed to the constructor.
+    """
+    base_url = "https://api.thenewsapi.com"
+    api_token: Optional[str] = None
+
+    def __init__(self, base_url: Optional[str] = None, api_token: Optional[str] = None):
+        super().__init__(base_url)
+        if api_token is not None:
+            self.api_token = api_token
+
     @property
     def card(self) -> ToolCard:
         return tool_card
@@ -50,10 +63,14 @@ class NewsAPITool(Tool):
     
     
     async def run(self, inputs: NewsAPIToollRequest) -> NewsAPIToolResponse:
-        
-        url = 'https://api.thenewsapi.com/v1/news/all'
+        api_token = self.api_token or os.getenv("THENEWSAPI_API_TOKEN")
+        if not api_token:
+            return NewsAPIToolResponse.model_validate({
+                "success": False,
+                "search_results": None
+            })
         params = {
-            'api_token': 'NDdryV3JDzyb19TncCVWIgHbUUNHPEQ0zqDugEKF',
+            'api_token': api_token,
             'categories': ','.join(inputs.sections),
             'limit': inputs.max_results,
             'language': 'en',
@@ -63,9 +80,12 @@ class NewsAPITool(Tool):
         if inputs.search_term:
             params['search'] = inputs.search_term            
 
-        response = requests.get(url, params=params)
-
-
+        response = await self.request("GET", "/v1/news/all", params=params)
+        if not response.ok or response.truncated:
+            return NewsAPIToolResponse.model_validate({
+                "success": False,
+                "search_results": None
+            })
         data = response.json()
 
         items = data.get('data', [])
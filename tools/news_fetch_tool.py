@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
-from otools_autogen.tools import Tool, ToolCard
-import json
-import urllib.request
+from typing import Optional
+from otools_autogen.cache import CachePolicy
+from otools_autogen.tools import AsyncHTTPTool, ToolCard
 
 
 class NewsFetchToolRequest(BaseModel):
@@ -16,7 +16,7 @@ class NewsFeedItem(BaseModel):
     
 class NewsFetchToolResponse(BaseModel):
     success: bool
-    search_results: dict[str, list[NewsFeedItem]]= Field(None, description="news feed items")
+    search_results: Optional[dict[str, list[NewsFeedItem]]]= Field(None, description="news feed items")
     
         
 tool_card=  ToolCard(
@@ -25,6 +25,7 @@ tool_card=  ToolCard(
                 description="Fetch available Google News section names, such as World, Sports, and Science",
                 inputs=NewsFetchToolRequest,
                 outputs=NewsFetchToolResponse,
+                cache_policy=CachePolicy(ttl=600.0),
                 user_metadata={},
                 demo_input=[NewsFetchToolRequest(
                     sections= ['World']
@@ -33,14 +34,15 @@ tool_card=  ToolCard(
                 )])
 
 
-class NewsFetchTool(Tool):
+class NewsFetchTool(AsyncHTTPTool):
+    base_url = "https://ok.surf"
+
     @property
     def card(self) -> ToolCard:
         return tool_card
     
     
     async def run(self, inputs: NewsFetchToolRequest) -> NewsFetchToolResponse:
-        url = "https://ok.surf/api/v1/news-section"
         headers = {
             "accept": "application/json",
             "Content-Type": "application/json"
@@ -48,16 +50,18 @@ class NewsFetchTool(Tool):
         data = {
             "sections": inputs.sections
         }
-        json_data = json.dumps(data).encode("utf-8")
-        request = urllib.request.Request(url, data=json_data, headers=headers, method="POST")
-        with urllib.request.urlopen(request) as response:
-            response_body = response.read().decode("utf-8")
-            response_dict = json.loads(response_body)
-            r = {
-                "success": True,
-                "search_results": response_dict
-            }
-            return NewsFetchToolResponse.model_validate(r)
+        response = await self.request("POST", "/api/v1/news-section", json=data, headers=headers)
+        if not response.ok or response.truncated:
+            return NewsFetchToolResponse.model_validate({
+                "success": False,
+                "search_results": None
+            })
+        response_dict = response.json()
+        r = {
+            "success": True,
+            "search_results": response_dict
+        }
+        return NewsFetchToolResponse.model_validate(r)
     
     
 if __name__ == "__main__":
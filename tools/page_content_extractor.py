@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
+from otools_autogen.cache import CachePolicy
 from otools_autogen.tools import Tool, ToolCard
 import trafilatura
-from openai import AsyncOpenAI
 import os
 import logging
 
@@ -22,6 +22,7 @@ tool_card= ToolCard(
                 name="Page Content Extraction",
                 inputs=PageContentExtractionRequest,
                 outputs=PageContentExtractionResult,
+                cache_policy=CachePolicy(ttl=3600.0),
                 user_metadata={
                   "recommendation of usage of main_query": "The main query should be a single line and should be used to summarize the content of the page. If you don't want to use specific query, use main query provided by user.",  
                 },
@@ -37,14 +38,13 @@ class PageContentExtractionTool(Tool):
     
     
     async def run(self, inputs: PageContentExtractionRequest) -> PageContentExtractionResult:
-        import trafilatura
-        downloaded = trafilatura.fetch_url(inputs.link)
+        downloaded = await self.executor.run(trafilatura.fetch_url, inputs.link)
         if downloaded is None:
             return PageContentExtractionResult.model_validate({
                 "success": False,
                 "markdown_content": None
             })
-        r = trafilatura.extract(downloaded,output_format="markdown")
+        r = await self.executor.run(trafilatura.extract, downloaded, output_format="markdown")
         if r is None:
             return PageContentExtractionResult.model_validate({
                 "success": False,
@@ -54,11 +54,11 @@ class PageContentExtractionTool(Tool):
         prompt = f"""Summarize the content of the page in markdown format. Use the main query provided to summarize the content. The main query is: {inputs.main_query}. 
 The content of the page is: {r}"""
         llm_logger.debug(f"[PageContentExtractionTool] LLM prompt: {prompt}")
-        client = AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_PATH"))
         input=[{"role": "user","content": [{"type": "text", "text": prompt}]}]
-        completion = await client.chat.completions.create(
+        completion = await self.llm.complete(
             model=os.getenv("PAGE_CONTENT_EXTRACTOR_SUMMARIZATION_MODEL"),
-            messages=input)
+            messages=input,
+            agent="PageContentExtractionTool")
         llm_response = completion.choices[0].message.content
         llm_logger.debug(f"[PageContentExtractionTool] LLM response: {llm_response}")
         return PageContentExtractionResult.model_validate({
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from otools_autogen.cache import CachePolicy
 from otools_autogen.tools import Tool, ToolCard
 import json
 from duckduckgo_search import DDGS
@@ -24,6 +25,7 @@ tool_card= ToolCard(
                 name="Search Engine",
                 inputs=SearchEngineRequest,
                 outputs=SearchEngingResponse,
+                cache_policy=CachePolicy(ttl=3600.0),
                 user_metadata={
                     "Comments": "Each result should be checked by fetching the page content and extracting the relevant information. This tool is not responsible for the accuracy of the search results.",
                     },
@@ -34,12 +36,14 @@ tool_card= ToolCard(
                 ])
 
 class SearchEngineTool(Tool):
+    blocking = True
+
     @property
     def card(self) -> ToolCard:
         return tool_card
     
     
-    async def run(self, inputs: SearchEngineRequest) -> SearchEngingResponse:
+    def run(self, inputs: SearchEngineRequest) -> SearchEngingResponse:
         results = DDGS(verify=False).text(inputs.query, max_results=inputs.max_results)
         items= [
             SerchResultItem(
@@ -56,11 +60,8 @@ class SearchEngineTool(Tool):
         
         
 if __name__ == "__main__":
-    async def m():
-        m = SearchEngineTool()
-        r= await m.run(SearchEngineRequest(query="Python programming language"))
-        print(r)
-    import asyncio
-    asyncio.run(m())
+    m = SearchEngineTool()
+    r= m.run(SearchEngineRequest(query="Python programming language"))
+    print(r)
     
     
\ No newline at end of file
@@ -1,3 +1,4 @@
+from otools_autogen.cache import CachePolicy
 from otools_autogen.tools import Tool, ToolCard
 from pydantic import BaseModel
 import wikipedia
@@ -13,15 +14,13 @@ class WikipediaSearchResponse(BaseModel):
     search_results: str
     
 
-class WikipediaSearch(Tool):
-        @property
-        def card(self) -> ToolCard:
-            return ToolCard(
+tool_card = ToolCard(
                 tool_id="WikipediaSearchTool",
                 name="Wikipedia search tool",
                 description="Tool for searching wikipedia.",
                 inputs=WikipediaSearchRequest,
                 outputs=WikipediaSearchResponse,
+                cache_policy=CachePolicy(ttl=86400.0),
                 user_metadata={},
                 demo_input=[WikipediaSearchRequest(
                     query="Python"
@@ -32,7 +31,15 @@ class WikipediaSearch(Tool):
                     
             )
 
-        async def run(self, inputs: WikipediaSearchRequest) -> WikipediaSearchResponse:
+
+class WikipediaSearch(Tool):
+        blocking = True
+
+        @property
+        def card(self) -> ToolCard:
+            return tool_card
+
+        def run(self, inputs: WikipediaSearchRequest) -> WikipediaSearchResponse:
             search_results = wikipedia.search(inputs.query)
             if not search_results:
                 return WikipediaSearchResponse(success=False, search_results=None)